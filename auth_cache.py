@@ -0,0 +1,83 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_FILE = 'auth_cache.json'
+# Seconds a successful authentication test is trusted ([Session] auth_ttl)
+DEFAULT_AUTH_TTL = 6 * 3600
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class AuthCache:
+    """Remembers which cookies files recently passed the authentication test.
+
+    An entry holds the digest of the cookies file and when it was validated.
+    While it is younger than ttl and the file is unchanged, initialize_client
+    skips the test search, which would otherwise cost a request of the
+    SearchTimeline quota on every start. A new login writes a new file, so
+    its digest no longer matches. ttl 0 disables the cache.
+    """
+
+    def __init__(self, path=AUTH_CACHE_FILE, ttl=DEFAULT_AUTH_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config=None):
+        if config is None:
+            return cls()
+        return cls(
+            path=config.get('Session', 'auth_cache_file', fallback=AUTH_CACHE_FILE) or AUTH_CACHE_FILE,
+            ttl=config.getfloat('Session', 'auth_ttl', fallback=DEFAULT_AUTH_TTL),
+        )
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write(self, entries):
+        # Write then rename, so concurrent workers never read a partial file
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def is_valid(self, cookies_file):
+        """True if cookies_file passed the test less than ttl seconds ago and is unchanged"""
+        if self.ttl <= 0 or not os.path.exists(cookies_file):
+            return False
+        entry = self.load().get(os.path.abspath(cookies_file))
+        if entry is None or time.time() - entry['validated_at'] > self.ttl:
+            return False
+        return entry['digest'] == file_digest(cookies_file)
+
+    def mark_valid(self, cookies_file):
+        if self.ttl <= 0 or not os.path.exists(cookies_file):
+            return
+        with self.lock:
+            entries = self.load()
+            entries[os.path.abspath(cookies_file)] = {
+                'digest': file_digest(cookies_file),
+                'validated_at': time.time(),
+            }
+            self.write(entries)
+
+    def invalidate(self, cookies_file):
+        with self.lock:
+            entries = self.load()
+            if entries.pop(os.path.abspath(cookies_file), None) is not None:
+                self.write(entries)
+                logger.info(f"Forgot cached authentication of {cookies_file}")
@@ -0,0 +1,230 @@
+"""Incremental, compressed backups of a scraper's storage log.
+
+Each backup writes only the records appended since the previous one, as a
+compressed JSONL segment in backups/<output file>/. Segment names carry the
+range of backups they cover and the storage position they end at:
+
+    000001-000001-52431.jsonl.gz     first backup, log position 52431
+    000002-000002-60218.jsonl.gz     records after 52431
+    000001-000012-98310.jsonl.gz     segments 1..12 compacted into one
+
+When more than max_segments segments exist they are compacted into one
+(compressed streams are simply concatenated), so the directory holds at most
+max_segments files and about one compressed copy of the data.
+
+    python backup.py list buildinpublicbest.json
+    python backup.py restore buildinpublicbest.json --output restored.json
+    python backup.py prune-legacy buildinpublicbest.json
+"""
+import argparse
+import glob
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from collections import namedtuple
+from configparser import ConfigParser
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from storage import export_json
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when config.ini has no [Backup] section
+DEFAULT_DIRECTORY = 'backups'
+DEFAULT_COMPRESSION = 'gzip'
+DEFAULT_LEVEL = 6
+DEFAULT_MAX_SEGMENTS = 20
+DEFAULT_INTERVAL = 600
+
+EXTENSIONS = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst', 'none': '.jsonl'}
+SEGMENT_NAME = re.compile(r'^(\d{6})-(\d{6})-(\d+)(\.jsonl(?:\.gz|\.zst)?)$')
+
+Segment = namedtuple('Segment', 'first last position path')
+
+
+def open_segment(path, mode, level=DEFAULT_LEVEL):
+    """Open a segment file for binary reading or writing by its extension"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=level) if 'w' in mode else gzip.open(path, mode)
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("zstd backups require zstandard: pip install zstandard")
+        if 'w' in mode:
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=level))
+        # Compacted segments hold several frames. The zstd reader cannot
+        # iterate lines, so it is wrapped in a buffered reader
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    return open(path, mode)
+
+
+class BackupManager:
+    """Writes and restores incremental backup segments for one output file"""
+
+    def __init__(self, output_file, directory=DEFAULT_DIRECTORY, compression=DEFAULT_COMPRESSION,
+                 level=DEFAULT_LEVEL, max_segments=DEFAULT_MAX_SEGMENTS, interval=DEFAULT_INTERVAL):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown backup compression '{compression}' (expected gzip, zstd or none)")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd backups require zstandard: pip install zstandard")
+        self.output_file = output_file
+        self.directory = os.path.join(directory, os.path.basename(output_file))
+        self.compression = compression
+        self.level = level
+        self.max_segments = max(2, max_segments)
+        self.interval = interval
+        self.last_backup = time.time()
+
+    @classmethod
+    def from_config(cls, output_file, config=None):
+        """Backup manager configured by the [Backup] section of config.ini"""
+        if config is None:
+            return cls(output_file)
+        return cls(
+            output_file,
+            directory=config.get('Backup', 'directory', fallback=DEFAULT_DIRECTORY) or DEFAULT_DIRECTORY,
+            compression=config.get('Backup', 'compression', fallback=DEFAULT_COMPRESSION).strip().lower(),
+            level=config.getint('Backup', 'level', fallback=DEFAULT_LEVEL),
+            max_segments=config.getint('Backup', 'max_segments', fallback=DEFAULT_MAX_SEGMENTS),
+            interval=config.getfloat('Backup', 'interval', fallback=DEFAULT_INTERVAL),
+        )
+
+    def segments(self):
+        """The segments forming the backup chain, oldest first.
+
+        Segments whose range is covered by a compacted segment (left behind if
+        compaction was interrupted) are skipped.
+        """
+        found = []
+        for path in glob.glob(os.path.join(self.directory, '*.jsonl*')):
+            match = SEGMENT_NAME.match(os.path.basename(path))
+            if match:
+                found.append(Segment(int(match.group(1)), int(match.group(2)), int(match.group(3)), path))
+        found.sort(key=lambda segment: (segment.first, -segment.last))
+
+        chain = []
+        for segment in found:
+            if chain and segment.last <= chain[-1].last:
+                continue
+            chain.append(segment)
+        return chain
+
+    def segment_path(self, first, last, position):
+        return os.path.join(self.directory, f"{first:06d}-{last:06d}-{position}{EXTENSIONS[self.compression]}")
+
+    def backup(self, storage):
+        """Write the records appended to storage since the last backup. Returns how many"""
+        os.makedirs(self.directory, exist_ok=True)
+        chain = self.segments()
+        number = chain[-1].last + 1 if chain else 1
+        start = chain[-1].position if chain else 0
+        tmp_path = os.path.join(self.directory, f'.pending-{number:06d}{EXTENSIONS[self.compression]}')
+
+        count = 0
+        position = start
+        with open_segment(tmp_path, 'wb', self.level) as f:
+            for position, record in storage.records_after(start):
+                f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+                count += 1
+        self.last_backup = time.time()
+
+        if not count:
+            os.remove(tmp_path)
+            return 0
+
+        path = self.segment_path(number, number, position)
+        METRICS.inc('bytes_written_total', os.path.getsize(tmp_path), target='backup')
+        os.replace(tmp_path, path)
+        logger.info(f"Backed up {count} new records to {path}")
+
+        if len(chain) + 1 > self.max_segments:
+            self.compact()
+        return count
+
+    def maybe_backup(self, storage):
+        """Back up if interval seconds have passed since the last backup"""
+        if self.interval and time.time() - self.last_backup >= self.interval:
+            return self.backup(storage)
+        return 0
+
+    def compact(self):
+        """Merge every segment into one by concatenating their compressed streams"""
+        chain = self.segments()
+        if len(chain) < 2:
+            return
+        if any(not segment.path.endswith(EXTENSIONS[self.compression]) for segment in chain):
+            logger.warning(f"Not compacting {self.directory}: segments use different compressions")
+            return
+        path = self.segment_path(chain[0].first, chain[-1].last, chain[-1].position)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            for segment in chain:
+                with open(segment.path, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp_path, path)
+        # The merged segment covers these now; restore ignores them even if
+        # removal is interrupted
+        for segment in chain:
+            if segment.path != path:
+                os.remove(segment.path)
+        logger.info(f"Compacted {len(chain)} backup segments into {path}")
+
+    def restore(self):
+        """Yield every backed-up record in order"""
+        for segment in self.segments():
+            with open_segment(segment.path, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+
+    def prune_legacy(self):
+        """Delete full-copy backup_<timestamp>_<output> files left by older versions"""
+        output_dir, output_name = os.path.split(self.output_file)
+        removed = 0
+        for path in glob.glob(os.path.join(output_dir, f'backup_*_{glob.escape(output_name)}')):
+            os.remove(path)
+            removed += 1
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and restore incremental backups")
+    parser.add_argument('command', choices=('list', 'restore', 'compact', 'prune-legacy'))
+    parser.add_argument('output_file', help="output file the backups belong to, e.g. buildinpublicbest.json")
+    parser.add_argument('--output', help="restore: file to write (default: <output_file>.restored.json)")
+    parser.add_argument('--indent', type=int, default=2, help="restore: JSON indent")
+    args = parser.parse_args()
+
+    config = ConfigParser()
+    config.read('config.ini')
+    manager = BackupManager.from_config(args.output_file, config)
+
+    if args.command == 'list':
+        for segment in manager.segments():
+            print(f"{segment.path}  backups {segment.first}-{segment.last}  "
+                  f"{os.path.getsize(segment.path)} bytes")
+    elif args.command == 'restore':
+        output = args.output or os.path.splitext(args.output_file)[0] + '.restored.json'
+        count = export_json(manager.restore(), output, indent=args.indent)
+        print(f"Restored {count} records to {output}")
+    elif args.command == 'compact':
+        manager.compact()
+    else:
+        print(f"Removed {manager.prune_legacy()} full-copy backups of {args.output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    exit(main())
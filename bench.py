@@ -0,0 +1,309 @@
+"""Throughput benchmarks for the scraping flows, without a live account.
+
+Each (flow, size) case runs in a fresh subprocess inside a temporary
+directory, feeding synthetic tweets through the same components the
+scripts use, and reports tweets/sec, save latency, dedup cost and peak RSS:
+
+    python bench.py                          # all flows at 1k / 100k / 1M tweets
+    python bench.py --flows main --sizes 1000 100000
+    python bench.py --replay recordings --query "(ai) min_faves:100"
+
+--replay runs twitterscrap.py's full scrape loop through a real twikit
+Client served by ReplayTransport, using pages saved with [HTTP] record_dir.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from random import Random
+from types import SimpleNamespace
+
+FLOWS = ('twitterscrap', 'main', 'fortyIQ')
+SIZES = (1000, 100000, 1000000)
+PAGE_SIZE = 20
+
+# Credentials are never used; pacing is disabled so only local work is timed
+BENCH_CONFIG = """[X]
+username = bench
+email = bench@example.com
+password = bench
+
+[Pool]
+requests_per_window = 1000000000
+window = 1
+
+[Pacing]
+jitter = 0
+min_delay = 0
+"""
+
+WORDS = ('market', 'bitcoin', 'ai', 'pump', 'bullish', 'rate', 'cut', 'stock', 'gold', 'supercycle',
+         'real', 'launch', 'build', 'public', 'today', 'huge', 'week', 'fed', 'crypto', 'chart')
+
+
+def make_tweet(i):
+    """A synthetic tweet; every 7th one repeats an earlier text with another link, like shill replies do"""
+    seed = i - i % 7 if i % 7 == 6 else i
+    text = f'@user{seed % 500} ' + ' '.join(Random(seed).choices(WORDS, k=12)) + f' #{seed % 97} https://t.co/{i:x}'
+    return SimpleNamespace(
+        id=str(10 ** 15 + i),
+        text=text,
+        user=SimpleNamespace(id=str(i % 500), name=f'user{i % 500}', followers_count=i % 500 * 100),
+        favorite_count=i % 1000,
+        retweet_count=i % 100,
+        reply_count=i % 50,
+        quote_count=i % 20,
+        created_at='Fri Jul 26 20:46:21 +0000 2024',
+        in_reply_to=str(10 ** 12 + i // 3),
+    )
+
+
+class FakeResult(list):
+    """One page of synthetic tweets with twikit Result's pagination interface"""
+
+    def __init__(self, client, offset):
+        super().__init__(make_tweet(i) for i in range(offset, min(offset + PAGE_SIZE, client.total)))
+        self.client = client
+        self.next_cursor = str(offset + PAGE_SIZE)
+
+    async def next(self):
+        return await self.client.search_tweet(None, None, cursor=self.next_cursor)
+
+    def next_sync(self):
+        return self.client.search_page(int(self.next_cursor))
+
+
+class FakeClient:
+    """Serves `total` synthetic tweets page by page"""
+
+    def __init__(self, total):
+        self.total = total
+
+    def search_page(self, offset):
+        return FakeResult(self, offset)
+
+    async def search_tweet(self, query, product, count=PAGE_SIZE, cursor=None):
+        return self.search_page(int(cursor or 0))
+
+
+class Timer:
+    def __init__(self):
+        self.samples = []
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples.append(time.perf_counter() - start)
+        return timed
+
+    def summary(self, per=None):
+        if not self.samples:
+            return {}
+        ordered = sorted(self.samples)
+        result = {
+            'calls': len(ordered),
+            'total_s': sum(ordered),
+            'p50_ms': statistics.median(ordered) * 1000,
+            'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+        if per:
+            result['us_per_tweet'] = sum(ordered) / per * 1e6
+        return result
+
+
+def bench_twitterscrap(size, replay=None, query=None):
+    """Run TwitterScraper.scrape_tweets end to end"""
+    from twitterscrap import TwitterScraper
+    from pacing import Pacer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if replay:
+        from twikit import Client
+        from http_transport import ReplayTransport
+        client = Client(language='en-US', transport=ReplayTransport(replay))
+    else:
+        client = FakeClient(size)
+
+    scraper = TwitterScraper(query=query or 'bench', minimum_tweets=size, output_file='bench.json', client=client)
+    scraper.pacer = Pacer(limit=10 ** 9, window=1, jitter=0, min_delay=0)
+    dedup, save = Timer(), Timer()
+    scraper.seen.filter_new = dedup.wrap(scraper.seen.filter_new)
+    scraper.save_data = save.wrap(scraper.save_data)
+
+    start = time.perf_counter()
+    asyncio.run(scraper.scrape_tweets())
+    elapsed = time.perf_counter() - start
+    collected = len(scraper.tweet_data_list)
+    scraper.close()
+    return elapsed, collected, dedup.summary(collected), save.summary()
+
+
+def bench_main(size):
+    """Run main.py's per-page functions: seen filter, scored buffered sink, page commits"""
+    import main
+    from dedup import SeenIndex
+    from progress import CrawlCheckpoint
+    from sinks import open_sink
+    from sentiment import SentimentStage
+    from neardup import NearDuplicateIndex
+
+    seen = SeenIndex('tweets.csv')
+    near_dups = NearDuplicateIndex('tweets.csv')
+    sink = SentimentStage(open_sink('tweets.csv', main.columns))
+    checkpoint = CrawlCheckpoint('bench', 'Top')
+    dedup, save = Timer(), Timer()
+    seen.filter_new = dedup.wrap(seen.filter_new)
+    near_dups.filter_new = dedup.wrap(near_dups.filter_new)
+    commit_page = save.wrap(main.commit_page)
+
+    client = FakeClient(size)
+    tweet_count = 0
+    start = time.perf_counter()
+    tweets = client.search_page(0)
+    while tweets:
+        written = main.write_page(tweets, seen, near_dups, sink, tweet_count)
+        tweet_count += len(written)
+        commit_page(sink, seen, near_dups, checkpoint, tweets, tweet_count, None)
+        tweets = tweets.next_sync()
+    sink.close()
+    elapsed = time.perf_counter() - start
+    seen.close()
+    near_dups.close()
+    checkpoint.close()
+    return elapsed, tweet_count, dedup.summary(tweet_count), save.summary()
+
+
+def bench_fortyIQ(size):
+    """Run fortyIQ.py's per-page functions: parent resolution through the cache, storage appends"""
+    import fortyIQ
+    from dedup import SeenIndex
+    from storage import open_storage, export_json
+    from tweet_cache import TweetCache
+    from neardup import NearDuplicateIndex
+
+    seen = SeenIndex('fortyIQ.json')
+    near_dups = NearDuplicateIndex('fortyIQ.json')
+    storage = open_storage('fortyIQ.json')
+    tweet_cache = TweetCache()
+    search = fortyIQ.FILTER.compile(fortyIQ.QUERY, [('reply', fortyIQ.is_reply)])
+    dedup, save = Timer(), Timer()
+    fortyIQ.new_replies = dedup.wrap(fortyIQ.new_replies)
+    save_conversations = save.wrap(fortyIQ.save_conversations)
+
+    def fetch_parents(tweet_ids):
+        return [SimpleNamespace(id=tweet_id, text=f'parent {tweet_id}', favorite_count=1, reply_count=3,
+                                user=SimpleNamespace(id='1', name='parent')) for tweet_id in tweet_ids]
+
+    client = FakeClient(size)
+    count = 0
+    start = time.perf_counter()
+    tweets = client.search_page(0)
+    while tweets:
+        conversations, _, _ = fortyIQ.page_conversations(tweets, search, seen, near_dups, tweet_cache,
+                                                         fetch_parents, size)
+        count += len(conversations)
+        save_conversations(conversations, storage, seen, near_dups)
+        tweets = tweets.next_sync()
+    storage.flush()
+    save.wrap(export_json)(storage, 'fortyIQ.json', indent=4)
+    elapsed = time.perf_counter() - start
+    storage.close()
+    seen.close()
+    near_dups.close()
+    tweet_cache.close()
+    return elapsed, count, dedup.summary(count), save.summary()
+
+
+def run_single(flow, size, replay=None, query=None):
+    """Run one case in this process and print its result as JSON"""
+    with open('config.ini', 'w') as f:
+        f.write(BENCH_CONFIG)
+
+    if flow == 'twitterscrap':
+        elapsed, collected, dedup, save = bench_twitterscrap(size, replay, query)
+    elif flow == 'main':
+        elapsed, collected, dedup, save = bench_main(size)
+    else:
+        elapsed, collected, dedup, save = bench_fortyIQ(size)
+
+    print(json.dumps({
+        'flow': flow,
+        'size': size,
+        'collected': collected,
+        'seconds': elapsed,
+        'tweets_per_sec': collected / elapsed if elapsed else 0.0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'dedup': dedup,
+        'save': save,
+    }))
+
+
+def run_case(flow, size, replay=None, query=None):
+    script = os.path.abspath(__file__)
+    with tempfile.TemporaryDirectory(prefix='bench_') as workdir:
+        command = [sys.executable, script, '--single', flow, str(size)]
+        if replay:
+            command += ['--replay', os.path.abspath(replay), '--query', query or '']
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True,
+                                   env=dict(os.environ, PYTHONPATH=os.pathsep.join(
+                                       filter(None, [os.path.dirname(script), os.environ.get('PYTHONPATH')]))))
+    if completed.returncode != 0:
+        raise RuntimeError(f"{flow} at {size} tweets failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_report(results):
+    header = f"{'flow':<13}{'tweets':>9}{'tweets/s':>11}{'save p50 ms':>13}{'save p99 ms':>13}" \
+             f"{'dedup us/tw':>13}{'peak MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['flow']:<13}{r['collected']:>9}{r['tweets_per_sec']:>11.0f}"
+              f"{r['save'].get('p50_ms', 0):>13.2f}{r['save'].get('p99_ms', 0):>13.2f}"
+              f"{r['dedup'].get('us_per_tweet', 0):>13.2f}{r['peak_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraping flows offline")
+    parser.add_argument('--flows', nargs='+', choices=FLOWS, default=list(FLOWS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--replay', help="directory of recorded responses (twitterscrap flow only)")
+    parser.add_argument('--query', help="query the recorded responses were made for")
+    parser.add_argument('--json', help="also write the raw results to this file")
+    parser.add_argument('--single', nargs=2, metavar=('FLOW', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single[0], int(args.single[1]), args.replay, args.query)
+        return 0
+
+    if args.replay:
+        cases = [('twitterscrap', size) for size in args.sizes]
+    else:
+        cases = [(flow, size) for flow in args.flows for size in args.sizes]
+
+    results = []
+    for flow, size in cases:
+        print(f"Running {flow} with {size} tweets...", file=sys.stderr)
+        results.append(run_case(flow, size, args.replay, args.query))
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
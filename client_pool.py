@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import time
+
+from pacing import Pacer
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# config.ini section of the primary account; extra accounts use sections
+# named "X.<name>" (e.g. [X.backup]) with their own cookies_file
+PRIMARY_SECTION = 'X'
+ACCOUNT_SECTION_PREFIX = 'X.'
+PRIMARY_COOKIES_FILE = 'cookies.json'
+
+# SearchTimeline allows 50 requests per 15 minute window per account
+DEFAULT_REQUESTS_PER_WINDOW = 50
+DEFAULT_WINDOW = 15 * 60
+
+
+def account_sections(config):
+    """Return the config.ini sections describing accounts, primary first"""
+    sections = [PRIMARY_SECTION] if config.has_section(PRIMARY_SECTION) else []
+    sections += [s for s in config.sections() if s.startswith(ACCOUNT_SECTION_PREFIX)]
+    return sections
+
+
+class TokenBucket:
+    """Tracks one account's remaining request quota.
+
+    Tokens refill continuously at capacity/period per second until the
+    server reports the real quota through update(); from then on the bucket
+    holds the reported remaining count and refills at the reported reset.
+    A rate-limit response empties the bucket until the reset time.
+    """
+
+    def __init__(self, capacity=DEFAULT_REQUESTS_PER_WINDOW, period=DEFAULT_WINDOW):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        self.window_reset = None  # reset time reported by the server, if known
+
+    def refill(self, now=None):
+        now = time.time() if now is None else now
+        if self.window_reset is not None:
+            if now >= self.window_reset:
+                self.tokens = float(self.capacity)
+                self.window_reset = None
+            self.updated = now
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.period)
+        self.updated = now
+
+    def available(self, now=None):
+        """Number of whole requests that can be sent right now"""
+        now = time.time() if now is None else now
+        if now < self.blocked_until:
+            return 0
+        self.refill(now)
+        return int(self.tokens)
+
+    def take(self):
+        """Consume one token. Returns False if the bucket is empty"""
+        if self.available() < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait_time(self, now=None):
+        """Seconds until at least one token is available"""
+        now = time.time() if now is None else now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.window_reset is not None:
+            return self.window_reset - now
+        return (1 - self.tokens) * self.period / self.capacity
+
+    def update(self, remaining, reset_time):
+        """Sync the bucket with the quota reported in response headers"""
+        self.tokens = float(remaining)
+        self.updated = time.time()
+        self.window_reset = reset_time
+        if remaining <= 0:
+            self.blocked_until = reset_time
+
+    def exhaust(self, reset_time=None):
+        """Mark the quota as used up until reset_time (a Unix timestamp)"""
+        now = time.time()
+        self.tokens = 0.0
+        self.updated = now
+        self.blocked_until = reset_time if reset_time else now + self.period
+
+
+class PooledAccount:
+    """An authenticated client together with its quota bucket and pacer"""
+
+    def __init__(self, name, client, cookies_file, bucket, pacer):
+        self.name = name
+        self.client = client
+        self.cookies_file = cookies_file
+        self.bucket = bucket
+        self.pacer = pacer
+        # Quota seen in response headers keeps the bucket exact
+        pacer.on_update = bucket.update
+        pacer.attach(client)
+
+
+class ClientPool:
+    """Round-robins search requests over several authenticated accounts.
+
+    acquire() returns the account with the most remaining quota, so a
+    rate-limited account is skipped instead of blocking the crawl. The pool
+    only sleeps when every account is out of quota.
+    """
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def from_config(cls, config, make_client, login):
+        """Authenticate every account section in config.
+
+        make_client() returns a fresh twikit Client. login(client, section,
+        cookies_file) performs a fresh login and saves the cookies; it is only
+        called for accounts without a cookies file.
+        """
+        capacity = config.getint('Pool', 'requests_per_window', fallback=DEFAULT_REQUESTS_PER_WINDOW)
+        period = config.getint('Pool', 'window', fallback=DEFAULT_WINDOW)
+
+        accounts = []
+        for section in account_sections(config):
+            if section == PRIMARY_SECTION:
+                default_cookies = PRIMARY_COOKIES_FILE
+            else:
+                default_cookies = f"cookies_{section[len(ACCOUNT_SECTION_PREFIX):]}.json"
+            cookies_file = config.get(section, 'cookies_file', fallback=default_cookies)
+
+            client = make_client()
+            try:
+                if os.path.exists(cookies_file):
+                    client.load_cookies(cookies_file)
+                    logger.info(f"Loaded cookies for account [{section}]")
+                else:
+                    await login(client, section, cookies_file)
+            except Exception as e:
+                logger.error(f"Skipping account [{section}]: {e}")
+                continue
+
+            accounts.append(PooledAccount(section, client, cookies_file,
+                                          TokenBucket(capacity, period), Pacer.from_config(config)))
+
+        if not accounts:
+            raise RuntimeError("No account in the pool could be authenticated")
+        logger.info(f"Client pool ready with {len(accounts)} accounts")
+        return cls(accounts)
+
+    async def acquire(self):
+        """Wait for an account with quota and consume one of its tokens"""
+        async with self.lock:
+            while True:
+                now = time.time()
+                account = max(self.accounts, key=lambda a: a.bucket.available(now))
+                if account.bucket.take():
+                    return account
+
+                wait_time = min(a.bucket.wait_time(now) for a in self.accounts)
+                logger.warning(f"All {len(self.accounts)} accounts are out of quota, waiting {wait_time:.0f} seconds")
+                METRICS.sleep(wait_time, 'pool')
+                await asyncio.sleep(wait_time)
+
+    def mark_rate_limited(self, account, reset_time=None):
+        """Record a rate-limit response so acquire() moves on to other accounts"""
+        account.bucket.exhaust(reset_time)
+        account.pacer.rate_limited(account.bucket.blocked_until)
+        logger.warning(f"Account [{account.name}] rate limited until {time.ctime(account.bucket.blocked_until)}")
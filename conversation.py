@@ -0,0 +1,248 @@
+"""Breadth-first crawler that builds full reply trees from seed tweets.
+
+Trees are written in the fortyIQ.json shape, each node holding its text,
+likes and (if it has any) its replies:
+
+    [{"text": "...", "likes": 62, "replies": [{"text": "...", "likes": 14, "replies": [...]}]}]
+
+    python conversation.py --seed 1816911456789012345 --max-depth 3 --max-width 20
+    python conversation.py --query "from:Crypto_VorteXBT" --seeds 10 --workers 4
+"""
+import argparse
+import asyncio
+import logging
+
+from twitterscrap import TwitterScraper, TooManyRequests
+from pacing import Pacer
+from tweet_cache import TweetCache
+from storage import export_json
+from metrics import METRICS, MetricsExporter
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FILE = 'conversations.json'
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_MAX_WIDTH = 20
+DEFAULT_WORKERS = 4
+# Reply pages requested per node before settling for what was found
+MAX_REPLY_PAGES = 3
+
+
+def make_node(tweet):
+    return {'text': tweet.text, 'likes': getattr(tweet, 'favorite_count', 0) or 0}
+
+
+class ConversationCrawler:
+    """Expands reply trees breadth-first with a bounded pool of asyncio workers.
+
+    Every tweet is expanded at most once (visited set). Tweets already in the
+    tweet cache are not fetched for their content, and tweets known to have no
+    replies are not fetched at all. At each node only the max_width most
+    liked direct replies are kept, down to max_depth levels below the seed.
+    A seed's tree is appended to storage as soon as its last node is done,
+    unless one of its nodes failed: incomplete trees are dropped and their
+    seeds left unseen, so the next run crawls them again.
+    """
+
+    def __init__(self, scraper, max_depth=DEFAULT_MAX_DEPTH,
+                 max_width=DEFAULT_MAX_WIDTH, workers=DEFAULT_WORKERS):
+        self.scraper = scraper
+        self.max_depth = max_depth
+        self.max_width = max_width
+        self.workers = max(1, workers)
+        # Trees go to the scraper's storage log; its seen index holds the
+        # seeds whose trees were written by earlier runs
+        self.output_file = scraper.output_file
+        self.storage = scraper.storage
+        self.seen = scraper.seen
+        self.tweet_cache = TweetCache()
+        self.pacer = None
+        self.visited = set()
+        self.trees = {}  # seed id -> root node
+        self.pending = {}  # seed id -> nodes of its tree still queued or in progress
+        self.failures = {}  # seed id -> nodes of its tree that could not be expanded
+        self.written = 0
+
+    async def fetch_replies(self, tweet_id):
+        """Fetch a tweet and up to max_width of its direct replies (one TweetDetail call per page)"""
+        while True:
+            try:
+                await self.pacer.wait()
+                METRICS.inc('requests_total', endpoint='TweetDetail')
+                with METRICS.timer('request_seconds', endpoint='TweetDetail'):
+                    tweet = await self.scraper.client.get_tweet_by_id(tweet_id)
+                    replies = []
+                    page = tweet.replies
+                    pages = 0
+                    while page:
+                        # The conversation view also holds deeper replies; keep direct ones
+                        replies.extend(reply for reply in page if str(reply.in_reply_to) == str(tweet_id))
+                        pages += 1
+                        if len(replies) >= self.max_width or pages >= MAX_REPLY_PAGES:
+                            break
+                        await self.pacer.wait()
+                        METRICS.inc('requests_total', endpoint='TweetDetail')
+                        page = await page.next()
+                return tweet, replies
+            except TooManyRequests as e:
+                METRICS.inc('rate_limited_total', endpoint='TweetDetail')
+                logger.warning(f"Rate limit reached while expanding {tweet_id}, pausing until the reset")
+                self.pacer.rate_limited(e.rate_limit_reset + 10)
+
+    async def expand(self, tweet_id, depth, seed_id, node, reply_count):
+        """Fill in one node and queue its replies"""
+        if seed_id in self.failures:
+            # The tree is dropped anyway; don't spend quota on the rest of it
+            return []
+        if node is not None and (depth >= self.max_depth or reply_count == 0):
+            return []
+
+        tweet, replies = await self.fetch_replies(tweet_id)
+        self.tweet_cache.put_many([tweet] + replies)
+        if node is None:
+            node = self.trees[seed_id] = make_node(tweet)
+            node['replies'] = []
+        if depth >= self.max_depth:
+            return []
+
+        replies.sort(key=lambda reply: getattr(reply, 'favorite_count', 0) or 0, reverse=True)
+        children = []
+        for reply in replies:
+            if len(children) >= self.max_width:
+                break
+            reply_id = str(reply.id)
+            if reply_id in self.visited:
+                continue
+            self.visited.add(reply_id)
+            child = make_node(reply)
+            node.setdefault('replies', []).append(child)
+            children.append((reply_id, depth + 1, seed_id, child, getattr(reply, 'reply_count', None)))
+        METRICS.inc('tweets_total', len(children))
+        return children
+
+    def finish_tree(self, seed_id):
+        tree = self.trees.pop(seed_id, None)
+        del self.pending[seed_id]
+        if seed_id in self.failures:
+            logger.warning(f"Dropped the tree of {seed_id}: {self.failures[seed_id]} nodes failed, "
+                           f"it is crawled again next run")
+            return
+        if tree is None:
+            return
+        self.storage.append([tree])
+        self.seen.add(seed_id)
+        self.seen.commit()
+        self.written += 1
+        logger.info(f"Wrote conversation tree for {seed_id} ({self.written} trees)")
+
+    def add_seed(self, seed_id, queue):
+        seed_id = str(seed_id)
+        if seed_id in self.visited or seed_id in self.seen:
+            return
+        self.visited.add(seed_id)
+        self.pending[seed_id] = 1
+
+        cached = self.tweet_cache.get(seed_id)
+        if cached is not None:
+            # Known seeds are not fetched for their content, only for replies
+            node = self.trees[seed_id] = make_node(cached)
+            node['replies'] = []
+            queue.put_nowait((seed_id, 0, seed_id, node, cached.reply_count))
+        else:
+            queue.put_nowait((seed_id, 0, seed_id, None, None))
+
+    async def run(self, seed_ids):
+        """Crawl the trees of seed_ids and export them. Returns the number of trees written"""
+        if self.scraper.client is None:
+            await self.scraper.initialize_client()
+        # Reply lookups use TweetDetail, which has its own quota
+        self.pacer = Pacer.from_config(self.scraper.config, endpoint='TweetDetail')
+        self.pacer.attach(self.scraper.client)
+
+        queue = asyncio.Queue()
+        for seed_id in seed_ids:
+            self.add_seed(seed_id, queue)
+        logger.info(f"Crawling {len(self.pending)} conversation trees with {self.workers} workers")
+
+        async def worker():
+            while True:
+                tweet_id, depth, seed_id, node, reply_count = await queue.get()
+                try:
+                    children = await self.expand(tweet_id, depth, seed_id, node, reply_count)
+                    self.pending[seed_id] += len(children)
+                    for child in children:
+                        queue.put_nowait(child)
+                except Exception as e:
+                    logger.error(f"Error expanding {tweet_id}: {e}")
+                    self.failures[seed_id] = self.failures.get(seed_id, 0) + 1
+                finally:
+                    self.pending[seed_id] -= 1
+                    if self.pending[seed_id] == 0:
+                        self.finish_tree(seed_id)
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        self.storage.flush()
+        total = export_json(self.storage, self.output_file, indent=4)
+        logger.info(f"Saved {self.written} new trees ({total} in {self.output_file})")
+        if self.failures:
+            logger.error(f"{len(self.failures)} trees were incomplete and not saved")
+        return self.written
+
+    async def search_seeds(self, query, limit):
+        """IDs of up to limit tweets matching query, to use as seeds"""
+        seed_ids = []
+        tweets = None
+        while len(seed_ids) < limit:
+            tweets = await self.scraper.get_tweets_batch(tweets, query=query, product='Latest')
+            if not tweets:
+                break
+            self.tweet_cache.put_many(tweets)
+            seed_ids.extend(str(tweet.id) for tweet in tweets)
+        return seed_ids[:limit]
+
+    def close(self):
+        self.tweet_cache.close()
+
+
+async def main(args):
+    scraper = TwitterScraper(query=args.query or '', output_file=args.output)
+    crawler = ConversationCrawler(scraper, max_depth=args.max_depth, max_width=args.max_width,
+                                  workers=args.workers)
+    exporter = MetricsExporter.from_config(scraper.config).start()
+    try:
+        seed_ids = list(args.seed)
+        if args.query:
+            await scraper.initialize_client()
+            seed_ids += await crawler.search_seeds(args.query, args.seeds)
+        if not seed_ids:
+            logger.error("No seeds given. Use --seed TWEET_ID or --query QUERY")
+            return 1
+        await crawler.run(seed_ids)
+        return 1 if crawler.failures else 0
+    except Exception as e:
+        logger.error(f"Conversation crawl failed: {e}")
+        return 1
+    finally:
+        crawler.close()
+        scraper.close()
+        logger.info(exporter.stop())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl full reply trees breadth-first")
+    parser.add_argument('--seed', action='append', default=[], help="seed tweet ID (repeatable)")
+    parser.add_argument('--query', help="use tweets matching this search as seeds")
+    parser.add_argument('--seeds', type=int, default=10, help="number of seeds taken from --query")
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH, help="reply levels below each seed")
+    parser.add_argument('--max-width', type=int, default=DEFAULT_MAX_WIDTH, help="most-liked replies kept per tweet")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    exit(asyncio.run(main(parser.parse_args())))
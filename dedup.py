@@ -0,0 +1,51 @@
+import sqlite3
+
+# SQLite file shared by all scrapers for crawl bookkeeping
+PROGRESS_DB = 'tweet_progress.db'
+
+
+class SeenIndex:
+    """Persistent set of tweet IDs already collected for one output.
+
+    IDs live in a WITHOUT ROWID table in tweet_progress.db, so membership
+    checks are a primary-key lookup and never require loading the corpus.
+    The namespace (normally the output file name) keeps the scripts'
+    datasets independent while sharing one database.
+    """
+
+    def __init__(self, namespace, path=PROGRESS_DB):
+        self.namespace = namespace
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS seen_tweets ('
+            'namespace TEXT NOT NULL, '
+            'tweet_id TEXT NOT NULL, '
+            'PRIMARY KEY (namespace, tweet_id)) WITHOUT ROWID'
+        )
+        self.conn.commit()
+
+    def __contains__(self, tweet_id):
+        row = self.conn.execute(
+            'SELECT 1 FROM seen_tweets WHERE namespace = ? AND tweet_id = ?',
+            (self.namespace, str(tweet_id))
+        ).fetchone()
+        return row is not None
+
+    def add(self, tweet_id):
+        """Mark tweet_id as seen. Returns True if it was not seen before"""
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO seen_tweets (namespace, tweet_id) VALUES (?, ?)',
+            (self.namespace, str(tweet_id))
+        )
+        return cursor.rowcount == 1
+
+    def filter_new(self, tweets):
+        """Return the tweets of a page whose IDs were not seen yet, marking them seen"""
+        return [tweet for tweet in tweets if self.add(tweet.id)]
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,124 @@
+"""Hashtags, mentions, URLs and media of tweets, extracted a page at a time.
+
+Values come from the tweet's structured entities (twikit keeps the raw
+``legacy`` object of every tweet), which hold expanded URLs and media that
+the text does not show. Tweets without them (e.g. built from saved data)
+fall back to one pass of a precompiled regex over the text. Hashtags and
+mentions are stored without # / @, deduplicated case-insensitively, and
+interned, as are the joined column values, so the strings repeated on most
+rows (e.g. "Bitcoin") are kept once.
+"""
+import re
+import sys
+
+# One alternation, so each text is scanned once for all three kinds. The
+# lookahead lets the scan skip positions that cannot start an entity; the
+# lookbehind rejects a#b and e-mail addresses
+ENTITY = re.compile(r'(?=[#@h])(?:(?<![\w#@])(?:#\w+|@\w{1,15}\b)|https?://\S+)')
+# Punctuation that ends a sentence rather than a URL
+URL_TRAILING = '.,;:!?)"\'…'
+# Separator of several values in one column
+SEPARATOR = ', '
+MEDIA_YES = 'Yes'
+MEDIA_NO = 'No'
+
+
+class TweetEntities:
+    """Entities of one tweet, as tuples of interned strings"""
+    __slots__ = ('hashtags', 'mentions', 'urls', 'has_media')
+
+    def __init__(self, hashtags=(), mentions=(), urls=(), has_media=False):
+        self.hashtags = hashtags
+        self.mentions = mentions
+        self.urls = urls
+        self.has_media = has_media
+
+    def columns(self):
+        """Values for the Hashtags, Mentions, URLs and Media Presence columns"""
+        return {
+            'Hashtags': joined(self.hashtags),
+            'Mentions': joined(self.mentions),
+            'URLs': joined(self.urls),
+            'Media Presence': MEDIA_YES if self.has_media else MEDIA_NO,
+        }
+
+
+NO_ENTITIES = TweetEntities()
+
+
+def unique(values):
+    """Interned values without repeats (case-insensitive), in order"""
+    values = [value for value in values if value]
+    if len(values) < 2:
+        # Most tweets have at most one hashtag or mention
+        return (sys.intern(values[0]),) if values else ()
+    seen = set()
+    kept = []
+    for value in values:
+        if not value:
+            continue
+        key = value.lower()
+        if key not in seen:
+            seen.add(key)
+            kept.append(sys.intern(value))
+    return tuple(kept)
+
+
+def unique_urls(urls):
+    """URLs without repeats, in order. They rarely repeat across tweets, so
+    they are not interned"""
+    return tuple(dict.fromkeys(url for url in urls if url))
+
+
+def joined(values):
+    if not values:
+        return ''
+    if len(values) == 1:
+        return values[0]
+    return sys.intern(SEPARATOR.join(values))
+
+
+def legacy_entities(tweet):
+    """The raw entities object of a twikit tweet, or None"""
+    legacy = getattr(tweet, '_legacy', None)
+    if isinstance(legacy, dict):
+        return legacy.get('entities')
+    return None
+
+
+def from_structured(tweet, entities):
+    media = entities.get('media') or getattr(tweet, 'media', None)
+    return TweetEntities(
+        unique(item.get('text') for item in entities.get('hashtags') or ()),
+        unique(item.get('screen_name') for item in entities.get('user_mentions') or ()),
+        unique_urls(item.get('expanded_url') or item.get('url') for item in entities.get('urls') or ()),
+        bool(media),
+    )
+
+
+def from_text(tweet, text):
+    hashtags, mentions, urls = [], [], []
+    for match in ENTITY.findall(text):
+        first = match[0]
+        if first == '#':
+            hashtags.append(match[1:])
+        elif first == '@':
+            mentions.append(match[1:])
+        else:
+            urls.append(match.rstrip(URL_TRAILING))
+    # Tweets from twikit without raw entities may still carry parsed ones
+    hashtags = getattr(tweet, 'hashtags', None) or hashtags
+    return TweetEntities(unique(hashtags), unique(mentions), unique_urls(urls), bool(getattr(tweet, 'media', None)))
+
+
+def extract_entities(tweet):
+    entities = legacy_entities(tweet)
+    if entities is not None:
+        return from_structured(tweet, entities)
+    text = getattr(tweet, 'text', None)
+    return from_text(tweet, text) if text else NO_ENTITIES
+
+
+def extract_page(tweets):
+    """TweetEntities for every tweet of a page, in order"""
+    return [extract_entities(tweet) for tweet in tweets]
@@ -0,0 +1,155 @@
+"""Declarative tweet filters, pushed down into the search query where possible.
+
+Every predicate X's search supports is compiled into an operator, so the
+server drops non-matching tweets before they cost a page; only the rest is
+evaluated on the fetched tweets:
+
+    spec = FilterSpec(min_likes=100, replies=False, language='en', since='2025-05-10')
+    compiled = spec.compile('(ai)')
+    compiled.query            # '(ai) min_faves:100 lang:en since:2025-05-10 -filter:replies'
+    compiled.filter(tweets)   # applies the leftover predicates (here none)
+"""
+import logging
+import re
+from datetime import datetime
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d'
+# Values of the three-way options in config.ini
+CHOICES = {'only': True, 'exclude': False, 'any': None, '': None}
+
+
+def parse_choice(value):
+    """'only' / 'exclude' / 'any' as True / False / None"""
+    try:
+        return CHOICES[value.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Expected only, exclude or any, got '{value}'")
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT).date() if value else None
+
+
+def has_operator(query, name):
+    """True if query already holds the operator name: (e.g. min_faves:), negated or not"""
+    return re.search(rf'(?<![\w:]){re.escape(name)}:', query) is not None
+
+
+def has_filter(query, name):
+    """True if query already holds filter:name or -filter:name"""
+    return re.search(rf'(?<![\w:])-?filter:{re.escape(name)}\b', query) is not None
+
+
+class FilterSpec:
+    """What tweets a crawl wants, independent of where it is checked.
+
+    replies, links and media take True (only those), False (exclude them)
+    or None (either). since/until are YYYY-MM-DD dates, until exclusive as
+    in X's search. min_followers has no search operator and is always
+    checked locally.
+    """
+
+    def __init__(self, min_likes=None, min_retweets=None, min_replies=None, replies=None,
+                 language=None, since=None, until=None, links=None, media=None, min_followers=None):
+        self.min_likes = min_likes
+        self.min_retweets = min_retweets
+        self.min_replies = min_replies
+        self.replies = replies
+        self.language = language
+        self.since = parse_date(since) if isinstance(since, str) else since
+        self.until = parse_date(until) if isinstance(until, str) else until
+        self.links = links
+        self.media = media
+        self.min_followers = min_followers
+
+    @classmethod
+    def from_config(cls, config=None, section='Filter'):
+        """Filter spec from a config.ini section; missing options filter nothing"""
+        if config is None or not config.has_section(section):
+            return cls()
+
+        def get_int(option):
+            value = config.get(section, option, fallback='').strip()
+            return int(value) if value else None
+
+        return cls(
+            min_likes=get_int('min_likes'),
+            min_retweets=get_int('min_retweets'),
+            min_replies=get_int('min_replies'),
+            replies=parse_choice(config.get(section, 'replies', fallback='any')),
+            language=config.get(section, 'language', fallback='').strip() or None,
+            since=config.get(section, 'since', fallback='').strip() or None,
+            until=config.get(section, 'until', fallback='').strip() or None,
+            links=parse_choice(config.get(section, 'links', fallback='any')),
+            media=parse_choice(config.get(section, 'media', fallback='any')),
+            min_followers=get_int('min_followers'),
+        )
+
+    def operators(self, query=''):
+        """Search operators for the pushable predicates not already in query"""
+        operators = []
+
+        def add(name, operator):
+            if not has_operator(query, name):
+                operators.append(operator)
+
+        if self.min_likes is not None:
+            add('min_faves', f'min_faves:{self.min_likes}')
+        if self.min_retweets is not None:
+            add('min_retweets', f'min_retweets:{self.min_retweets}')
+        if self.min_replies is not None:
+            add('min_replies', f'min_replies:{self.min_replies}')
+        if self.language:
+            add('lang', f'lang:{self.language}')
+        if self.since is not None:
+            add('since', f'since:{self.since.strftime(DATE_FORMAT)}')
+        if self.until is not None:
+            add('until', f'until:{self.until.strftime(DATE_FORMAT)}')
+        for name, wanted in (('replies', self.replies), ('links', self.links), ('media', self.media)):
+            if wanted is not None and not has_filter(query, name):
+                operators.append(f'filter:{name}' if wanted else f'-filter:{name}')
+        return operators
+
+    def local_predicates(self):
+        """(name, predicate) for the parts of the spec search cannot express"""
+        predicates = []
+        if self.min_followers is not None:
+            min_followers = self.min_followers
+            predicates.append(('min_followers', lambda tweet: (
+                getattr(getattr(tweet, 'user', None), 'followers_count', 0) or 0) >= min_followers))
+        return predicates
+
+    def compile(self, query, local_predicates=()):
+        """Push the spec into query; local_predicates are extra (name, predicate) checks"""
+        operators = self.operators(query)
+        compiled_query = ' '.join(filter(None, [query.strip()] + operators)) if operators else query
+        return CompiledFilter(compiled_query, self.local_predicates() + list(local_predicates))
+
+
+class CompiledFilter:
+    """A search query with the spec's operators, plus the predicates left to check locally"""
+
+    def __init__(self, query, predicates=()):
+        self.query = query
+        self.predicates = list(predicates)
+
+    def matches(self, tweet):
+        return all(predicate(tweet) for _, predicate in self.predicates)
+
+    def filter(self, tweets):
+        """Return the tweets passing every local predicate"""
+        if not self.predicates:
+            return list(tweets)
+        tweets = list(tweets)
+        kept = [tweet for tweet in tweets if self.matches(tweet)]
+        if len(kept) < len(tweets):
+            METRICS.inc('filtered_total', len(tweets) - len(kept))
+        return kept
+
+    def __repr__(self):
+        local = ', '.join(name for name, _ in self.predicates) or 'none'
+        return f'<CompiledFilter query={self.query!r} local={local}>'
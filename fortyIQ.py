@@ -2,33 +2,52 @@ import re
 from twikit import Client, TooManyRequests
 import time
 from datetime import datetime
-import json
 from configparser import ConfigParser
 from random import randint
+import argparse
+
+from dedup import SeenIndex
+from progress import CrawlCheckpoint
+from storage import open_storage, export_json
+from pacing import Pacer
+from tweet_cache import TweetCache
+from http_transport import client_kwargs
+from records import TweetMetrics, ConversationRecord, as_dicts
+from metrics import METRICS, MetricsExporter
+from neardup import NearDuplicateIndex
+from filters import FilterSpec
+from search_index import update_index
 
 # Constants
 MINIMUM_TWEETS = 5  # Reduced for testing
 LIKES_THRESHOLD = 1
 TARGET_USER = "Crypto_VorteXBT"
 QUERY = f"from:{TARGET_USER}"
+# Compiled into the search (filter:replies min_faves:...), so pages only hold
+# replies that clear the likes threshold
+FILTER = FilterSpec(min_likes=LIKES_THRESHOLD, replies=True)
+PRODUCT = 'Latest'
+OUTPUT_FILE = 'fortyIQVortex.json'
+PARENT_BATCH_SIZE = 100  # Parent tweets looked up per by-IDs request
 
-# Rate limiting constants
-MIN_WAIT = 15  # Minimum seconds between requests
-MAX_WAIT = 30  # Maximum seconds between requests
-BATCH_MIN_WAIT = 30  # Minimum seconds between batches
-BATCH_MAX_WAIT = 45  # Maximum seconds between batches
+# Rate limiting: timeline pages and parent lookups share one search quota,
+# so a single Pacer (configured under [Pool]/[Pacing]) spaces all of them
 
 
-def get_tweets(tweets, client):
+@METRICS.timed('get_tweets_batch_seconds')
+def get_tweets(tweets, client, pacer, cursor=None, query=QUERY):
     if tweets is None:
+        pacer.wait_sync()
         print(f'{datetime.now()} - Getting tweets...')
-        print(f'Using query: {QUERY}')
-        tweets = client.search_tweet(QUERY, product='Latest')
+        print(f'Using query: {query}')
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            tweets = client.search_tweet(query, product=PRODUCT, cursor=cursor)
     else:
-        wait_time = randint(BATCH_MIN_WAIT, BATCH_MAX_WAIT)
-        print(f'{datetime.now()} - Getting next tweets after {wait_time} seconds...')
-        time.sleep(wait_time)
-        tweets = tweets.next()
+        pacer.wait_sync()
+        print(f'{datetime.now()} - Getting next tweets...')
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            tweets = tweets.next()
+    METRICS.inc('requests_total', endpoint='SearchTimeline')
     return tweets
 
 
@@ -36,12 +55,15 @@ def is_reply(tweet):
     return hasattr(tweet, 'in_reply_to') and tweet.in_reply_to is not None
 
 
-def get_parent_tweet(in_reply_to_id, client):
+def get_parent_tweet(in_reply_to_id, client, pacer):
     try:
         # Only try the first query method to reduce API calls
         query = f"id:{in_reply_to_id}"
+        pacer.wait_sync()
         print(f'{datetime.now()} - Searching for parent tweet with query: {query}')
-        parent_tweets = client.search_tweet(query, product='Latest')
+        METRICS.inc('requests_total', endpoint='SearchTimeline')
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            parent_tweets = client.search_tweet(query, product='Latest')
 
         if parent_tweets:
             for tweet in parent_tweets:
@@ -51,85 +73,183 @@ def get_parent_tweet(in_reply_to_id, client):
         return None
     except Exception as e:
         print(f'{datetime.now()} - Error fetching parent tweet: {str(e)}')
-        if "Rate limit exceeded" in str(e):
-            # Add extra wait time when rate limit is hit
-            wait_time = randint(45, 60)  # Longer wait when rate limited
-            print(f'{datetime.now()} - Rate limit hit, waiting {wait_time} seconds')
-            time.sleep(wait_time)
+        if isinstance(e, TooManyRequests):
+            METRICS.inc('rate_limited_total', endpoint='SearchTimeline')
+            # Hold further searches until the quota resets
+            print(f'{datetime.now()} - Rate limit hit, pausing searches until {datetime.fromtimestamp(e.rate_limit_reset)}')
+            pacer.rate_limited(e.rate_limit_reset)
     return None
 
 
+def fetch_tweets_by_ids(tweet_ids, client, pacer):
+    """Fetch tweets in bulk through the by-IDs lookup.
+
+    Falls back to one get_parent_tweet search per id if the client has no
+    get_tweets_by_ids method.
+    """
+    get_tweets_by_ids = getattr(client, 'get_tweets_by_ids', None)
+    if get_tweets_by_ids is None:
+        return [get_parent_tweet(tweet_id, client, pacer) for tweet_id in tweet_ids]
+
+    found = []
+    for start in range(0, len(tweet_ids), PARENT_BATCH_SIZE):
+        batch = tweet_ids[start:start + PARENT_BATCH_SIZE]
+        print(f'{datetime.now()} - Looking up {len(batch)} parent tweets')
+        try:
+            METRICS.inc('requests_total', endpoint='TweetResultsByRestIds')
+            with METRICS.timer('request_seconds', endpoint='TweetResultsByRestIds'):
+                found.extend(get_tweets_by_ids(batch))
+        except TooManyRequests as e:
+            print(f'{datetime.now()} - Rate limit hit on parent lookup, retrying after {datetime.fromtimestamp(e.rate_limit_reset)}')
+            METRICS.inc('rate_limited_total', endpoint='TweetResultsByRestIds')
+            wait_time = max((datetime.fromtimestamp(e.rate_limit_reset) - datetime.now()).total_seconds(), 0)
+            METRICS.sleep(wait_time, 'rate_limit')
+            time.sleep(wait_time)
+            METRICS.inc('requests_total', endpoint='TweetResultsByRestIds')
+            with METRICS.timer('request_seconds', endpoint='TweetResultsByRestIds'):
+                found.extend(get_tweets_by_ids(batch))
+        except Exception as e:
+            print(f'{datetime.now()} - Error fetching parent tweets: {str(e)}')
+    return found
+
+
 def create_metrics_dict(tweet):
-    """Create a simplified metrics dictionary with only like_count and reply_count"""
-    return {
-        'like_count': getattr(tweet, 'favorite_count', 0),
-        'reply_count': getattr(tweet, 'reply_count', 0)
-    }
+    """Create simplified metrics with only like_count and reply_count"""
+    return TweetMetrics(getattr(tweet, 'favorite_count', 0), getattr(tweet, 'reply_count', 0))
+
+
+def new_replies(tweets, search, seen, near_dups):
+    # The search already applied the likes threshold; skip replies
+    # processed by earlier runs
+    replies = [tweet for tweet in search.filter(tweets) if tweet.id not in seen]
+    return near_dups.filter_new(replies)
 
 
-def main():
+def page_conversations(tweets, search, seen, near_dups, tweet_cache, fetch_parents, limit):
+    """Conversations of up to limit new replies on a page whose parent resolves.
+
+    Returns (conversations, last_tweet_id, finished); finished is False if
+    the limit was reached before the end of the page.
+    """
+    conversation_data = []
+    last_tweet_id = None
+    replies = new_replies(tweets, search, seen, near_dups)
+
+    # Threads often reply to tweets on the same timeline, so cache the
+    # page itself before resolving parents. Cached parents cost nothing,
+    # the rest are fetched in bulk
+    tweet_cache.put_many(tweets)
+    parents = tweet_cache.resolve([tweet.in_reply_to for tweet in replies], fetch_parents)
+
+    for tweet in replies:
+        if len(conversation_data) >= limit:  # Exit if we have enough tweets
+            return conversation_data, last_tweet_id, False
+
+        last_tweet_id = tweet.id
+
+        parent_tweet = parents.get(str(tweet.in_reply_to))
+
+        if parent_tweet:
+            conversation = ConversationRecord(
+                parent_tweet.text, create_metrics_dict(parent_tweet),
+                tweet.text, create_metrics_dict(tweet)
+            )
+            conversation_data.append(conversation)
+            # Replies whose parent could not be fetched stay unseen,
+            # so a later run tries them again
+            seen.add(tweet.id)
+
+    return conversation_data, last_tweet_id, True
+
+
+@METRICS.timed('save_seconds')
+def save_conversations(conversation_data, storage, seen, near_dups):
+    storage.append(as_dicts(conversation_data))
+    seen.commit()
+    near_dups.commit()
+
+
+def main(resume=False):
     # Authentication setup
     config = ConfigParser()
     config.read('config.ini')
-    client = Client(language='en-US')
+    client = Client(language='en-US', **client_kwargs(config))
     client.load_cookies('cookies.json')
+    # Writes [Metrics] export_file every interval seconds while the script runs
+    exporter = MetricsExporter.from_config(config).start()
+    pacer = Pacer.from_config(config)
+    pacer.attach(client)
+    # Parents are fetched once per corpus, not once per reply
+    tweet_cache = TweetCache()
 
     tweet_count = 0
     tweets = None
-    conversation_data = []
+    cursor = None
+    last_tweet_id = None
+    # Conversations are appended page by page to a log next to OUTPUT_FILE
+    storage = open_storage(OUTPUT_FILE, config)
+    # Replies already turned into conversations by earlier runs
+    seen = SeenIndex(OUTPUT_FILE)
+    # Shill replies repeat one text with other links; keep the first of each
+    near_dups = NearDuplicateIndex.from_config(OUTPUT_FILE, config)
+
+    # Only replies with a resolvable parent are checked locally
+    search = FILTER.compile(QUERY, [('reply', is_reply)])
+    checkpoint = CrawlCheckpoint(search.query, PRODUCT)
+    saved = checkpoint.load() if resume else None
+    if saved and saved['cursor']:
+        cursor = saved['cursor']
+        tweet_count = saved['tweet_count']
+        last_tweet_id = saved['last_tweet_id']
+        print(f'{datetime.now()} - Resuming from checkpoint saved at {saved["updated_at"]} ({tweet_count} tweets)')
 
     while tweet_count < MINIMUM_TWEETS:  # Only continue until minimum tweets reached
         try:
-            tweets = get_tweets(tweets, client)
+            tweets = get_tweets(tweets, client, pacer, cursor, search.query)
             if not tweets:
+                checkpoint.clear()
                 break
 
-            for tweet in tweets:
-                if tweet_count >= MINIMUM_TWEETS:  # Exit if we have enough tweets
-                    break
-
-                if not is_reply(tweet):
-                    continue
-
-                likes = getattr(tweet, 'favorite_count', 0)
-                if likes < LIKES_THRESHOLD:
-                    continue
-
-                # Add base wait time between tweet processing
-                wait_time = randint(MIN_WAIT, MAX_WAIT)
-                print(f'{datetime.now()} - Waiting {wait_time} seconds before next request')
-                time.sleep(wait_time)
-
-                parent_tweet = get_parent_tweet(tweet.in_reply_to, client)
-
-                if parent_tweet:
-                    conversation = {
-                        'parent_tweet': {
-                            'text': parent_tweet.text,
-                            'metrics': create_metrics_dict(parent_tweet)
-                        },
-                        'reply': {
-                            'text': tweet.text,
-                            'metrics': create_metrics_dict(tweet)
-                        }
-                    }
-                    conversation_data.append(conversation)
-                    tweet_count += 1
-                    print(f'{datetime.now()} - Collected {tweet_count}/{MINIMUM_TWEETS} tweets')
+            conversation_data, page_last_id, page_finished = page_conversations(
+                tweets, search, seen, near_dups, tweet_cache,
+                lambda tweet_ids: fetch_tweets_by_ids(tweet_ids, client, pacer),
+                MINIMUM_TWEETS - tweet_count
+            )
+            last_tweet_id = page_last_id or last_tweet_id
+            tweet_count += len(conversation_data)
+            print(f'{datetime.now()} - Collected {tweet_count}/{MINIMUM_TWEETS} tweets')
+
+            METRICS.inc('tweets_total', len(conversation_data))
+            save_conversations(conversation_data, storage, seen, near_dups)
+            # A partially processed page keeps the previous cursor so a resumed
+            # run fetches it again; the seen index skips the replies already done
+            if page_finished:
+                checkpoint.save(tweets.next_cursor, tweet_count, last_tweet_id)
 
         except TooManyRequests as e:
             rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
-            wait_time = (rate_limit_reset - datetime.now()).total_seconds()
-            print(f'{datetime.now()} - Rate limit exceeded, waiting {wait_time} seconds')
-            time.sleep(wait_time + randint(5, 10))  # Add a small buffer
-
-    # Save results
-    output_file = f'fortyIQVortex.json'
-    with open(output_file, 'w', encoding='utf-8') as json_file:
-        json.dump(conversation_data, json_file, indent=4, ensure_ascii=False)
-
-    print(f'{datetime.now()} - Scraping completed. Collected {len(conversation_data)} conversations')
+            print(f'{datetime.now()} - Rate limit exceeded, pausing until {rate_limit_reset}')
+            METRICS.inc('rate_limited_total', endpoint='SearchTimeline')
+            pacer.rate_limited(e.rate_limit_reset + randint(5, 10))  # Add a small buffer
+
+    # Save results, including conversations collected by earlier runs
+    with METRICS.timer('save_seconds'):
+        storage.flush()
+        total = export_json(storage, OUTPUT_FILE, indent=4)
+    storage.close()
+    seen.close()
+    near_dups.close()
+    checkpoint.close()
+    tweet_cache.close()
+    # Index the new conversations when [Index] auto_update is on
+    update_index(config, [OUTPUT_FILE])
+
+    print(f'{datetime.now()} - Scraping completed. Collected {tweet_count} conversations ({total} in {OUTPUT_FILE})')
+    print(f'{datetime.now()} - {exporter.stop()}')
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=f'Collect reply/parent conversations from {TARGET_USER}')
+    parser.add_argument('--resume', action='store_true', help='continue from the cursor saved in tweet_progress.db')
+    args = parser.parse_args()
+    main(resume=args.resume)
\ No newline at end of file
@@ -0,0 +1,407 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from configparser import ConfigParser
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+
+try:
+    import h2  # Needed by httpx for HTTP/2
+except ImportError:
+    h2 = None
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# GraphQL operations captured by default when recording
+DEFAULT_ENDPOINTS = ('SearchTimeline',)
+# GraphQL operations served from the response cache
+CACHE_ENDPOINTS = ('SearchTimeline', 'TweetDetail')
+# Defaults used when config.ini has no cache options in [HTTP]
+DEFAULT_CACHE_TTL = 24 * 3600
+DEFAULT_CACHE_MAX_MB = 500
+# Set on responses served from the cache; Pacer gives their request slot back
+CACHE_HEADER = 'x-response-cache'
+# Rate-limit headers of a cached response describe a window long gone
+RATE_LIMIT_HEADERS = ('x-rate-limit-limit', 'x-rate-limit-remaining', 'x-rate-limit-reset')
+# Headers that no longer apply once the body is stored decoded
+DROPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+# Defaults for the connection pool shared by every client of a process ([Session])
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 120
+# Set by bypass_cache() for requests that must see the current state
+SKIP_CACHE = ContextVar('skip_cache', default=False)
+
+
+def endpoint_of(request):
+    return request.url.path.rsplit('/', 1)[-1]
+
+
+def request_variables(request):
+    try:
+        return json.loads(request.url.params.get('variables', '{}'))
+    except ValueError:
+        return {}
+
+
+@contextmanager
+def bypass_cache():
+    """Send the requests made inside the block to the network, not the cache.
+
+    The flag is a context variable, so it covers only the current thread or
+    asyncio task; concurrent crawls on the same client keep using the cache.
+    """
+    token = SKIP_CACHE.set(True)
+    try:
+        yield
+    finally:
+        SKIP_CACHE.reset(token)
+
+
+def request_key(request):
+    """Identify a request by endpoint and the search variables that select a page.
+
+    For GraphQL requests the key covers the operation name plus rawQuery,
+    product, count and cursor from the ``variables`` parameter; volatile
+    parameters such as feature flags are ignored.
+    """
+    endpoint = endpoint_of(request)
+    variables = request_variables(request)
+    selected = {name: variables.get(name) for name in ('rawQuery', 'product', 'count', 'cursor')}
+    return endpoint, selected
+
+
+def cache_key(request):
+    """Like request_key, but other endpoints are keyed by all their variables
+    (TweetDetail pages differ by focalTweetId, not rawQuery)"""
+    endpoint, selected = request_key(request)
+    if endpoint != 'SearchTimeline':
+        selected = request_variables(request)
+    return endpoint, selected
+
+
+def key_digest(endpoint, selected):
+    raw = json.dumps([endpoint, selected], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Passes requests to the network and saves matching responses to a directory.
+
+    Works for both twikit's async client and its synchronous one. Each
+    response is stored as ``<sha1 of request key>.json`` with its status,
+    headers and body so ReplayTransport can serve it later.
+    """
+
+    def __init__(self, directory, endpoints=DEFAULT_ENDPOINTS, transport=None):
+        self.directory = directory
+        self.endpoints = endpoints
+        self.transport = transport
+        os.makedirs(directory, exist_ok=True)
+
+    def should_record(self, request):
+        return not self.endpoints or endpoint_of(request) in self.endpoints
+
+    def save(self, request, response):
+        endpoint, selected = request_key(request)
+        record = {
+            'endpoint': endpoint,
+            'variables': selected,
+            'status_code': response.status_code,
+            'headers': [(k, v) for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS],
+            'body': response.text,
+        }
+        path = os.path.join(self.directory, key_digest(endpoint, selected) + '.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        logger.debug(f"Recorded {endpoint} response to {path}")
+
+    def handle_request(self, request):
+        if self.transport is None:
+            self.transport = httpx.HTTPTransport()
+        response = self.transport.handle_request(request)
+        if self.should_record(request):
+            response.read()
+            self.save(request, response)
+        return response
+
+    async def handle_async_request(self, request):
+        if self.transport is None:
+            self.transport = httpx.AsyncHTTPTransport()
+        response = await self.transport.handle_async_request(request)
+        if self.should_record(request):
+            await response.aread()
+            self.save(request, response)
+        return response
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    async def aclose(self):
+        if self.transport is not None:
+            await self.transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Serves responses saved by RecordingTransport without touching the network.
+
+    Requests that were never recorded get a 404 so scrapers stop cleanly.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, request):
+        endpoint, selected = request_key(request)
+        path = os.path.join(self.directory, key_digest(endpoint, selected) + '.json')
+        if not os.path.exists(path):
+            self.misses += 1
+            logger.warning(f"No recorded response for {endpoint} {selected}")
+            return httpx.Response(404, json={'errors': [{'message': 'not recorded'}]}, request=request)
+
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        self.hits += 1
+        return httpx.Response(
+            record['status_code'],
+            headers=record['headers'],
+            content=record['body'].encode('utf-8'),
+            request=request,
+        )
+
+    def handle_request(self, request):
+        return self.lookup(request)
+
+    async def handle_async_request(self, request):
+        return self.lookup(request)
+
+
+class CachingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Serves repeated requests from gzip-compressed responses on disk.
+
+    Successful GET responses of CACHE_ENDPOINTS are stored as
+    ``<sha1 of cache key>.json.gz`` and reused for ttl seconds. Requests
+    made inside bypass_cache() (the authentication test, --watch polls)
+    always go to the network. Once the directory grows past max_bytes the
+    least recently used entries are deleted. Everything else goes to the
+    wrapped transport.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_CACHE_TTL, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024,
+                 endpoints=CACHE_ENDPOINTS, transport=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.endpoints = endpoints
+        self.transport = transport
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def should_cache(self, request):
+        return (request.method == 'GET' and endpoint_of(request) in self.endpoints
+                and not SKIP_CACHE.get())
+
+    def path_for(self, request):
+        return os.path.join(self.directory, key_digest(*cache_key(request)) + '.json.gz')
+
+    def lookup(self, request):
+        """The cached response for request, or None if missing or expired"""
+        path = self.path_for(request)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - record['stored_at'] > self.ttl:
+            return None
+        # Mark as recently used for the size cap
+        os.utime(path)
+        headers = [(k, v) for k, v in record['headers'] if k.lower() not in RATE_LIMIT_HEADERS]
+        return httpx.Response(
+            record['status_code'],
+            headers=headers + [(CACHE_HEADER, 'hit')],
+            content=record['body'].encode('utf-8'),
+            request=request,
+        )
+
+    def store(self, request, response):
+        if response.status_code != 200:
+            return
+        endpoint, selected = cache_key(request)
+        record = {
+            'endpoint': endpoint,
+            'variables': selected,
+            'stored_at': time.time(),
+            'status_code': response.status_code,
+            'headers': [(k, v) for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS],
+            'body': response.text,
+        }
+        path = self.path_for(request)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is at 90% of max_bytes"""
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.directory) if entry.name.endswith('.json.gz'))
+        removed = 0
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            removed += 1
+        logger.info(f"Evicted {removed} cached responses from {self.directory}")
+
+    def cached(self, request):
+        if not self.should_cache(request):
+            return None
+        response = self.lookup(request)
+        METRICS.inc('http_cache_total', endpoint=endpoint_of(request), result='hit' if response else 'miss')
+        return response
+
+    def handle_request(self, request):
+        response = self.cached(request)
+        if response is not None:
+            return response
+        if self.transport is None:
+            self.transport = httpx.HTTPTransport()
+        response = self.transport.handle_request(request)
+        if self.should_cache(request):
+            response.read()
+            self.store(request, response)
+        return response
+
+    async def handle_async_request(self, request):
+        response = self.cached(request)
+        if response is not None:
+            return response
+        if self.transport is None:
+            self.transport = httpx.AsyncHTTPTransport()
+        response = await self.transport.handle_async_request(request)
+        if self.should_cache(request):
+            await response.aread()
+            self.store(request, response)
+        return response
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    async def aclose(self):
+        if self.transport is not None:
+            await self.transport.aclose()
+
+
+class SharedTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """One keep-alive connection pool for all the twikit clients of a process.
+
+    Clients (and the transports wrapping this one) keep their own cookies and
+    headers but send requests over the same connections, so a new client or
+    query reuses an open TLS connection instead of handshaking again.
+    Closing a client leaves the pool open; it lives as long as the process.
+    The async pool belongs to the event loop that first used it.
+    """
+
+    def __init__(self, http2=False, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive=DEFAULT_MAX_KEEPALIVE, keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY):
+        if http2 and h2 is None:
+            logger.warning("HTTP/2 requires the h2 package (pip install httpx[http2]), using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.lock = threading.Lock()
+        self.transport = None
+        self.async_transport = None
+
+    def handle_request(self, request):
+        with self.lock:
+            if self.transport is None:
+                self.transport = httpx.HTTPTransport(http2=self.http2, limits=self.limits)
+        return self.transport.handle_request(request)
+
+    async def handle_async_request(self, request):
+        if self.async_transport is None:
+            self.async_transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits)
+        return await self.async_transport.handle_async_request(request)
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+# SharedTransport per pool settings, created on first use
+SHARED_TRANSPORTS = {}
+
+
+def shared_transport(config=None):
+    """The process-wide SharedTransport for the [Session] pool settings"""
+    config = config if config is not None else ConfigParser()
+    settings = (
+        config.getboolean('Session', 'http2', fallback=False),
+        config.getint('Session', 'max_connections', fallback=DEFAULT_MAX_CONNECTIONS),
+        config.getint('Session', 'max_keepalive', fallback=DEFAULT_MAX_KEEPALIVE),
+        config.getfloat('Session', 'keepalive_expiry', fallback=DEFAULT_KEEPALIVE_EXPIRY),
+    )
+    if settings not in SHARED_TRANSPORTS:
+        SHARED_TRANSPORTS[settings] = SharedTransport(*settings)
+    return SHARED_TRANSPORTS[settings]
+
+
+def client_kwargs(config=None):
+    """Extra keyword arguments for twikit's Client from the [HTTP] section.
+
+    record_dir saves SearchTimeline responses while crawling; replay_dir
+    serves previously recorded responses instead of using the network.
+    cache_dir keeps responses for cache_ttl seconds so reruns reuse them.
+    Requests that reach the network go through the process-wide
+    SharedTransport.
+    """
+    if config is None:
+        return {'transport': shared_transport()}
+    replay_dir = config.get('HTTP', 'replay_dir', fallback='')
+    record_dir = config.get('HTTP', 'record_dir', fallback='')
+    cache_dir = config.get('HTTP', 'cache_dir', fallback='')
+    if replay_dir:
+        logger.info(f"Replaying recorded responses from {replay_dir}")
+        return {'transport': ReplayTransport(replay_dir)}
+    transport = shared_transport(config)
+    if record_dir:
+        logger.info(f"Recording responses to {record_dir}")
+        transport = RecordingTransport(record_dir, transport=transport)
+    if cache_dir:
+        logger.info(f"Caching responses in {cache_dir}")
+        transport = CachingTransport(
+            cache_dir,
+            ttl=config.getfloat('HTTP', 'cache_ttl', fallback=DEFAULT_CACHE_TTL),
+            max_bytes=int(config.getfloat('HTTP', 'cache_max_mb', fallback=DEFAULT_CACHE_MAX_MB) * 1024 * 1024),
+            transport=transport,
+        )
+    return {'transport': transport}
@@ -0,0 +1,351 @@
+"""Shared crawl job queue with leases, so any number of workers can split the work.
+
+Jobs live in a SQLite database in WAL mode (jobs.db), which every worker
+process on the host opens. A worker leases one job at a time and renews the
+lease with heartbeats while it crawls. Each heartbeat also stores the job's
+search cursor, so if the worker dies its lease expires and the next worker
+continues from the last saved page instead of the first. Jobs that keep
+failing are retried up to max_attempts times.
+
+    python jobqueue.py add --query "(ai) min_faves:100" --target 500
+    python jobqueue.py add --queries queries.txt
+    python jobqueue.py work                      # run a worker until the queue is empty
+    python jobqueue.py status
+
+JobQueue's methods (add, lease, heartbeat, complete, fail) are the whole
+protocol, so a queue server can stand in for the SQLite file later.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from configparser import ConfigParser
+
+from twitterscrap import TwitterScraper, PRODUCT, MINIMUM_TWEETS, CONFIG_FILE
+from scheduler import load_queries, make_job
+from progress import CrawlCheckpoint
+from metrics import METRICS, MetricsExporter
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = 'jobs.db'
+DEFAULT_LEASE = 300
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds an idle worker waits before asking for a job again
+POLL_INTERVAL = 10
+
+JOB_COLUMNS = ('id', 'query', 'product', 'target', 'output', 'status', 'attempts', 'max_attempts',
+               'lease_owner', 'lease_expires', 'cursor', 'tweet_count', 'last_tweet_id', 'last_error')
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+
+class JobQueue:
+    """Crawl jobs with leases in a SQLite database shared by the workers.
+
+    A job is pending, leased (to one worker until lease_expires), done or
+    failed. A leased job whose lease has expired is leased again to the next
+    worker that asks, counting as a new attempt.
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY, '
+            'query TEXT NOT NULL, '
+            'product TEXT NOT NULL, '
+            'target INTEGER NOT NULL, '
+            'output TEXT NOT NULL, '
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'max_attempts INTEGER NOT NULL, '
+            'lease_owner TEXT, '
+            'lease_expires REAL, '
+            'cursor TEXT, '
+            'tweet_count INTEGER NOT NULL DEFAULT 0, '
+            'last_tweet_id TEXT, '
+            'last_error TEXT, '
+            'updated_at REAL, '
+            'UNIQUE (query, product, output))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires)')
+
+    def add(self, query, target=MINIMUM_TWEETS, output=None, product=PRODUCT,
+            max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Queue a job. Returns its id, or None if the same job is already queued"""
+        job = make_job(query, target, output)
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO jobs (query, product, target, output, max_attempts, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (job['query'], product, job['target'], job['output'], max_attempts, time.time())
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE):
+        """Lease the oldest available job to worker_id. Returns it as a dict, or None"""
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock first, so two workers never
+        # lease the same job
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Expired leases that used up their attempts are given up on
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_owner = NULL, "
+                "last_error = COALESCE(last_error, 'lease expired'), updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            row = self.conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            job = dict(zip(JOB_COLUMNS, row))
+            if job['status'] == 'leased':
+                logger.warning(f"Lease of job {job['id']} held by {job['lease_owner']} expired, taking over")
+            self.conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, job['id'])
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        job.update(status='leased', lease_owner=worker_id, lease_expires=now + lease_seconds,
+                   attempts=job['attempts'] + 1)
+        return job
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE, progress=None):
+        """Extend the lease and save progress (a CrawlCheckpoint.load() dict).
+
+        Returns False if worker_id no longer holds the lease.
+        """
+        now = time.time()
+        progress = progress or {}
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ?, "
+            "cursor = COALESCE(?, cursor), tweet_count = COALESCE(?, tweet_count), "
+            "last_tweet_id = COALESCE(?, last_tweet_id) "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + lease_seconds, now, progress.get('cursor'), progress.get('tweet_count'),
+             progress.get('last_tweet_id'), job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id):
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (time.time(), job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        """Give a job back after an error: pending again, or failed after max_attempts
+        (or right away without retry)"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = CASE WHEN ? AND attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+            "lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (retry, str(error), time.time(), job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def retry_failed(self):
+        """Make failed jobs pending again with fresh attempts. Returns how many"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'",
+            (time.time(),)
+        )
+        return cursor.rowcount
+
+    def jobs(self):
+        return [dict(zip(JOB_COLUMNS, row)) for row in self.conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY id"
+        )]
+
+    def counts(self):
+        """{status: number of jobs}"""
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+    def close(self):
+        self.conn.close()
+
+
+class Worker:
+    """Leases jobs from a JobQueue and crawls each with a TwitterScraper.
+
+    One authenticated client is shared by all the worker's jobs. Saved
+    cursors travel with the job, so a job taken over from a dead worker
+    resumes from that worker's last heartbeat. A crawl that gives up after
+    repeated errors fails the job (to be retried); one whose search runs
+    out before the job's target fails it for good.
+    """
+
+    def __init__(self, queue, worker_id=None, lease_seconds=DEFAULT_LEASE):
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.client_source = None  # First scraper; its client/pool/pacer are reused
+
+    async def crawl(self, job):
+        """Crawl job while renewing its lease. Returns the tweets collected, or None if the lease was lost"""
+        scraper = TwitterScraper(query=job['query'], minimum_tweets=job['target'],
+                                 output_file=job['output'], product=job['product'])
+        checkpoint = CrawlCheckpoint(scraper.query, scraper.product)
+        crawl_task = None
+        try:
+            if self.client_source is None:
+                await scraper.initialize_client()
+                self.client_source = scraper
+            else:
+                scraper.client = self.client_source.client
+                scraper.pool = self.client_source.pool
+                scraper.pacer = self.client_source.pacer
+
+            if job['cursor']:
+                # Continue from the page the previous holder of the job reached
+                checkpoint.save(job['cursor'], job['tweet_count'], job['last_tweet_id'])
+            else:
+                # The local checkpoint of the query belongs to some other run
+                checkpoint.clear()
+
+            crawl_task = asyncio.create_task(scraper.scrape_tweets(resume=True))
+            while not crawl_task.done():
+                await asyncio.wait([crawl_task], timeout=self.lease_seconds / 3)
+                if crawl_task.done():
+                    break
+                if not self.queue.heartbeat(job['id'], self.worker_id, self.lease_seconds, checkpoint.load()):
+                    logger.warning(f"Lost the lease on job {job['id']}, stopping it")
+                    return None
+            tweet_count = await crawl_task
+            # An exhausted search has cleared its checkpoint; keep the count
+            progress = checkpoint.load() or {'tweet_count': tweet_count}
+            self.queue.heartbeat(job['id'], self.worker_id, self.lease_seconds, progress)
+            return tweet_count
+        finally:
+            if crawl_task is not None and not crawl_task.done():
+                # Lost lease, or the worker itself was cancelled
+                crawl_task.cancel()
+                await asyncio.gather(crawl_task, return_exceptions=True)
+            checkpoint.close()
+            scraper.close()
+
+    async def run(self, once=False):
+        """Work through jobs; with once, stop when none is available. Returns jobs completed"""
+        completed = 0
+        logger.info(f"Worker {self.worker_id} started")
+        while True:
+            job = self.queue.lease(self.worker_id, self.lease_seconds)
+            if job is None:
+                if once:
+                    break
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            logger.info(f"Job {job['id']} (attempt {job['attempts']}/{job['max_attempts']}): "
+                        f"'{job['query']}' -> {job['output']}")
+            try:
+                tweet_count = await self.crawl(job)
+                if tweet_count is None:
+                    pass  # Lost the lease; the job is someone else's now
+                elif tweet_count < job['target']:
+                    # Another attempt would page through the same exhausted search
+                    error = f"search ran out after {tweet_count} of {job['target']} tweets"
+                    logger.error(f"Job {job['id']} failed: {error}")
+                    self.queue.fail(job['id'], self.worker_id, error, retry=False)
+                    METRICS.inc('jobs_total', result='failed')
+                else:
+                    self.queue.complete(job['id'], self.worker_id)
+                    completed += 1
+                    METRICS.inc('jobs_total', result='done')
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                self.queue.fail(job['id'], self.worker_id, e)
+                METRICS.inc('jobs_total', result='failed')
+        logger.info(f"Worker {self.worker_id} finished {completed} jobs")
+        return completed
+
+
+async def work(args):
+    config = ConfigParser()
+    config.read(CONFIG_FILE)
+    queue = JobQueue(args.db)
+    worker = Worker(queue, worker_id=args.worker_id, lease_seconds=args.lease)
+    exporter = MetricsExporter.from_config(config).start()
+    try:
+        await worker.run(once=not args.forever)
+    finally:
+        logger.info(exporter.stop())
+        queue.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared crawl job queue")
+    parser.add_argument('--db', default=JOBS_DB, help="queue database (default: jobs.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="queue crawl jobs")
+    add.add_argument('--queries', help="file with one query (or JSON job) per line")
+    add.add_argument('--query', action='append', default=[], help="query to crawl (repeatable)")
+    add.add_argument('--target', type=int, default=MINIMUM_TWEETS, help="tweets per --query")
+    add.add_argument('--product', default=PRODUCT)
+    add.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    work_parser = commands.add_parser('work', help="run a worker")
+    work_parser.add_argument('--worker-id', help="default: <host>-<pid>-<random>")
+    work_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE, help="lease length in seconds")
+    work_parser.add_argument('--forever', action='store_true', help="keep waiting for new jobs when the queue is empty")
+
+    commands.add_parser('status', help="list jobs")
+    commands.add_parser('retry-failed', help="make failed jobs pending again")
+    args = parser.parse_args()
+
+    if args.command == 'work':
+        return asyncio.run(work(args))
+
+    queue = JobQueue(args.db)
+    try:
+        if args.command == 'add':
+            jobs = load_queries(args.queries) if args.queries else []
+            jobs += [make_job(query, target=args.target) for query in args.query]
+            added = sum(
+                queue.add(job['query'], job['target'], job['output'], args.product, args.max_attempts) is not None
+                for job in jobs
+            )
+            print(f"Queued {added} jobs ({len(jobs) - added} already queued)")
+        elif args.command == 'retry-failed':
+            print(f"Requeued {queue.retry_failed()} failed jobs")
+        else:
+            for job in queue.jobs():
+                line = (f"{job['id']:>4}  {job['status']:<8} {job['tweet_count']:>6}/{job['target']:<6} "
+                        f"attempts {job['attempts']}/{job['max_attempts']}  {job['query']!r} -> {job['output']}")
+                if job['status'] == 'leased':
+                    line += f"  [{job['lease_owner']}, {job['lease_expires'] - time.time():.0f}s left]"
+                if job['last_error']:
+                    line += f"  last error: {job['last_error']}"
+                print(line)
+            print(', '.join(f"{count} {status}" for status, count in sorted(queue.counts().items())) or "No jobs")
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,78 +1,188 @@
 from twikit import Client, TooManyRequests
-import time
 from datetime import datetime
-import csv
 from configparser import ConfigParser
 from random import randint
+import argparse
+
+from dedup import SeenIndex
+from progress import CrawlCheckpoint
+from pacing import Pacer
+from sinks import open_sink
+from sentiment import SentimentStage, scorer_from_config
+from http_transport import client_kwargs
+from metrics import METRICS, MetricsExporter
+from neardup import NearDuplicateIndex
+from watch import Watcher
+from search_index import update_index
+from entities import extract_page
 
 minimum_tweets=500
 #For more complicated search, go on twitter, advanced search, enter requirements, and copy and past that search into query.
 query = 'SStock Market min_faves:5 lang:en until:2024-09-25 since:2024-09-01'
-
-
-def get_tweets(tweets):
+product = 'Top'
+# Output columns and their types (used by the Parquet sink)
+columns = [('Tweet_count', 'int'), ('Username', 'str'), ('Text', 'str'), ('Created at', 'timestamp'),
+           ('Retweets', 'int'), ('Likes', 'int'), ('Replies', 'int'), ('Quote Tweets', 'int'),
+           ('Hashtags', 'str'), ('Mentions', 'str'), ('Media Presence', 'str'), ('URLs', 'str'),
+           ('Follower Count', 'int'), ('Sentiment Score', 'float')]
+
+
+@METRICS.timed('get_tweets_batch_seconds')
+def get_tweets(tweets, client, pacer, cursor=None):
+    # Wait as long as the remaining quota requires
+    pacer.wait_sync()
     if tweets is None:
         print(f'{datetime.now()} - Getting tweets...')
-        # get tweets
-        tweets = client.search_tweet(query, product='Top')
+        # get tweets (from the saved cursor when resuming)
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            tweets = client.search_tweet(query, product=product, cursor=cursor)
     else:
-        wait_time = randint(10,20)
-        print(f'{datetime.now()} - Getting next tweets after {wait_time} seconds...')
-        time.sleep(wait_time)
-        tweets = tweets.next()
+        print(f'{datetime.now()} - Getting next tweets...')
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            tweets = tweets.next()
+    METRICS.inc('requests_total', endpoint='SearchTimeline')
 
     return tweets
 
 
-# login credentials
-
-config = ConfigParser()
-config.read('config.ini')
-username = config['X']['username']
-email = config['X']['email']
-password = config['X']['password']
-
-#Create csv file
-with open('tweets.csv', 'w', newline='', encoding='utf-8') as file:
-    writer = csv.writer(file)
-    writer.writerow(['Tweet_count', 'Username', 'Text', 'Created at', 'Retweets', 'Likes'])
-
-# Autheticate to X.com
-# 1) Use the login credentials 2) Use cookies.
-client = Client(language='en-US')
-#client.login(auth_info_1=username, auth_info_2=email, password=password)
-#client.save_cookies('cookies.json')
-client.load_cookies('cookies.json')
-
-tweet_count = 0
-tweets=None
-
-while tweet_count < minimum_tweets:
-    try:
-        tweets = get_tweets(tweets)
-    except TooManyRequests as e:
-        rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
-        print(f'{datetime.now()} - rate limit reached. waiting until {rate_limit_reset} ')
-        wait_time = rate_limit_reset - datetime.now()
-        time.sleep(wait_time.total_seconds())
-        continue
-
-
-    if not tweets:
-        print(f'{datetime.now()} - No more tweets found on topic')
-        break
-
-
-
-    for tweet in tweets:
-        tweet_count += 1
-        tweet_data = [tweet_count, tweet.user.name, tweet.text, tweet.created_at, tweet.retweet_count,
-                      tweet.favorite_count]
-
-        with open('tweets.csv', 'a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(tweet_data)
-
-    print(f'{datetime.now()} - Got {tweet_count} tweets')
-
-print(f'{datetime.now()} - Done! Got {tweet_count} tweets found')
+def tweet_row(tweet, entities, row_number):
+    row = {
+        'Tweet_count': row_number,
+        'Username': tweet.user.name,
+        'Text': tweet.text,
+        'Created at': tweet.created_at,
+        'Retweets': tweet.retweet_count,
+        'Likes': tweet.favorite_count,
+        'Replies': tweet.reply_count,
+        'Quote Tweets': tweet.quote_count,
+        'Follower Count': tweet.user.followers_count,
+    }
+    row.update(entities.columns())
+    return row
+
+
+def write_page(page, seen, near_dups, sink, row_count):
+    # Buffer a row per new tweet of the page, numbered after row_count;
+    # returns the tweets written
+    new_tweets = near_dups.filter_new(seen.filter_new(page))
+    # Hashtags, mentions, URLs and media of the whole page in one pass
+    for row_number, (tweet, entities) in enumerate(zip(new_tweets, extract_page(new_tweets)), row_count + 1):
+        sink.write(tweet_row(tweet, entities, row_number))
+    METRICS.inc('tweets_total', len(new_tweets))
+    return new_tweets
+
+
+@METRICS.timed('save_seconds')
+def commit_page(sink, seen, near_dups, checkpoint=None, tweets=None, tweet_count=0, last_tweet_id=None):
+    # Flush buffered rows, then persist the seen IDs and cursor they cover
+    sink.flush()
+    seen.commit()
+    near_dups.commit()
+    if checkpoint is not None and tweets:
+        checkpoint.save(tweets.next_cursor, tweet_count, last_tweet_id)
+
+
+def main(args):
+    # login credentials
+
+    config = ConfigParser()
+    config.read('config.ini')
+    username = config['X']['username']
+    email = config['X']['email']
+    password = config['X']['password']
+
+    # Writes [Metrics] export_file every interval seconds while the script runs
+    exporter = MetricsExporter.from_config(config).start()
+
+    #Open csv (and/or parquet) output, kept open and appended to across runs
+    #Rows are scored for sentiment a batch at a time before they are written
+    sink = SentimentStage(open_sink('tweets.csv', columns, config), scorer_from_config(config))
+
+    seen = SeenIndex('tweets.csv')
+    # Drops (or flags) tweets repeating an earlier text with other links/mentions
+    near_dups = NearDuplicateIndex.from_config('tweets.csv', config)
+
+    # Autheticate to X.com
+    # 1) Use the login credentials 2) Use cookies.
+    client = Client(language='en-US', **client_kwargs(config))
+    #client.login(auth_info_1=username, auth_info_2=email, password=password)
+    #client.save_cookies('cookies.json')
+    client.load_cookies('cookies.json')
+
+    # Paces requests from the rate-limit headers of each response
+    pacer = Pacer.from_config(config)
+    pacer.attach(client)
+
+    tweet_count = 0
+    tweets=None
+    cursor = None
+    last_tweet_id = None
+    # Tweet_count numbers the rows of the file, so it continues after earlier runs
+    row_count = sink.existing_rows
+
+    checkpoint = CrawlCheckpoint(query, product)
+    saved = checkpoint.load() if args.resume else None
+    if saved and saved['cursor']:
+        cursor = saved['cursor']
+        tweet_count = saved['tweet_count']
+        last_tweet_id = saved['last_tweet_id']
+        print(f'{datetime.now()} - Resuming from checkpoint saved at {saved["updated_at"]} ({tweet_count} tweets)')
+
+    def emit(new_tweets):
+        # Watch mode: write every poll right away
+        nonlocal tweet_count, row_count
+        written = write_page(new_tweets, seen, near_dups, sink, row_count)
+        tweet_count += len(written)
+        row_count += len(written)
+        commit_page(sink, seen, near_dups)
+        print(f'{datetime.now()} - Got {tweet_count} tweets')
+
+    if args.watch:
+        # Poll for tweets newer than the last one written until Ctrl+C
+        print(f'{datetime.now()} - Watching: {query}')
+        Watcher.from_config(client, query, pacer, config).run(emit)
+
+    while not args.watch and tweet_count < minimum_tweets:
+        try:
+            tweets = get_tweets(tweets, client, pacer, cursor)
+        except TooManyRequests as e:
+            rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
+            print(f'{datetime.now()} - rate limit reached. waiting until {rate_limit_reset} ')
+            METRICS.inc('rate_limited_total', endpoint='SearchTimeline')
+            # The pacer holds the retry until the reset (never a negative wait)
+            pacer.rate_limited(e.rate_limit_reset + randint(5, 10))  # Add a small buffer
+            continue
+
+
+        if not tweets:
+            print(f'{datetime.now()} - No more tweets found on topic')
+            checkpoint.clear()
+            break
+
+
+
+        # Write the page before saving its cursor, so --resume never skips rows
+        written = write_page(tweets, seen, near_dups, sink, row_count)
+        tweet_count += len(written)
+        row_count += len(written)
+        if written:
+            last_tweet_id = written[-1].id
+        commit_page(sink, seen, near_dups, checkpoint, tweets, tweet_count, last_tweet_id)
+        print(f'{datetime.now()} - Got {tweet_count} tweets')
+
+    commit_page(sink, seen, near_dups, checkpoint, tweets, tweet_count, last_tweet_id)
+    sink.close()
+    seen.close()
+    near_dups.close()
+    checkpoint.close()
+    # Index the new rows when [Index] auto_update is on
+    update_index(config, ['tweets.csv', 'tweets.parquet'])
+    print(f'{datetime.now()} - Done! Got {tweet_count} tweets found')
+    print(f'{datetime.now()} - {exporter.stop()}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scrape tweets into tweets.csv')
+    parser.add_argument('--resume', action='store_true', help='continue from the cursor saved in tweet_progress.db')
+    parser.add_argument('--watch', action='store_true', help='keep polling for new tweets until Ctrl+C (see [Watch] in config.ini)')
+    main(parser.parse_args())
@@ -0,0 +1,271 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when config.ini has no [Metrics] section
+DEFAULT_INTERVAL = 30
+PREFIX = 'twitterscrap_'
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, float('inf'))
+
+HELP = {
+    'requests_total': 'Search/lookup requests sent',
+    'http_responses_total': 'HTTP responses received, by endpoint and status',
+    'rate_limited_total': 'Rate-limit (429) errors',
+    'tweets_total': 'Tweets collected',
+    'near_duplicates_total': 'Near-duplicate tweets dropped or flagged',
+    'filtered_total': 'Fetched tweets dropped by local filter predicates',
+    'indexed_total': 'Tweets added to the full-text search index',
+    'http_cache_total': 'Response cache lookups, by endpoint and hit/miss',
+    'bytes_written_total': 'Bytes written to output files',
+    'request_seconds': 'Latency of search/lookup requests',
+    'extract_seconds': 'Time spent extracting one tweet',
+    'save_seconds': 'Time spent saving collected data',
+    'index_seconds': 'Time spent updating the full-text search index',
+    'sleep_seconds': 'Time spent sleeping, by reason',
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in key) + '}'
+
+
+class MetricsRegistry:
+    """Counters and histograms for one run, shared by every module.
+
+    Metrics are addressed by name plus optional labels, e.g.
+    ``METRICS.inc('rate_limited_total', source='search')``.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator recording each call's duration, for plain and async functions"""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def sleep(self, seconds, reason):
+        """Record a sleep of the given length (call right before sleeping)"""
+        if seconds > 0:
+            self.observe('sleep_seconds', seconds, reason=reason)
+
+    def total(self, name):
+        """Sum of a counter over all its labels"""
+        with self.lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def snapshot(self):
+        """JSON-ready dict of every metric"""
+        elapsed = time.time() - self.started
+        with self.lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': h.count,
+                    'sum': h.sum,
+                    'p50': h.quantile(0.5),
+                    'p99': h.quantile(0.99),
+                    'buckets': {str(bound): count for bound, count in zip(h.buckets, h.counts)},
+                }
+                for (name, labels), h in sorted(self.histograms.items())
+            ]
+        tweets = sum(c['value'] for c in counters if c['name'] == 'tweets_total')
+        return {
+            'timestamp': time.time(),
+            'elapsed_seconds': elapsed,
+            'tweets_per_second': tweets / elapsed if elapsed else 0.0,
+            'counters': counters,
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f'# HELP {PREFIX}{name} {HELP[name]}')
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                describe(name, 'counter')
+                lines.append(f'{PREFIX}{name}{format_labels(labels)} {value}')
+            for (name, labels), h in sorted(self.histograms.items()):
+                describe(name, 'histogram')
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{PREFIX}{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{format_labels(labels)} {h.sum}')
+                lines.append(f'{PREFIX}{name}_count{format_labels(labels)} {h.count}')
+        lines.append(f'# TYPE {PREFIX}run_seconds gauge')
+        lines.append(f'{PREFIX}run_seconds {time.time() - self.started}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write a JSON snapshot (*.json) or a Prometheus text file (anything else)"""
+        if path.endswith('.json'):
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.to_prometheus()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        """Human-readable end-of-run summary"""
+        snapshot = self.snapshot()
+        lines = [
+            f"Run summary: {snapshot['elapsed_seconds']:.1f}s, "
+            f"{self.total('tweets_total')} tweets ({snapshot['tweets_per_second']:.2f}/s), "
+            f"{self.total('requests_total')} requests, {self.total('rate_limited_total')} rate limits, "
+            f"{self.total('bytes_written_total')} bytes written"
+        ]
+        for h in snapshot['histograms']:
+            labels = ','.join(f'{k}={v}' for k, v in h['labels'].items())
+            name = f"{h['name']}[{labels}]" if labels else h['name']
+            lines.append(f"  {name}: {h['count']} calls, {h['sum']:.3f}s total, "
+                         f"p50 <= {h['p50']}s, p99 <= {h['p99']}s")
+        return '\n'.join(lines)
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsExporter:
+    """Writes the registry to a file every interval seconds from a daemon thread.
+
+    Without a path nothing is exported during the run; stop() still returns
+    the end-of-run summary.
+    """
+
+    def __init__(self, path=None, interval=DEFAULT_INTERVAL, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_config(cls, config, metrics=METRICS):
+        """Exporter for [Metrics] export_file / interval in config.ini"""
+        return cls(
+            path=config.get('Metrics', 'export_file', fallback='') or None,
+            interval=config.getfloat('Metrics', 'interval', fallback=DEFAULT_INTERVAL),
+            metrics=metrics,
+        )
+
+    def export(self):
+        try:
+            self.metrics.write(self.path)
+        except OSError as e:
+            logger.error(f"Error writing metrics to {self.path}: {e}")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def start(self):
+        if self.path and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='metrics-exporter', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop exporting, write the final snapshot and return the run summary"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.path:
+            self.export()
+        return self.metrics.summary()
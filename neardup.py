@@ -0,0 +1,294 @@
+"""Streaming near-duplicate detection with MinHash and locality-sensitive hashing.
+
+Shill replies often repeat one text with a different t.co link or @mention,
+so exact-text or ID dedup misses them. Each tweet's text is normalized
+(lowercased, URLs and mentions removed) and cut into 5-byte shingles, and
+its MinHash signature is split into bands. Tweets sharing a band bucket are
+candidates; a candidate whose estimated Jaccard similarity reaches the
+threshold makes the new tweet a near-duplicate. Only the first tweet of each
+group is indexed, so lookups cost one primary-key probe per band however
+many tweets have been seen.
+
+    python neardup.py fortyIQ.json          # report near-duplicate groups in an output file
+"""
+import argparse
+import json
+import logging
+import re
+import sqlite3
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_DB = 'near_duplicates.db'
+# Defaults used when config.ini has no [Dedup] section
+DEFAULT_MODE = 'drop'
+DEFAULT_THRESHOLD = 0.8
+MODES = ('drop', 'flag', 'off')
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+# 16 bands of 4 rows: pairs at the default threshold collide in some band
+# with probability > 0.999, unrelated tweets almost never do
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Texts hashed per NumPy batch, which bounds the (NUM_PERM x shingles) matrix
+CHUNK_SIZE = 1000
+SEED = 20240726
+
+BUCKET_QUERY = ' UNION ALL '.join(
+    ['SELECT tweet_id FROM buckets WHERE namespace = ? AND band = ? AND bucket = ?'] * BANDS
+)
+
+URL = re.compile(r'https?://\S+|www\.\S+')
+MENTION = re.compile(r'@\w+')
+# Keeps words, $cashtags, #hashtags and contract addresses
+PUNCTUATION = re.compile(r'[^\w$#]+')
+
+rng = np.random.default_rng(SEED)
+# Multiply-shift hash functions, one per permutation: (a * x + b) mod 2^64 >> 32
+PERM_A = rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+PERM_B = rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+# Combine a band's rows into one bucket key
+BAND_MIX = rng.integers(1, 2 ** 63, ROWS, dtype=np.uint64) | np.uint64(1)
+BYTE_WEIGHTS = np.uint64(256) ** np.arange(SHINGLE_SIZE, dtype=np.uint64)
+
+
+def normalize(text):
+    """Lowercase text and drop URLs, mentions and punctuation"""
+    text = MENTION.sub(' ', URL.sub(' ', (text or '').lower()))
+    return ' '.join(PUNCTUATION.sub(' ', text).split())
+
+
+def signatures(texts, normalized=False):
+    """MinHash signatures (len(texts) x NUM_PERM, uint32) of texts.
+
+    Pass normalized=True for texts already passed through normalize().
+    """
+    if not normalized:
+        texts = [normalize(text) for text in texts]
+    result = np.zeros((len(texts), NUM_PERM), dtype=np.uint32)
+    for start in range(0, len(texts), CHUNK_SIZE):
+        docs = [text.encode('utf-8').ljust(SHINGLE_SIZE) for text in texts[start:start + CHUNK_SIZE]]
+        lengths = np.fromiter(map(len, docs), dtype=np.int64, count=len(docs))
+        data = np.frombuffer(b''.join(docs), dtype=np.uint8).astype(np.uint64)
+
+        # Every 5-byte window of the joined buffer as an exact 40-bit value;
+        # keep only the windows that lie inside one document
+        windows = sliding_window_view(data, SHINGLE_SIZE) @ BYTE_WEIGHTS
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        counts = lengths - SHINGLE_SIZE + 1
+        firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        shingles = windows[np.arange(counts.sum()) + np.repeat(offsets - firsts, counts)]
+
+        hashed = (PERM_A[:, None] * shingles[None, :] + PERM_B[:, None]) >> np.uint64(32)
+        result[start:start + len(docs)] = np.minimum.reduceat(hashed, firsts, axis=1).T
+    return result
+
+
+def band_keys(signature):
+    """One signed 64-bit bucket key per band of a signature"""
+    bands = signature.astype(np.uint64).reshape(BANDS, ROWS)
+    return (bands * BAND_MIX).sum(axis=1).view(np.int64).tolist()
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash LSH index of the tweets collected for one output.
+
+    Like SeenIndex, it is namespaced by output file; it lives in its own
+    near_duplicates.db so its writes never wait on tweet_progress.db.
+    mode 'drop' removes near-duplicates in filter_new(), 'flag' keeps them
+    but records and logs them, 'off' disables the check.
+    """
+
+    def __init__(self, namespace, path=NEAR_DUP_DB, threshold=DEFAULT_THRESHOLD, mode=DEFAULT_MODE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown near-duplicate mode '{mode}' (expected drop, flag or off)")
+        self.namespace = namespace
+        self.threshold = threshold
+        self.mode = mode
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS signatures ('
+            'namespace TEXT NOT NULL, '
+            'tweet_id TEXT NOT NULL, '
+            'signature BLOB NOT NULL, '
+            'PRIMARY KEY (namespace, tweet_id)) WITHOUT ROWID'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'namespace TEXT NOT NULL, '
+            'band INTEGER NOT NULL, '
+            'bucket INTEGER NOT NULL, '
+            'tweet_id TEXT NOT NULL, '
+            'PRIMARY KEY (namespace, band, bucket)) WITHOUT ROWID'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS duplicates ('
+            'namespace TEXT NOT NULL, '
+            'tweet_id TEXT NOT NULL, '
+            'original_id TEXT NOT NULL, '
+            'similarity REAL NOT NULL, '
+            'PRIMARY KEY (namespace, tweet_id)) WITHOUT ROWID'
+        )
+        self.conn.commit()
+
+    @classmethod
+    def from_config(cls, namespace, config=None):
+        """Index configured by [Dedup] near_duplicates / threshold in config.ini"""
+        if config is None:
+            return cls(namespace)
+        return cls(
+            namespace,
+            threshold=config.getfloat('Dedup', 'threshold', fallback=DEFAULT_THRESHOLD),
+            mode=config.get('Dedup', 'near_duplicates', fallback=DEFAULT_MODE).strip().lower() or DEFAULT_MODE,
+        )
+
+    def indexed(self, tweet_ids):
+        """The subset of tweet_ids already in the index"""
+        tweet_ids = list(tweet_ids)
+        placeholders = ','.join('?' * len(tweet_ids))
+        rows = self.conn.execute(
+            f'SELECT tweet_id FROM signatures WHERE namespace = ? AND tweet_id IN ({placeholders})',
+            [self.namespace] + tweet_ids
+        )
+        return {tweet_id for tweet_id, in rows}
+
+    def match(self, tweet_id, signature):
+        """(original id, similarity) of the best indexed near-duplicate, or None.
+
+        A tweet without a match is added to the index.
+        """
+        keys = band_keys(signature)
+        # One primary-key probe per band, sent as a single statement
+        candidates = {candidate_id for candidate_id, in self.conn.execute(
+            BUCKET_QUERY, [value for band, key in enumerate(keys) for value in (self.namespace, band, key)]
+        )}
+        if candidates:
+            placeholders = ','.join('?' * len(candidates))
+            rows = self.conn.execute(
+                f'SELECT tweet_id, signature FROM signatures WHERE namespace = ? AND tweet_id IN ({placeholders})',
+                [self.namespace] + list(candidates)
+            ).fetchall()
+            matrix = np.frombuffer(b''.join(data for _, data in rows), dtype=np.uint32).reshape(-1, NUM_PERM)
+            scores = np.count_nonzero(matrix == signature, axis=1) / NUM_PERM
+            best = int(scores.argmax())
+            if scores[best] >= self.threshold:
+                return rows[best][0], float(scores[best])
+
+        self.conn.execute(
+            'INSERT INTO signatures (namespace, tweet_id, signature) VALUES (?, ?, ?)',
+            (self.namespace, tweet_id, signature.tobytes())
+        )
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO buckets (namespace, band, bucket, tweet_id) VALUES (?, ?, ?, ?)',
+            [(self.namespace, band, key, tweet_id) for band, key in enumerate(keys)]
+        )
+        return None
+
+    def check(self, tweets, text=lambda tweet: tweet.text):
+        """Return [(tweet, original id or None)] for a page, indexing the originals"""
+        if self.mode == 'off':
+            return [(tweet, None) for tweet in tweets]
+        tweets = list(tweets)
+        if not tweets:
+            return []
+        texts = [normalize(text(tweet)) for tweet in tweets]
+        sigs = signatures(texts, normalized=True)
+        # Tweets indexed already (e.g. by an interrupted run) are originals
+        indexed = self.indexed(str(tweet.id) for tweet in tweets)
+        results = []
+        for tweet, body, signature in zip(tweets, texts, sigs):
+            tweet_id = str(tweet.id)
+            found = self.match(tweet_id, signature) if body and tweet_id not in indexed else None
+            if found is not None:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO duplicates (namespace, tweet_id, original_id, similarity) '
+                    'VALUES (?, ?, ?, ?)', (self.namespace, str(tweet.id), found[0], found[1])
+                )
+            results.append((tweet, found[0] if found else None))
+        return results
+
+    def filter_new(self, tweets, text=lambda tweet: tweet.text):
+        """Return the tweets of a page that are not near-duplicates (all of them unless mode is drop)"""
+        kept = []
+        duplicates = 0
+        for tweet, original_id in self.check(tweets, text):
+            if original_id is not None:
+                duplicates += 1
+                logger.debug(f"Tweet {tweet.id} is a near-duplicate of {original_id}")
+                if self.mode == 'drop':
+                    continue
+            kept.append(tweet)
+        if duplicates:
+            METRICS.inc('near_duplicates_total', duplicates, mode=self.mode)
+            logger.info(f"{'Dropped' if self.mode == 'drop' else 'Flagged'} {duplicates} near-duplicate tweets")
+        return kept
+
+    def duplicate_of(self, tweet_id):
+        """ID of the tweet tweet_id was found to duplicate, or None"""
+        row = self.conn.execute(
+            'SELECT original_id FROM duplicates WHERE namespace = ? AND tweet_id = ?',
+            (self.namespace, str(tweet_id))
+        ).fetchone()
+        return row[0] if row else None
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def iter_texts(records):
+    """Yield every text in output records, including nested replies"""
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        for key, value in record.items():
+            if key == 'text' and isinstance(value, str):
+                yield value
+            elif isinstance(value, dict):
+                yield from iter_texts([value])
+            elif isinstance(value, list):
+                yield from iter_texts(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate texts in a JSON output file")
+    parser.add_argument('output_file', help="e.g. fortyIQ.json or buildinpublicbest.json")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--show', type=int, default=10, help="largest groups to print")
+    args = parser.parse_args()
+
+    with open(args.output_file, 'r', encoding='utf-8') as f:
+        texts = list(iter_texts(json.load(f)))
+
+    class Text:
+        def __init__(self, i, text):
+            self.id = i
+            self.text = text
+
+    index = NearDuplicateIndex(args.output_file, path=':memory:', threshold=args.threshold, mode='flag')
+    groups = {}
+    for start in range(0, len(texts), CHUNK_SIZE):
+        page = [Text(i, text) for i, text in enumerate(texts[start:start + CHUNK_SIZE], start)]
+        for item, original_id in index.check(page):
+            groups.setdefault(int(original_id) if original_id is not None else item.id, []).append(item.id)
+    index.close()
+
+    duplicated = sorted((ids for ids in groups.values() if len(ids) > 1), key=len, reverse=True)
+    duplicates = sum(len(ids) - 1 for ids in duplicated)
+    print(f"{len(texts)} texts, {duplicates} near-duplicates in {len(duplicated)} groups")
+    for ids in duplicated[:args.show]:
+        print(f"\n{len(ids)}x {texts[ids[0]][:120]!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from random import uniform
+
+import httpx
+
+from metrics import METRICS
+from http_transport import CACHE_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when config.ini has no [Pool] / [Pacing] section
+DEFAULT_REQUESTS_PER_WINDOW = 50
+DEFAULT_WINDOW = 15 * 60
+DEFAULT_JITTER = 0.2
+DEFAULT_MIN_DELAY = 1.0
+
+
+class Pacer:
+    """Spaces requests evenly over what is left of the rate-limit window.
+
+    The pacer reads x-rate-limit-remaining / x-rate-limit-reset from every
+    response of the paced endpoint and schedules the next request at
+    (reset - now) / remaining seconds after the previous one, instead of a
+    fixed random sleep. Until the first response arrives it assumes a full
+    window (window / limit seconds per request). Slots are reserved when
+    wait() is called, so several tasks sharing one pacer do not burst.
+    """
+
+    def __init__(self, limit=DEFAULT_REQUESTS_PER_WINDOW, window=DEFAULT_WINDOW,
+                 jitter=DEFAULT_JITTER, min_delay=DEFAULT_MIN_DELAY, endpoint='SearchTimeline'):
+        self.limit = limit
+        self.window = window
+        self.jitter = jitter
+        self.min_delay = min_delay
+        self.endpoint = endpoint
+        self.remaining = None
+        self.reset_time = None
+        self.next_slot = 0.0  # time.time() of the earliest next request
+        self.on_update = None  # optional callback(remaining, reset_time)
+
+    @classmethod
+    def from_config(cls, config, endpoint='SearchTimeline'):
+        """Build a pacer from the [Pool] quota and [Pacing] options in config.ini"""
+        return cls(
+            limit=config.getint('Pool', 'requests_per_window', fallback=DEFAULT_REQUESTS_PER_WINDOW),
+            window=config.getint('Pool', 'window', fallback=DEFAULT_WINDOW),
+            jitter=config.getfloat('Pacing', 'jitter', fallback=DEFAULT_JITTER),
+            min_delay=config.getfloat('Pacing', 'min_delay', fallback=DEFAULT_MIN_DELAY),
+            endpoint=endpoint,
+        )
+
+    def attach(self, client):
+        """Observe rate-limit headers on every response of a twikit Client"""
+        http = getattr(client, 'http', None)
+        # twikit's synchronous client wraps its httpx.Client in HTTPClient.client
+        http = getattr(http, 'client', http)
+        if not hasattr(http, 'event_hooks'):
+            logger.warning("Client has no httpx session, pacing without rate-limit headers")
+            return
+
+        if isinstance(http, httpx.AsyncClient):
+            async def hook(response):
+                self.observe_response(response)
+        else:
+            def hook(response):
+                self.observe_response(response)
+
+        hooks = http.event_hooks
+        hooks['response'].append(hook)
+        http.event_hooks = hooks
+
+    def observe_response(self, response):
+        METRICS.inc('http_responses_total', endpoint=response.url.path.rsplit('/', 1)[-1],
+                    status=str(response.status_code))
+        if self.endpoint and self.endpoint not in response.url.path:
+            return
+        if response.headers.get(CACHE_HEADER) == 'hit':
+            # Served from the local response cache: no quota was used
+            self.refund()
+            return
+        self.observe(response.headers)
+
+    def observe(self, headers):
+        """Update the quota from a response's rate-limit headers"""
+        try:
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset_time = float(headers['x-rate-limit-reset'])
+        except (KeyError, ValueError):
+            return
+        if 'x-rate-limit-limit' in headers:
+            try:
+                self.limit = int(headers['x-rate-limit-limit'])
+            except ValueError:
+                pass
+        self.remaining = remaining
+        self.reset_time = reset_time
+        if self.on_update is not None:
+            self.on_update(remaining, reset_time)
+
+    def refund(self):
+        """Give back the slot of a request that never reached the network"""
+        self.next_slot = time.time()
+        if self.remaining is not None:
+            self.remaining += 1
+
+    def rate_limited(self, reset_time=None):
+        """Record a rate-limit error: nothing more is sent until reset_time"""
+        self.remaining = 0
+        self.reset_time = reset_time or time.time() + self.window
+        if self.on_update is not None:
+            self.on_update(0, self.reset_time)
+
+    def interval(self, now=None):
+        """Seconds to leave between requests given the current quota"""
+        now = time.time() if now is None else now
+        if self.reset_time is None or self.reset_time <= now:
+            # Unknown or expired window: assume a fresh one
+            return self.window / max(self.limit, 1)
+        if self.remaining is not None and self.remaining <= 0:
+            return self.reset_time - now
+        return (self.reset_time - now) / max(self.remaining or self.limit, 1)
+
+    def reserve(self):
+        """Claim the next request slot and return how long to sleep until it"""
+        now = time.time()
+        if self.remaining == 0 and self.reset_time and self.reset_time > now:
+            # Out of quota: the first slot is at the reset
+            slot = max(self.next_slot, self.reset_time)
+        else:
+            slot = max(self.next_slot, now)
+        delay = max(self.interval(slot), self.min_delay)
+        if self.jitter:
+            delay *= uniform(1 - self.jitter, 1 + self.jitter)
+        self.next_slot = slot + delay
+        if self.remaining:
+            # Count the reserved request until the next response corrects it
+            self.remaining -= 1
+        return max(slot - now, 0.0)
+
+    async def wait(self):
+        wait_time = self.reserve()
+        if wait_time > 0:
+            logger.info(f"Pacing: next request in {wait_time:.1f} seconds")
+            METRICS.sleep(wait_time, 'pacing')
+            await asyncio.sleep(wait_time)
+
+    def wait_sync(self):
+        wait_time = self.reserve()
+        if wait_time > 0:
+            print(f'{datetime.now()} - Pacing: next request in {wait_time:.1f} seconds')
+            METRICS.sleep(wait_time, 'pacing')
+            time.sleep(wait_time)
@@ -0,0 +1,110 @@
+import sqlite3
+from datetime import datetime
+
+from dedup import PROGRESS_DB
+
+
+class CrawlCheckpoint:
+    """Pagination position of one (query, product) search, stored in tweet_progress.db.
+
+    The scrapers save the Result cursor after every page so a crashed or
+    interrupted crawl can be continued with ``--resume`` instead of
+    re-fetching pages from the start.
+    """
+
+    def __init__(self, query, product, path=PROGRESS_DB):
+        self.query = query
+        self.product = product
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS crawl_checkpoints ('
+            'query TEXT NOT NULL, '
+            'product TEXT NOT NULL, '
+            'cursor TEXT, '
+            'tweet_count INTEGER NOT NULL DEFAULT 0, '
+            'last_tweet_id TEXT, '
+            'updated_at TEXT, '
+            'PRIMARY KEY (query, product))'
+        )
+        self.conn.commit()
+
+    def load(self):
+        """Return the saved checkpoint as a dict, or None if there is none"""
+        row = self.conn.execute(
+            'SELECT cursor, tweet_count, last_tweet_id, updated_at FROM crawl_checkpoints '
+            'WHERE query = ? AND product = ?',
+            (self.query, self.product)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'cursor': row[0],
+            'tweet_count': row[1],
+            'last_tweet_id': row[2],
+            'updated_at': row[3],
+        }
+
+    def save(self, cursor, tweet_count, last_tweet_id=None):
+        """Persist the position reached after a page"""
+        self.conn.execute(
+            'INSERT OR REPLACE INTO crawl_checkpoints '
+            '(query, product, cursor, tweet_count, last_tweet_id, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.query, self.product, cursor, tweet_count,
+             str(last_tweet_id) if last_tweet_id is not None else None,
+             datetime.now().isoformat(timespec='seconds'))
+        )
+        self.conn.commit()
+
+    def clear(self):
+        """Forget the checkpoint, e.g. once the search is exhausted"""
+        self.conn.execute(
+            'DELETE FROM crawl_checkpoints WHERE query = ? AND product = ?',
+            (self.query, self.product)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class WatchState:
+    """Newest tweet ID a watch (--watch) of one query has emitted, in tweet_progress.db.
+
+    Each poll asks only for tweets newer than this ID, so a restarted watch
+    picks up where it stopped without downloading older tweets again.
+    """
+
+    def __init__(self, query, path=PROGRESS_DB):
+        self.query = query
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS watch_state ('
+            'query TEXT PRIMARY KEY, '
+            'since_id TEXT, '
+            'tweet_count INTEGER NOT NULL DEFAULT 0, '
+            'updated_at TEXT)'
+        )
+        self.conn.commit()
+
+    def load(self):
+        """Return the saved state as a dict, or None if the query was never watched"""
+        row = self.conn.execute(
+            'SELECT since_id, tweet_count, updated_at FROM watch_state WHERE query = ?',
+            (self.query,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'since_id': row[0], 'tweet_count': row[1], 'updated_at': row[2]}
+
+    def save(self, since_id, tweet_count):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO watch_state (query, since_id, tweet_count, updated_at) '
+            'VALUES (?, ?, ?, ?)',
+            (self.query, str(since_id) if since_id is not None else None, tweet_count,
+             datetime.now().isoformat(timespec='seconds'))
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,155 @@
+import logging
+import pickle
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Records kept in memory before a RecordBuffer spills them to disk
+DEFAULT_MAX_IN_MEMORY = 100000
+
+
+class TweetRecord:
+    """The fields twitterscrap.py keeps per tweet, without a per-tweet dict.
+
+    Usernames are interned, so an account's tweets share one string; the
+    entity tuples come interned from entities.py.
+    """
+    __slots__ = ('username', 'text', 'likes', 'hashtags', 'mentions', 'urls', 'has_media')
+
+    def __init__(self, username, text, likes, hashtags=(), mentions=(), urls=(), has_media=False):
+        self.username = sys.intern(username)
+        self.text = text
+        self.likes = likes
+        self.hashtags = hashtags
+        self.mentions = mentions
+        self.urls = urls
+        self.has_media = has_media
+
+    def to_dict(self):
+        return {'username': self.username, 'text': self.text, 'likes': self.likes,
+                'hashtags': list(self.hashtags), 'mentions': list(self.mentions), 'urls': list(self.urls),
+                'has_media': self.has_media}
+
+    def to_row(self):
+        return self.username, self.text, self.likes, self.hashtags, self.mentions, self.urls, self.has_media
+
+    @classmethod
+    def from_row(cls, row):
+        username, text, likes, hashtags, mentions, urls, has_media = row
+        # Unpickled strings are new copies; share them again
+        return cls(username, text, likes, tuple(map(sys.intern, hashtags)), tuple(map(sys.intern, mentions)),
+                   urls, has_media)
+
+
+class TweetMetrics:
+    """Like and reply counts of a tweet in a fortyIQ.py conversation"""
+    __slots__ = ('like_count', 'reply_count')
+
+    def __init__(self, like_count, reply_count):
+        self.like_count = like_count
+        self.reply_count = reply_count
+
+    def to_dict(self):
+        return {'like_count': self.like_count, 'reply_count': self.reply_count}
+
+
+class ConversationRecord:
+    """A parent tweet and a reply to it, as saved by fortyIQ.py"""
+    __slots__ = ('parent_text', 'parent_metrics', 'reply_text', 'reply_metrics')
+
+    def __init__(self, parent_text, parent_metrics, reply_text, reply_metrics):
+        self.parent_text = parent_text
+        self.parent_metrics = parent_metrics
+        self.reply_text = reply_text
+        self.reply_metrics = reply_metrics
+
+    def to_dict(self):
+        return {
+            'parent_tweet': {'text': self.parent_text, 'metrics': self.parent_metrics.to_dict()},
+            'reply': {'text': self.reply_text, 'metrics': self.reply_metrics.to_dict()},
+        }
+
+    def to_row(self):
+        return (self.parent_text, self.parent_metrics.like_count, self.parent_metrics.reply_count,
+                self.reply_text, self.reply_metrics.like_count, self.reply_metrics.reply_count)
+
+    @classmethod
+    def from_row(cls, row):
+        parent_text, parent_likes, parent_replies, reply_text, reply_likes, reply_replies = row
+        return cls(parent_text, TweetMetrics(parent_likes, parent_replies),
+                   reply_text, TweetMetrics(reply_likes, reply_replies))
+
+
+def as_dicts(records):
+    """JSON-ready dicts for storage.append"""
+    return [record.to_dict() for record in records]
+
+
+class RecordBuffer:
+    """Append-only sequence of records with a cap on how many stay in memory.
+
+    Once max_in_memory records are buffered they are pickled as plain tuples
+    to an anonymous temp file and dropped from memory. len() and iteration
+    still cover every record: spilled chunks are streamed back from disk one
+    at a time.
+    """
+
+    def __init__(self, record_type, max_in_memory=DEFAULT_MAX_IN_MEMORY):
+        self.record_type = record_type
+        self.max_in_memory = max(1, max_in_memory)
+        self.memory = []
+        self.spill_file = None
+        self.spilled = 0
+        self.chunks = []  # (index of first record, file offset) per spilled chunk
+
+    def append(self, record):
+        self.memory.append(record)
+        if len(self.memory) >= self.max_in_memory:
+            self.spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def spill(self):
+        """Move the in-memory records to the spill file"""
+        if not self.memory:
+            return
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix='tweets_', suffix='.spill')
+        self.spill_file.seek(0, 2)
+        self.chunks.append((self.spilled, self.spill_file.tell()))
+        pickle.dump([record.to_row() for record in self.memory], self.spill_file, pickle.HIGHEST_PROTOCOL)
+        self.spilled += len(self.memory)
+        logger.debug(f"Spilled {len(self.memory)} records to disk ({self.spilled} total)")
+        self.memory = []
+
+    def __len__(self):
+        return self.spilled + len(self.memory)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def iter_from(self, start=0):
+        """Yield records from index start on, reading spilled chunks back as needed"""
+        bounds = [first for first, _ in self.chunks[1:]] + [self.spilled]
+        for (first, offset), end in zip(self.chunks, bounds):
+            if end <= start:
+                continue
+            self.spill_file.seek(offset)
+            rows = pickle.load(self.spill_file)
+            for row in rows[max(start - first, 0):]:
+                yield self.record_type.from_row(row)
+        yield from self.memory[max(start - self.spilled, 0):]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.memory = []
+        self.chunks = []
+        self.spilled = 0
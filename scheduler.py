@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+from configparser import ConfigParser
+
+from twitterscrap import TwitterScraper, MINIMUM_TWEETS, CONFIG_FILE
+from metrics import METRICS, MetricsExporter
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the global request budget (SearchTimeline allows 50 requests per 15 minutes)
+DEFAULT_CONCURRENCY = 3
+DEFAULT_BUDGET = 50
+DEFAULT_BUDGET_PERIOD = 15 * 60
+
+
+class RequestBudget:
+    """Sliding-window cap on search requests shared by all crawl tasks"""
+
+    def __init__(self, max_requests=DEFAULT_BUDGET, period=DEFAULT_BUDGET_PERIOD):
+        self.max_requests = max_requests
+        self.period = period
+        self.sent = deque()  # monotonic timestamps of requests inside the window
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until one more request fits in the window, then claim it"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0] >= self.period:
+                    self.sent.popleft()
+                if len(self.sent) < self.max_requests:
+                    self.sent.append(now)
+                    return
+                wait_time = self.period - (now - self.sent[0])
+                logger.info(f"Request budget exhausted, waiting {wait_time:.0f} seconds")
+                METRICS.sleep(wait_time, 'budget')
+                await asyncio.sleep(wait_time)
+
+
+def default_output_file(query):
+    """Derive a per-query output file name from the query text"""
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', query).strip('_').lower()
+    return f"query_{slug[:60] or 'empty'}.json"
+
+
+def load_queries(path):
+    """Read crawl jobs from a file.
+
+    Each non-empty line that does not start with '#' is either a raw search
+    query, or a JSON object with "query" and optional "target" and "output"
+    keys, e.g. {"query": "(ai) min_faves:100", "target": 200, "output": "ai.json"}.
+    """
+    jobs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                jobs.append(make_job(**json.loads(line)))
+            else:
+                jobs.append(make_job(line))
+    return jobs
+
+
+def make_job(query, target=MINIMUM_TWEETS, output=None):
+    """Build a crawl job dict with its per-query target and output sink"""
+    return {
+        'query': query,
+        'target': int(target),
+        'output': output or default_output_file(query),
+    }
+
+
+class CrawlScheduler:
+    """Run many TwitterScraper crawls concurrently on one authenticated client or account pool"""
+
+    def __init__(self, jobs, concurrency=DEFAULT_CONCURRENCY, budget=None, resume=False):
+        self.jobs = jobs
+        self.concurrency = max(1, concurrency)
+        self.budget = budget or RequestBudget()
+        self.resume = resume
+
+    async def run(self):
+        """Crawl every job, at most `concurrency` at a time. Returns {query: error or None}"""
+        if not self.jobs:
+            return {}
+
+        scrapers = [
+            TwitterScraper(query=job['query'], minimum_tweets=job['target'],
+                           output_file=job['output'], budget=self.budget)
+            for job in self.jobs
+        ]
+
+        # Authenticate once and share the client (or account pool) with every scraper
+        try:
+            await scrapers[0].initialize_client()
+        except Exception:
+            for scraper in scrapers:
+                scraper.close()
+            raise
+        for scraper in scrapers[1:]:
+            scraper.client = scrapers[0].client
+            scraper.pool = scrapers[0].pool
+            scraper.pacer = scrapers[0].pacer
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(scraper):
+            async with semaphore:
+                try:
+                    await scraper.scrape_tweets(resume=self.resume)
+                    return None
+                except Exception as e:
+                    logger.error(f"Crawl for '{scraper.query}' failed: {e}")
+                    return str(e)
+                finally:
+                    scraper.close()
+
+        results = await asyncio.gather(*(run_one(scraper) for scraper in scrapers))
+        return {job['query']: error for job, error in zip(self.jobs, results)}
+
+
+async def main(args):
+    jobs = load_queries(args.queries) if args.queries else []
+    jobs += [make_job(query, target=args.target) for query in args.query]
+    if not jobs:
+        logger.error("No queries given. Use --queries FILE or --query QUERY")
+        return 1
+
+    budget = RequestBudget(args.budget, args.budget_period)
+    scheduler = CrawlScheduler(jobs, concurrency=args.concurrency, budget=budget, resume=args.resume)
+    logger.info(f"Crawling {len(jobs)} queries with concurrency {scheduler.concurrency}")
+
+    config = ConfigParser()
+    config.read(CONFIG_FILE)
+    exporter = MetricsExporter.from_config(config).start()
+    try:
+        results = await scheduler.run()
+    finally:
+        logger.info(exporter.stop())
+    failed = [query for query, error in results.items() if error]
+    logger.info(f"Finished {len(results) - len(failed)}/{len(results)} queries")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl several search queries concurrently")
+    parser.add_argument('--queries', help="file with one query (or JSON job) per line")
+    parser.add_argument('--query', action='append', default=[], help="query to crawl (repeatable)")
+    parser.add_argument('--target', type=int, default=MINIMUM_TWEETS, help="tweets per --query")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of queries crawled at once")
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET,
+                        help="maximum search requests per budget period across all queries")
+    parser.add_argument('--budget-period', type=int, default=DEFAULT_BUDGET_PERIOD,
+                        help="budget window in seconds")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue each query from its saved cursor")
+    exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,471 @@
+"""Full-text search over everything the scrapers have collected.
+
+Every output format is loaded into one SQLite database (search_index.db):
+the JSON outputs and their storage logs, tweets.csv, the Parquet dataset,
+fortyIQ conversations and conversation trees. Text gets an FTS5 index.
+Username, likes and created_at get B-tree indexes, so a query returns in
+milliseconds instead of loading each file.
+
+    python search_index.py update                        # index the outputs in this directory
+    python search_index.py update tweets.csv fortyIQ.json
+    python search_index.py search "stock market" --min-likes 1000
+    python search_index.py search --phrase "supercycle (real)" --user Watcher.Guru
+    python search_index.py stats
+
+Updates are incremental: each source remembers how far it was read (a
+storage log position, a CSV byte offset or a Parquet part file), so only
+new batches are indexed. A plain JSON file without a storage log is
+indexed again only when it changes.
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from storage import BACKENDS, JSONLStorage
+from sinks import parse_created_at, pq
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'search_index.db'
+DEFAULT_LIMIT = 20
+# Files never indexed when discovering outputs
+IGNORED_FILES = {'cookies.json'}
+# Rows inserted per transaction while indexing
+BATCH_SIZE = 20000
+
+SOURCE_COLUMNS = ('id', 'path', 'kind', 'position', 'signature', 'updated_at')
+RESULT_COLUMNS = ('username', 'text', 'likes', 'created_at', 'path')
+
+
+def to_int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def to_iso(value):
+    """created_at as ISO 8601 UTC (sortable), whatever form it was saved in"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    parsed = parse_created_at(value)
+    return parsed.isoformat() if parsed is not None else str(value)
+
+
+def documents(record):
+    """Yield (username, text, likes, created_at) for every tweet in an output record.
+
+    Handles twitterscrap/trendingscrap records, tweets.csv rows, fortyIQ
+    parent/reply pairs and conversation trees (replies nested in "replies").
+    """
+    if 'parent_tweet' in record or 'reply' in record:
+        for part in (record.get('parent_tweet'), record.get('reply')):
+            if part:
+                yield None, part.get('text'), to_int((part.get('metrics') or {}).get('like_count')), None
+        return
+    text = record.get('text', record.get('Text'))
+    if text:
+        yield (record.get('username', record.get('Username')) or None, text,
+               to_int(record.get('likes', record.get('Likes'))),
+               to_iso(record.get('created_at', record.get('Created at'))))
+    for reply in record.get('replies') or ():
+        yield from documents(reply)
+
+
+def document_key(username, text):
+    """Stable 64-bit key; a tweet is indexed once per source even if repeated
+    (fortyIQ repeats the parent of every reply)"""
+    digest = hashlib.blake2b(f'{username}\0{text}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def file_signature(path):
+    if os.path.isdir(path):
+        return None
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def storage_log(path):
+    """The storage log next to a JSON output, if the scrapers keep one"""
+    for storage_class, suffix in BACKENDS.values():
+        if os.path.exists(path + suffix):
+            return storage_class, path + suffix
+    return None, None
+
+
+def csv_rows_after(path, position):
+    """Yield (position, row) for complete CSV rows after byte offset position"""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        header = next(csv.reader([f.readline()]), None)
+        if not header:
+            return
+        offset = max(position, f.tell())
+        f.seek(offset)
+
+        def lines():
+            nonlocal offset
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    return  # end of file, or a row still being written
+                offset = f.tell()
+                yield line
+
+        for row in csv.reader(lines()):
+            yield offset, dict(zip(header, row))
+
+
+def discover_sources(directory='.'):
+    """Output files in directory: JSON outputs (or their logs), CSVs and Parquet parts"""
+    paths = set()
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        if os.path.basename(path) not in IGNORED_FILES:
+            paths.add(os.path.normpath(path))
+    # A crawl that has not exported its JSON yet only has the log
+    for _, suffix in BACKENDS.values():
+        for log in glob.glob(os.path.join(directory, f'*.json{suffix}')):
+            paths.add(os.path.normpath(log[:-len(suffix)]))
+    paths.update(os.path.normpath(path) for path in glob.glob(os.path.join(directory, '*.csv')))
+    paths.update(os.path.normpath(path) for path in glob.glob(os.path.join(directory, '*.parquet')))
+    return sorted(paths)
+
+
+class SearchIndex:
+    """SQLite FTS5 index of the collected tweets, updated source by source"""
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                position INTEGER NOT NULL DEFAULT 0,
+                signature TEXT,
+                updated_at TEXT);
+            CREATE TABLE IF NOT EXISTS tweets (
+                id INTEGER PRIMARY KEY,
+                source_id INTEGER NOT NULL,
+                key INTEGER NOT NULL,
+                username TEXT COLLATE NOCASE,
+                text TEXT NOT NULL,
+                likes INTEGER,
+                created_at TEXT,
+                UNIQUE (source_id, key));
+            CREATE INDEX IF NOT EXISTS tweets_username ON tweets (username, likes);
+            CREATE INDEX IF NOT EXISTS tweets_likes ON tweets (likes);
+            CREATE INDEX IF NOT EXISTS tweets_created_at ON tweets (created_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts USING fts5(
+                text, content='tweets', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+            CREATE TRIGGER IF NOT EXISTS tweets_fts_delete AFTER DELETE ON tweets BEGIN
+                INSERT INTO tweets_fts (tweets_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+        ''')
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Index at [Index] index_file; None when auto_update is off"""
+        if config is None or not config.getboolean('Index', 'auto_update', fallback=False):
+            return None
+        return cls(config.get('Index', 'index_file', fallback=INDEX_FILE) or INDEX_FILE)
+
+    def source(self, path, kind):
+        row = self.conn.execute(
+            f"SELECT {', '.join(SOURCE_COLUMNS)} FROM sources WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and row[2] == kind:
+            return dict(zip(SOURCE_COLUMNS, row))
+        if row is not None:
+            # The output changed form (e.g. a storage log appeared); start over
+            self.clear_source(row[0])
+        self.conn.execute('INSERT OR REPLACE INTO sources (path, kind) VALUES (?, ?)', (path, kind))
+        return self.source(path, kind)
+
+    def clear_source(self, source_id):
+        self.conn.execute('DELETE FROM tweets WHERE source_id = ?', (source_id,))
+        self.conn.execute('UPDATE sources SET position = 0, signature = NULL WHERE id = ?', (source_id,))
+
+    @METRICS.timed('index_seconds')
+    def insert(self, source, positioned_records):
+        """Index (position, record) pairs, saving the source's position every batch"""
+        added = 0
+        rows = []
+        position = source['position']
+
+        def flush():
+            nonlocal added, rows
+            if rows:
+                last_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM tweets').fetchone()[0]
+                added += self.conn.executemany(
+                    'INSERT OR IGNORE INTO tweets (source_id, key, username, text, likes, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', rows
+                ).rowcount
+                # Index the batch's text in one statement; an insert trigger
+                # is about twice as slow
+                self.conn.execute('INSERT INTO tweets_fts (rowid, text) SELECT id, text FROM tweets WHERE id > ?',
+                                  (last_id,))
+            self.conn.execute(
+                'UPDATE sources SET position = ?, updated_at = ? WHERE id = ?',
+                (position, datetime.now().isoformat(timespec='seconds'), source['id'])
+            )
+            self.conn.commit()
+            rows = []
+
+        for position, record in positioned_records:
+            for username, text, likes, created_at in documents(record):
+                if text:
+                    rows.append((source['id'], document_key(username, text), username, text, likes, created_at))
+            if len(rows) >= BATCH_SIZE:
+                flush()
+        flush()
+        METRICS.inc('indexed_total', added)
+        return added
+
+    def update_source(self, path):
+        """Index what was added to one output since the last update. Returns tweets added"""
+        path = os.path.normpath(path)
+        if path.endswith('.parquet'):
+            return sum(self.update_parquet_part(part)
+                       for part in sorted(glob.glob(os.path.join(path, '*.parquet'))))
+        if path.endswith('.csv'):
+            return self.update_csv(path)
+
+        storage_class, log_path = storage_log(path)
+        if storage_class is not None:
+            return self.update_log(path, storage_class, log_path)
+        return self.update_json(path)
+
+    def update_log(self, path, storage_class, log_path):
+        storage = storage_class(log_path)
+        try:
+            return self.update_storage(path, storage)
+        finally:
+            storage.close()
+
+    def update_storage(self, path, storage):
+        """Index new records of an open storage log (the scrapers pass their own,
+        whose records_after also sees writes not yet flushed)"""
+        source = self.source(os.path.normpath(path), 'log')
+        if isinstance(storage, JSONLStorage) and os.path.getsize(storage.path) < source['position']:
+            logger.info(f"{storage.path} was rewritten, indexing it again")
+            self.clear_source(source['id'])
+            source['position'] = 0
+        return self.insert(source, storage.records_after(source['position']))
+
+    def update_csv(self, path):
+        source = self.source(path, 'csv')
+        # The header is the signature: a sink adding columns rewrites the file
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            header = f.readline()
+        if os.path.getsize(path) < source['position'] or header != (source['signature'] or header):
+            logger.info(f"{path} was rewritten, indexing it again")
+            self.clear_source(source['id'])
+            source['position'] = 0
+        added = self.insert(source, csv_rows_after(path, source['position']))
+        self.conn.execute('UPDATE sources SET signature = ? WHERE id = ?', (header, source['id']))
+        self.conn.commit()
+        return added
+
+    def update_whole_file(self, path, kind, load_records):
+        """Index a file that is only ever rewritten, when its signature changed"""
+        source = self.source(path, kind)
+        signature = file_signature(path)
+        if signature == source['signature']:
+            return 0
+        self.clear_source(source['id'])
+        source['position'] = 0
+        added = self.insert(source, ((0, record) for record in load_records(path)))
+        self.conn.execute('UPDATE sources SET signature = ? WHERE id = ?', (signature, source['id']))
+        self.conn.commit()
+        return added
+
+    def update_json(self, path):
+        def load(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, list):
+                logger.warning(f"{path} is not a scraper output (expected a JSON array), skipping")
+                return []
+            return [record for record in data if isinstance(record, dict)]
+        return self.update_whole_file(path, 'json', load)
+
+    def update_parquet_part(self, path):
+        if pq is None:
+            logger.warning(f"Skipping {path}: reading Parquet requires pyarrow (pip install pyarrow)")
+            return 0
+        return self.update_whole_file(path, 'parquet', lambda path: pq.read_table(path).to_pylist())
+
+    def update(self, paths=None):
+        """Index new tweets of paths (default: every output in the working directory)"""
+        added = 0
+        for path in paths or discover_sources():
+            if not os.path.exists(path) and storage_log(path)[0] is None:
+                logger.warning(f"{path} does not exist, skipping")
+                continue
+            try:
+                count = self.update_source(path)
+            except (OSError, ValueError, sqlite3.DatabaseError) as e:
+                logger.error(f"Error indexing {path}: {e}")
+                continue
+            if count:
+                logger.info(f"Indexed {count} new tweets from {path}")
+            added += count
+        return added
+
+    def search(self, keywords=None, phrase=None, match=None, username=None, min_likes=None,
+               max_likes=None, since=None, until=None, order=None, limit=DEFAULT_LIMIT):
+        """Return matching tweets as dicts.
+
+        keywords must all appear (any order), phrase must appear as written,
+        match is a raw FTS5 query. since/until are YYYY-MM-DD dates, until
+        exclusive. order is 'rank' (default for text searches), 'likes' or
+        'recent'.
+        """
+        terms = []
+        if keywords:
+            terms += [quote(word) for word in keywords.split()]
+        if phrase:
+            terms.append(quote(phrase))
+        if match:
+            terms.append(f'({match})')
+
+        conditions, params = [], []
+        if terms:
+            conditions.append('tweets.id IN (SELECT rowid FROM tweets_fts WHERE tweets_fts MATCH ?)')
+            params.append(' AND '.join(terms))
+        if username:
+            conditions.append('tweets.username = ?')
+            params.append(username.lstrip('@'))
+        if min_likes is not None:
+            conditions.append('tweets.likes >= ?')
+            params.append(min_likes)
+        if max_likes is not None:
+            conditions.append('tweets.likes <= ?')
+            params.append(max_likes)
+        if since:
+            conditions.append('tweets.created_at >= ?')
+            params.append(since)
+        if until:
+            conditions.append('tweets.created_at < ?')
+            params.append(until)
+
+        order = order or ('rank' if terms else 'likes')
+        if order == 'rank' and terms:
+            # Rank with bm25 through the FTS table itself
+            sql = (
+                'SELECT tweets.username, tweets.text, tweets.likes, tweets.created_at, sources.path '
+                'FROM tweets_fts JOIN tweets ON tweets.id = tweets_fts.rowid '
+                'JOIN sources ON sources.id = tweets.source_id '
+                f"WHERE tweets_fts MATCH ? {''.join(' AND ' + c for c in conditions[1:])} "
+                'ORDER BY tweets_fts.rank LIMIT ?'
+            )
+        else:
+            order_by = {'likes': 'tweets.likes DESC', 'recent': 'tweets.created_at DESC',
+                        'rank': 'tweets.likes DESC'}[order]
+            sql = (
+                'SELECT tweets.username, tweets.text, tweets.likes, tweets.created_at, sources.path '
+                'FROM tweets JOIN sources ON sources.id = tweets.source_id '
+                f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+                f'ORDER BY {order_by} LIMIT ?'
+            )
+        return [dict(zip(RESULT_COLUMNS, row)) for row in self.conn.execute(sql, params + [limit])]
+
+    def stats(self):
+        """(path, kind, tweets, updated_at) for every indexed source"""
+        return self.conn.execute(
+            'SELECT sources.path, sources.kind, COUNT(tweets.id), sources.updated_at '
+            'FROM sources LEFT JOIN tweets ON tweets.source_id = sources.id '
+            'GROUP BY sources.id ORDER BY sources.path'
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def quote(text):
+    """An FTS5 string: matched as a phrase, with no query syntax"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def update_index(config, paths):
+    """Index paths after a run when [Index] auto_update is on"""
+    index = SearchIndex.from_config(config)
+    if index is None:
+        return 0
+    try:
+        return index.update([path for path in paths if os.path.exists(path) or storage_log(path)[0]])
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text index of the scraped tweets")
+    parser.add_argument('--index', default=INDEX_FILE, help="index database (default: search_index.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help="index new tweets")
+    update.add_argument('paths', nargs='*', help="outputs to index (default: all in this directory)")
+
+    search = commands.add_parser('search', help="search the index")
+    search.add_argument('keywords', nargs='?', help="words that must all appear")
+    search.add_argument('--phrase', help="exact phrase")
+    search.add_argument('--match', help="raw FTS5 query, e.g. 'bitcoin OR ethereum'")
+    search.add_argument('--user', help="username")
+    search.add_argument('--min-likes', type=int)
+    search.add_argument('--max-likes', type=int)
+    search.add_argument('--since', help="YYYY-MM-DD")
+    search.add_argument('--until', help="YYYY-MM-DD (exclusive)")
+    search.add_argument('--order', choices=['rank', 'likes', 'recent'])
+    search.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    search.add_argument('--json', action='store_true', help="print results as JSON")
+
+    commands.add_parser('stats', help="list indexed sources")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.index)
+    try:
+        if args.command == 'update':
+            started = time.perf_counter()
+            added = index.update(args.paths)
+            print(f"Indexed {added} new tweets in {time.perf_counter() - started:.2f}s")
+        elif args.command == 'search':
+            started = time.perf_counter()
+            try:
+                results = index.search(args.keywords, args.phrase, args.match, args.user, args.min_likes,
+                                       args.max_likes, args.since, args.until, args.order, args.limit)
+            except sqlite3.OperationalError as e:
+                print(f"Invalid query: {e}")
+                return 1
+            elapsed = (time.perf_counter() - started) * 1000
+            if args.json:
+                print(json.dumps(results, ensure_ascii=False, indent=2))
+            else:
+                for result in results:
+                    text = ' '.join(result['text'].split())
+                    print(f"{result['likes'] if result['likes'] is not None else '-':>7}  "
+                          f"{result['username'] or '-':<20.20} {(result['created_at'] or '')[:10]:<10}  "
+                          f"{text[:100]}")
+                print(f"{len(results)} results in {elapsed:.1f}ms")
+        else:
+            for path, kind, count, updated_at in index.stats():
+                print(f"{count:>8}  {kind:<8} {path}  (updated {updated_at})")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
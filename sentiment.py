@@ -0,0 +1,292 @@
+"""Lexicon-based sentiment scoring for scraped tweets.
+
+Scores are VADER-style compound values in [-1, 1], computed for whole
+batches at once with NumPy: every batch is tokenized into one flat array of
+lexicon indices, valences are looked up and negated in bulk, and per-tweet
+sums are taken with np.bincount. Nothing is sent over the network.
+
+    python sentiment.py tweets.csv                 # fill missing Sentiment Score values
+    python sentiment.py tweets.csv --all --workers 8
+"""
+import argparse
+import csv
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sinks import DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+SCORE_COLUMN = 'Sentiment Score'
+TEXT_COLUMN = 'Text'
+# Batches smaller than this are scored in-process; larger ones use the pool
+POOL_THRESHOLD = 20000
+CHUNK_SIZE = 5000
+# VADER's normalization constant and negation scalar
+ALPHA = 15
+NEGATION_SCALAR = -0.74
+NEGATION_WINDOW = 3
+
+# Hyphenated words are one token, so lexicon entries such as sell-off match
+TOKEN = re.compile(r"[#$]?[a-z][a-z0-9']*(?:-[a-z0-9']+)*|[\U0001F300-\U0001FAFF☀-➿]")
+LINK_OR_MENTION = re.compile(r'https?://\S+|@\w+')
+
+NEGATIONS = frozenset((
+    'not', 'no', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor', 'without', 'cannot',
+    "can't", "don't", "doesn't", "didn't", "isn't", "aren't", "wasn't", "weren't", "won't",
+    "wouldn't", "shouldn't", "couldn't", "hasn't", "haven't", "ain't", 'cant', 'dont', 'doesnt',
+    'didnt', 'isnt', 'wont', 'aint',
+))
+
+# Valences on VADER's -4..4 scale, with the market/crypto vocabulary our queries hit
+LEXICON = {
+    'good': 1.9, 'great': 3.1, 'excellent': 2.7, 'amazing': 2.8, 'awesome': 3.1, 'best': 3.2,
+    'better': 1.9, 'love': 3.2, 'loved': 2.9, 'like': 1.5, 'happy': 2.7, 'glad': 2.0, 'win': 2.8,
+    'wins': 2.7, 'winning': 2.4, 'won': 2.7, 'success': 2.7, 'successful': 2.8, 'strong': 2.3,
+    'stronger': 2.0, 'growth': 1.6, 'grow': 1.4, 'growing': 1.5, 'gain': 2.0, 'gains': 2.0,
+    'profit': 1.9, 'profits': 1.9, 'profitable': 2.0, 'rally': 1.8, 'rallies': 1.8, 'surge': 1.6,
+    'surges': 1.6, 'soar': 2.0, 'soars': 2.0, 'soaring': 2.0, 'boom': 1.7, 'booming': 1.8,
+    'bull': 1.3, 'bullish': 2.2, 'moon': 1.4, 'mooning': 1.8, 'pump': 0.9, 'breakout': 1.5,
+    'record': 0.8, 'high': 0.6, 'higher': 0.8, 'up': 0.4, 'beat': 1.2, 'beats': 1.2,
+    'opportunity': 1.6, 'opportunities': 1.6, 'innovation': 1.7, 'innovative': 1.8, 'launch': 0.7,
+    'launched': 0.7, 'build': 0.6, 'building': 0.6, 'built': 0.6, 'ship': 0.6, 'shipped': 1.0,
+    'easy': 1.9, 'free': 1.0, 'wow': 2.8, 'nice': 1.8, 'cool': 1.3, 'fun': 2.3, 'excited': 2.2,
+    'exciting': 2.2, 'incredible': 2.6, 'impressive': 2.3, 'huge': 1.3, 'massive': 0.9,
+    'optimistic': 2.3, 'confident': 2.2, 'hope': 1.9, 'hopeful': 2.0, 'thanks': 1.9, 'thank': 1.5,
+    'grateful': 2.5, 'proud': 2.1, 'support': 1.7, 'recover': 1.5, 'recovery': 1.6, 'safe': 1.9,
+    'bad': -2.5, 'worse': -2.1, 'worst': -3.1, 'terrible': -2.1, 'awful': -2.0, 'horrible': -2.5,
+    'hate': -2.7, 'sad': -2.1, 'angry': -2.3, 'fear': -2.2, 'afraid': -2.2, 'scared': -1.9,
+    'panic': -2.3, 'crash': -2.1, 'crashes': -2.1, 'crashing': -2.3, 'crashed': -2.1,
+    'collapse': -2.2, 'plunge': -1.8, 'plunges': -1.8, 'dump': -1.6, 'dumping': -1.6,
+    'drop': -1.1, 'drops': -1.1, 'fall': -1.0, 'falls': -1.0, 'falling': -1.2, 'fell': -1.0,
+    'down': -0.6, 'lower': -0.6, 'low': -0.8, 'loss': -1.3, 'losses': -1.5, 'lose': -1.7,
+    'losing': -1.6, 'lost': -1.3, 'bear': -1.0, 'bearish': -2.1, 'recession': -2.2,
+    'inflation': -1.0, 'debt': -1.5, 'risk': -1.1, 'risky': -1.4, 'bubble': -1.2, 'scam': -2.9,
+    'fraud': -2.8, 'fake': -2.1, 'rug': -1.5, 'rugged': -2.0, 'hack': -1.6, 'hacked': -2.2,
+    'weak': -1.9, 'weaker': -1.7, 'fail': -2.5, 'failed': -2.3, 'failure': -2.3, 'problem': -1.7,
+    'problems': -1.7, 'crisis': -3.1, 'war': -2.9, 'bankrupt': -2.6, 'bankruptcy': -2.6,
+    'layoffs': -2.0, 'fired': -2.0, 'sell-off': -1.6, 'selloff': -1.6, 'volatile': -0.9,
+    'volatility': -0.8, 'worry': -1.9, 'worried': -1.2, 'concern': -1.0, 'concerns': -1.0,
+    'disaster': -3.1, 'wrong': -2.1, 'stupid': -2.4, 'broke': -1.8, 'broken': -2.1, 'kill': -3.7,
+    'killed': -3.5, 'dead': -3.3, 'die': -2.9, 'pain': -2.3, 'rekt': -2.0, 'sucks': -1.5,
+    '\U0001F680': 1.8, '\U0001F4C8': 1.4, '\U0001F4C9': -1.4, '\U0001F525': 1.2, '❤': 2.2,
+    '\U0001F602': 1.6, '\U0001F62D': -1.2, '\U0001F621': -2.4, '\U0001F60A': 2.0, '✅': 1.0,
+    '\U0001F6A8': -0.6,
+}
+
+
+def load_lexicon(path):
+    """Read a VADER-format lexicon file (token<TAB>mean valence[<TAB>...])"""
+    lexicon = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 2:
+                continue
+            try:
+                lexicon[parts[0].lower()] = float(parts[1])
+            except ValueError:
+                continue
+    return lexicon
+
+
+class SentimentScorer:
+    """Scores batches of texts against a word -> valence lexicon.
+
+    Hashtags and cashtags score as the bare word (#bullish == bullish).
+    A lexicon word preceded by a negation within NEGATION_WINDOW tokens of
+    the same text has its valence scaled by NEGATION_SCALAR.
+    """
+
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicon = LEXICON if lexicon is None else lexicon
+        words = list(lexicon)
+        self.index = {word: i for i, word in enumerate(words)}
+        self.negation_id = len(words)
+        for word in NEGATIONS:
+            self.index.setdefault(word, self.negation_id)
+        # Valence per token id; the negation id and unknown tokens (-1 -> last slot) score 0
+        self.valences = np.array([lexicon[word] for word in words] + [0.0, 0.0], dtype=np.float64)
+
+    def token_ids(self, text):
+        lookup = self.index.get
+        ids = []
+        for token in TOKEN.findall(LINK_OR_MENTION.sub(' ', text.lower())):
+            token_id = lookup(token.lstrip('#$'), -1)
+            if token_id == -1 and '-' in token:
+                # Compounds missing from the lexicon score as their words (well-known)
+                ids.extend(lookup(word, -1) for word in token.lstrip('#$').split('-') if word)
+            else:
+                ids.append(token_id)
+        return ids
+
+    def score(self, texts):
+        """Return compound scores in [-1, 1] for texts, as a float64 array"""
+        ids = []
+        lengths = np.empty(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            text_ids = self.token_ids(text) if isinstance(text, str) else []
+            ids.extend(text_ids)
+            lengths[i] = len(text_ids)
+        if not ids:
+            return np.zeros(len(texts))
+
+        ids = np.array(ids, dtype=np.int64)
+        doc = np.repeat(np.arange(len(texts)), lengths)
+        valence = self.valences[ids]
+
+        # Flip words with a negation up to NEGATION_WINDOW tokens before them in the same text
+        is_negation = ids == self.negation_id
+        negated = np.zeros(len(ids), dtype=bool)
+        for shift in range(1, NEGATION_WINDOW + 1):
+            negated[shift:] |= is_negation[:-shift] & (doc[:-shift] == doc[shift:])
+        valence = np.where(negated, valence * NEGATION_SCALAR, valence)
+
+        totals = np.bincount(doc, weights=valence, minlength=len(texts))
+        return np.round(totals / np.sqrt(totals * totals + ALPHA), 4)
+
+
+_worker_scorer = None
+
+
+def _init_worker(lexicon):
+    global _worker_scorer
+    _worker_scorer = SentimentScorer(lexicon)
+
+
+def _score_chunk(texts):
+    return _worker_scorer.score(texts)
+
+
+def score_texts(texts, scorer=None, workers=None, chunk_size=CHUNK_SIZE, lexicon=None):
+    """Score texts, fanning out over a process pool for large batches"""
+    texts = list(texts)
+    scorer = scorer or SentimentScorer(lexicon)
+    if workers == 1 or len(texts) < POOL_THRESHOLD:
+        return scorer.score(texts)
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scorer.lexicon,)) as pool:
+        return np.concatenate(list(pool.map(_score_chunk, chunks)))
+
+
+def score_rows(rows, scorer=None, workers=None, text_field=TEXT_COLUMN, column=SCORE_COLUMN):
+    """Set column on every row dict from the sentiment of its text_field"""
+    if not rows:
+        return rows
+    scores = score_texts([row.get(text_field) or '' for row in rows], scorer, workers)
+    for row, value in zip(rows, scores.tolist()):
+        row[column] = value
+    return rows
+
+
+class SentimentStage:
+    """Sink wrapper that scores buffered rows in one batch before they are written.
+
+    Has the same interface as the sinks in sinks.py, so a scraper can write
+    rows to it unchanged and the wrapped sink receives them with the score
+    column filled in.
+    """
+
+    def __init__(self, sink, scorer=None, workers=None, text_field=TEXT_COLUMN, column=SCORE_COLUMN,
+                 batch_size=None):
+        self.sink = sink
+        self.batch_size = batch_size or getattr(sink, 'batch_size', DEFAULT_BATCH_SIZE)
+        self.scorer = scorer or SentimentScorer()
+        self.workers = workers
+        self.text_field = text_field
+        self.column = column
+        self.buffer = []
+
+    @property
+    def pending(self):
+        return len(self.buffer) + self.sink.pending
+
+    @property
+    def existing_rows(self):
+        return self.sink.existing_rows
+
+    def write(self, row):
+        self.buffer.append(row)
+
+    def write_many(self, rows):
+        self.buffer.extend(rows)
+
+    def should_flush(self):
+        return len(self.buffer) >= self.batch_size
+
+    def flush(self):
+        if self.buffer:
+            self.sink.write_many(score_rows(self.buffer, self.scorer, self.workers, self.text_field, self.column))
+            self.buffer = []
+        self.sink.flush()
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+def scorer_from_config(config=None):
+    """SentimentScorer using [Sentiment] lexicon from config.ini if set, else the built-in lexicon"""
+    path = config.get('Sentiment', 'lexicon', fallback='') if config is not None else ''
+    if path:
+        logger.info(f"Loading sentiment lexicon from {path}")
+        return SentimentScorer(load_lexicon(path))
+    return SentimentScorer()
+
+
+def enrich_csv(path, workers=None, rescore=False, lexicon=None, batch_size=100000):
+    """Fill the Sentiment Score column of an existing CSV file in place.
+
+    Rows are scored batch_size at a time; only rows without a score are
+    scored unless rescore is set. The file is rewritten via a temp file.
+    """
+    scorer = SentimentScorer(lexicon)
+    tmp_path = path + '.tmp'
+    scored = 0
+    with open(path, 'r', newline='', encoding='utf-8') as src, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+        reader = csv.DictReader(src)
+        fieldnames = list(reader.fieldnames or [])
+        if SCORE_COLUMN not in fieldnames:
+            fieldnames.append(SCORE_COLUMN)
+        writer = csv.DictWriter(dst, fieldnames=fieldnames)
+        writer.writeheader()
+
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                scored += _enrich_batch(batch, writer, scorer, workers, rescore)
+                batch = []
+        scored += _enrich_batch(batch, writer, scorer, workers, rescore)
+    os.replace(tmp_path, path)
+    return scored
+
+
+def _enrich_batch(rows, writer, scorer, workers, rescore):
+    todo = [row for row in rows if rescore or not row.get(SCORE_COLUMN)]
+    if todo:
+        scores = score_texts([row.get(TEXT_COLUMN) or '' for row in todo], scorer, workers)
+        for row, value in zip(todo, scores.tolist()):
+            row[SCORE_COLUMN] = value
+    writer.writerows(rows)
+    return len(todo)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Add lexicon sentiment scores to a scraped CSV file")
+    parser.add_argument('csv_file', nargs='?', default='tweets.csv')
+    parser.add_argument('--all', action='store_true', help="rescore rows that already have a score")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument('--lexicon', help="VADER-format lexicon file to use instead of the built-in one")
+    args = parser.parse_args()
+
+    lexicon = load_lexicon(args.lexicon) if args.lexicon else None
+    count = enrich_csv(args.csv_file, workers=args.workers, rescore=args.all, lexicon=lexicon)
+    logger.info(f"Scored {count} rows in {args.csv_file}")
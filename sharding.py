@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import calendar
+import logging
+import math
+import re
+import time
+from datetime import datetime, timezone
+
+from twitterscrap import TwitterScraper, QUERY, MINIMUM_TWEETS, OUTPUT_FILE
+from metrics import METRICS, MetricsExporter
+from entities import extract_page
+
+logger = logging.getLogger(__name__)
+
+# Tweet IDs are snowflakes: milliseconds since this epoch, shifted left 22 bits
+TWITTER_EPOCH_MS = 1288834974657
+PAGE_SIZE = 20
+
+DEFAULT_SHARDS = 4
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_PAGES_PER_SHARD = 25
+DEFAULT_MIN_WINDOW = 60 * 60
+MAX_SPLIT = 8
+# A failed window is requeued this many times, waiting longer each time
+MAX_WINDOW_RETRIES = 3
+WINDOW_RETRY_DELAY = 60
+
+DATE_OPERATOR = re.compile(r'\b(since|until):(\d{4})-(\d{1,2})-(\d{1,2})\b')
+
+
+def snowflake_time(tweet_id):
+    """Creation time (Unix seconds) encoded in a tweet ID"""
+    return ((int(tweet_id) >> 22) + TWITTER_EPOCH_MS) / 1000
+
+
+def parse_range(query, now=None):
+    """Split a query into (query without since:/until:, start, end) in Unix seconds.
+
+    A missing until: means now; a missing since: is an error because the
+    range cannot be split without a lower bound.
+    """
+    bounds = {}
+    for operator, year, month, day in DATE_OPERATOR.findall(query):
+        bounds[operator] = calendar.timegm((int(year), int(month), int(day), 0, 0, 0))
+    if 'since' not in bounds:
+        raise ValueError(f"Query has no since: date to shard on: {query}")
+
+    base = ' '.join(DATE_OPERATOR.sub('', query).split())
+    end = bounds.get('until', now if now is not None else time.time())
+    return base, bounds['since'], end
+
+
+def window_query(base, start, end):
+    """Restrict a query to [start, end) with second-precision time operators"""
+    return f"{base} since_time:{int(start)} until_time:{int(math.ceil(end))}"
+
+
+def split_range(start, end, parts):
+    """Split [start, end) into `parts` equal windows, newest first"""
+    step = (end - start) / parts
+    windows = [(start + i * step, start + (i + 1) * step) for i in range(parts)]
+    return list(reversed(windows))
+
+
+def format_window(start, end):
+    fmt = '%Y-%m-%d %H:%M'
+    return (f"{datetime.fromtimestamp(start, timezone.utc).strftime(fmt)} .. "
+            f"{datetime.fromtimestamp(end, timezone.utc).strftime(fmt)}")
+
+
+class QuerySharder:
+    """Crawls one large search as concurrent time-window shards.
+
+    The query's since:/until: range is cut into `shards` windows, each
+    crawled with the scraper's get_tweets_batch (and so its retry, auth and
+    pacing logic). Windows are re-split by density: if a window's first page
+    shows it would need more than max_pages_per_shard pages, the part not yet
+    covered is split further and queued. Like scrape_tweets, every page goes
+    through the scraper's seen index, filter and near-duplicate index and is
+    saved before the next request, so tweets from overlapping boundaries or
+    earlier runs are dropped and an aborted crawl keeps what it collected.
+    A window that fails is requeued from its oldest saved page with a
+    growing delay, up to MAX_WINDOW_RETRIES times; windows still failing
+    after that are left in `failed`.
+
+    Density is estimated from tweet timestamps, so the 'Latest' product
+    (chronological) is used by default.
+    """
+
+    def __init__(self, scraper, shards=DEFAULT_SHARDS, concurrency=DEFAULT_CONCURRENCY,
+                 max_pages_per_shard=DEFAULT_MAX_PAGES_PER_SHARD, min_window=DEFAULT_MIN_WINDOW,
+                 product='Latest'):
+        self.scraper = scraper
+        self.shards = max(1, shards)
+        self.concurrency = max(1, concurrency)
+        self.max_pages_per_shard = max_pages_per_shard
+        self.min_window = min_window
+        self.product = product
+        self.collected = 0  # New tweets saved by this run
+        self.progress = {}  # (start, end) -> end of the part of the window still to crawl
+        self.failed = []  # Windows given up on after MAX_WINDOW_RETRIES
+
+    def done(self):
+        return self.collected >= self.scraper.minimum_tweets
+
+    async def crawl_window(self, base, start, end, queue):
+        query = window_query(base, start, end)
+        logger.info(f"Crawling window {format_window(start, end)}")
+        tweets = None
+        pages = 0
+
+        while not self.done():
+            tweets = await self.scraper.get_tweets_batch(tweets, query=query, product=self.product)
+            if not tweets:
+                break
+            pages += 1
+
+            times = [snowflake_time(tweet.id) for tweet in tweets]
+            newest, oldest = max(times), min(times)
+            # Same filters as scrape_tweets: IDs saved by any window or earlier
+            # run, local predicates, then near-duplicates
+            new_tweets = self.scraper.near_dups.filter_new(
+                self.scraper.search.filter(self.scraper.seen.filter_new(tweets)))
+            batch_count = 0
+            for tweet, entities in zip(new_tweets, extract_page(new_tweets)):
+                tweet_data = self.scraper.extract_tweet_data(tweet, entities)
+                if tweet_data:
+                    self.scraper.tweet_data_list.append(tweet_data)
+                    batch_count += 1
+            self.collected += batch_count
+            METRICS.inc('tweets_total', batch_count)
+            # Save the page before the next request, so an aborted crawl keeps it
+            self.scraper.save_data()
+            # A retry of this window only needs what is older than this page
+            self.progress[(start, end)] = oldest + 1
+
+            # After the first full page, estimate how many pages the window holds
+            if pages == 1 and len(tweets) >= PAGE_SIZE and oldest - start > 2 * self.min_window:
+                # One page spans newest..oldest; assume the rest of the window is as dense
+                estimated_pages = (newest - start) / max(newest - oldest, 1)
+                if estimated_pages > self.max_pages_per_shard:
+                    parts = min(MAX_SPLIT, math.ceil(estimated_pages / self.max_pages_per_shard))
+                    # [oldest, end) is covered by this page; split the rest.
+                    # Windows overlap by a second; the seen index drops duplicates.
+                    for window_start, window_end in split_range(start, oldest + 1, parts):
+                        queue.put_nowait((window_start, window_end, 0))
+                    logger.info(f"Window {format_window(start, end)} is dense (~{estimated_pages:.0f} pages), "
+                                f"split into {parts}")
+                    return
+
+    async def run(self):
+        """Crawl every window and return the number of new tweets saved"""
+        base, start, end = parse_range(self.scraper.query)
+        if self.scraper.client is None and self.scraper.pool is None:
+            await self.scraper.initialize_client()
+
+        queue = asyncio.Queue()
+        for window_start, window_end in split_range(start, end, self.shards):
+            queue.put_nowait((window_start, window_end, 0))
+
+        async def worker():
+            while True:
+                window_start, window_end, attempt = await queue.get()
+                try:
+                    if not self.done():
+                        await self.crawl_window(base, window_start, window_end, queue)
+                except Exception as e:
+                    remaining_end = self.progress.get((window_start, window_end), window_end)
+                    if attempt >= MAX_WINDOW_RETRIES:
+                        logger.error(f"Window {format_window(window_start, remaining_end)} failed "
+                                     f"{attempt + 1} times, giving up: {e}")
+                        self.failed.append((window_start, remaining_end))
+                    else:
+                        wait_time = WINDOW_RETRY_DELAY * (attempt + 1)
+                        logger.warning(f"Window {format_window(window_start, remaining_end)} failed, "
+                                       f"retrying in {wait_time} seconds: {e}")
+                        METRICS.sleep(wait_time, 'backoff')
+                        await asyncio.sleep(wait_time)
+                        # Requeued before task_done, so queue.join() keeps waiting for it
+                        queue.put_nowait((window_start, remaining_end, attempt + 1))
+                finally:
+                    self.progress.pop((window_start, window_end), None)
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        self.scraper.save_data(final=True)
+        return self.collected
+
+
+async def main(args):
+    scraper = TwitterScraper(query=args.query, minimum_tweets=args.target, output_file=args.output)
+    sharder = QuerySharder(scraper, shards=args.shards, concurrency=args.concurrency,
+                           max_pages_per_shard=args.max_pages, product=args.product)
+    exporter = MetricsExporter.from_config(scraper.config).start()
+    try:
+        new_count = await sharder.run()
+        logger.info(f"Sharded crawl completed: {new_count} new tweets saved to {args.output}")
+        if sharder.failed:
+            windows = ', '.join(format_window(start, end) for start, end in sharder.failed)
+            logger.error(f"{len(sharder.failed)} windows failed and were not crawled: {windows}")
+            return 1
+        return 0
+    except Exception as e:
+        logger.error(f"Sharded crawl failed: {e}")
+        return 1
+    finally:
+        scraper.close()
+        logger.info(exporter.stop())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl one search as concurrent date-window shards")
+    parser.add_argument('--query', default=QUERY, help="search query with a since: date")
+    parser.add_argument('--target', type=int, default=MINIMUM_TWEETS, help="stop after this many tweets")
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help="initial number of date windows")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES_PER_SHARD,
+                        help="split windows expected to need more pages than this")
+    parser.add_argument('--product', default='Latest')
+    exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,247 @@
+import csv
+import logging
+import os
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+# Format of twikit's Tweet.created_at, e.g. "Fri Jul 26 20:46:21 +0000 2024"
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+
+
+def parse_created_at(value):
+    """Parse a twikit created_at string into an aware UTC datetime"""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, CREATED_AT_FORMAT).astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+
+class CSVSink:
+    """Appends rows to a CSV file kept open for the whole run.
+
+    Rows are buffered and written in one go on flush(). If the file already
+    exists its header is reused and rows are matched to it by column name,
+    so scripts writing fewer columns than the file has still line up. A
+    header missing some of columns is extended once, rewriting the file
+    with those columns empty on the old rows. existing_rows is the number
+    of rows the file held when it was opened.
+    """
+
+    def __init__(self, path, columns, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.existing_rows = 0
+
+        fieldnames = [name for name, _ in columns]
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                fieldnames = next(reader, fieldnames)
+                self.existing_rows = sum(1 for _ in reader)
+            missing = [name for name, _ in columns if name not in fieldnames]
+            if missing:
+                fieldnames = fieldnames + missing
+                self.migrate(fieldnames)
+                logger.warning(f"Added columns {', '.join(missing)} to the header of {path}")
+
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, extrasaction='ignore')
+        if is_new:
+            self.writer.writeheader()
+
+    def migrate(self, fieldnames):
+        """Rewrite the file under a header of fieldnames"""
+        tmp_path = f'{self.path}.tmp'
+        with open(self.path, 'r', newline='', encoding='utf-8') as source, \
+                open(tmp_path, 'w', newline='', encoding='utf-8') as target:
+            writer = csv.DictWriter(target, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(csv.DictReader(source))
+        os.replace(tmp_path, self.path)
+
+    @property
+    def pending(self):
+        return len(self.buffer)
+
+    def write(self, row):
+        self.buffer.append(row)
+
+    def write_many(self, rows):
+        self.buffer.extend(rows)
+
+    def should_flush(self):
+        return len(self.buffer) >= self.batch_size
+
+    def flush(self):
+        """Write buffered rows and push them to the OS"""
+        start = self.file.tell()
+        if self.buffer:
+            self.writer.writerows(self.buffer)
+            self.buffer = []
+        self.file.flush()
+        METRICS.inc('bytes_written_total', self.file.tell() - start, target='csv')
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class ParquetSink:
+    """Writes rows as typed Parquet row groups.
+
+    Each run writes its own part file inside the ``path`` directory, so the
+    directory can be read as one dataset (pyarrow.dataset / pandas) while
+    earlier runs are kept; existing_rows counts their rows. Column types
+    come from the sink's column spec: 'int', 'float', 'str', 'bool' or
+    'timestamp'.
+    """
+
+    ARROW_TYPES = {
+        'int': lambda: pa.int64(),
+        'float': lambda: pa.float64(),
+        'str': lambda: pa.string(),
+        'bool': lambda: pa.bool_(),
+        'timestamp': lambda: pa.timestamp('s', tz='UTC'),
+    }
+
+    def __init__(self, path, columns, batch_size=DEFAULT_BATCH_SIZE):
+        if pa is None:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+        self.columns = columns
+        self.batch_size = batch_size
+        self.buffer = []
+        self.schema = pa.schema([(name, self.ARROW_TYPES[kind]()) for name, kind in columns])
+
+        os.makedirs(path, exist_ok=True)
+        # Footers hold the row counts, so the parts are not read
+        self.existing_rows = sum(pq.ParquetFile(os.path.join(path, name)).metadata.num_rows
+                                 for name in os.listdir(path) if name.endswith('.parquet'))
+        self.path = os.path.join(path, f"part-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.parquet")
+        self.writer = None
+        self.bytes_written = 0
+
+    @property
+    def pending(self):
+        return len(self.buffer)
+
+    def write(self, row):
+        self.buffer.append(row)
+
+    def write_many(self, rows):
+        self.buffer.extend(rows)
+
+    def should_flush(self):
+        return len(self.buffer) >= self.batch_size
+
+    def convert(self, kind, value):
+        if value is None or value == '':
+            return None
+        if kind == 'timestamp':
+            return parse_created_at(value)
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if kind == 'bool':
+            return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+        return str(value)
+
+    def flush(self):
+        """Write buffered rows as one row group"""
+        if not self.buffer:
+            return
+        arrays = {
+            name: [self.convert(kind, row.get(name)) for row in self.buffer]
+            for name, kind in self.columns
+        }
+        table = pa.Table.from_pydict(arrays, schema=self.schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+        self.buffer = []
+        self.count_written()
+
+    def count_written(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        METRICS.inc('bytes_written_total', size - self.bytes_written, target='parquet')
+        self.bytes_written = size
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            # Closing writes the footer
+            self.count_written()
+
+
+class MultiSink:
+    """Fans rows out to several sinks"""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    @property
+    def pending(self):
+        return max(sink.pending for sink in self.sinks)
+
+    @property
+    def existing_rows(self):
+        return max(sink.existing_rows for sink in self.sinks)
+
+    def write(self, row):
+        for sink in self.sinks:
+            sink.write(row)
+
+    def write_many(self, rows):
+        for sink in self.sinks:
+            sink.write_many(rows)
+
+    def should_flush(self):
+        return any(sink.should_flush() for sink in self.sinks)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def open_sink(csv_path, columns, config=None):
+    """Open the sinks selected by [Output] format in config.ini.
+
+    format is csv (default), parquet or both. The Parquet dataset goes next to
+    the CSV file, e.g. tweets.csv -> tweets.parquet/.
+    """
+    output_format = 'csv'
+    batch_size = DEFAULT_BATCH_SIZE
+    if config is not None:
+        output_format = config.get('Output', 'format', fallback='csv').strip().lower()
+        batch_size = config.getint('Output', 'batch_size', fallback=DEFAULT_BATCH_SIZE)
+
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    if output_format == 'csv':
+        return CSVSink(csv_path, columns, batch_size)
+    if output_format == 'parquet':
+        return ParquetSink(parquet_path, columns, batch_size)
+    if output_format == 'both':
+        return MultiSink([CSVSink(csv_path, columns, batch_size), ParquetSink(parquet_path, columns, batch_size)])
+    raise ValueError(f"Unknown output format '{output_format}' (expected csv, parquet or both)")
@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import logging
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when config.ini has no [Storage] section
+DEFAULT_BACKEND = 'jsonl'
+DEFAULT_FSYNC_EVERY = 10
+
+
+class JSONLStorage:
+    """Append-only JSON Lines store: one record per line, never rewritten"""
+
+    def __init__(self, path, fsync_every=DEFAULT_FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.pending_batches = 0
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, records):
+        """Append a batch of records to the end of the log"""
+        if not records:
+            return
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        self.file.write(data)
+        METRICS.inc('bytes_written_total', len(data.encode('utf-8')), target='storage')
+        self.pending_batches += 1
+        if self.pending_batches >= self.fsync_every:
+            self.flush()
+
+    def flush(self):
+        """Flush buffered writes and fsync them to disk"""
+        if self.file.closed:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending_batches = 0
+
+    def __iter__(self):
+        self.file.flush()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a truncated last line
+                    logger.warning(f"Skipping corrupt line in {self.path}")
+
+    def records_after(self, position=0):
+        """Yield (position, record) for records appended after position.
+
+        Positions are byte offsets into the log, so a reader can continue
+        where it stopped without re-reading earlier records.
+        """
+        self.file.flush()
+        with open(self.path, 'rb') as f:
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                position += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield position, json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt line in {self.path}")
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class SQLiteStorage:
+    """Append-only SQLite store keeping each record as a JSON payload"""
+
+    def __init__(self, path, fsync_every=DEFAULT_FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.pending_batches = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'data TEXT NOT NULL)'
+        )
+        self.conn.commit()
+
+    def append(self, records):
+        """Insert a batch of records; commits are grouped every fsync_every batches"""
+        if not records:
+            return
+        rows = [(json.dumps(record, ensure_ascii=False),) for record in records]
+        self.conn.executemany('INSERT INTO records (data) VALUES (?)', rows)
+        METRICS.inc('bytes_written_total', sum(len(data.encode('utf-8')) for data, in rows), target='storage')
+        self.pending_batches += 1
+        if self.pending_batches >= self.fsync_every:
+            self.flush()
+
+    def flush(self):
+        """Commit outstanding inserts"""
+        self.conn.commit()
+        self.pending_batches = 0
+
+    def __iter__(self):
+        self.conn.commit()
+        for (data,) in self.conn.execute('SELECT data FROM records ORDER BY seq'):
+            yield json.loads(data)
+
+    def records_after(self, position=0):
+        """Yield (position, record) for records after position (a row seq)"""
+        self.conn.commit()
+        for seq, data in self.conn.execute('SELECT seq, data FROM records WHERE seq > ? ORDER BY seq', (position,)):
+            yield seq, json.loads(data)
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+BACKENDS = {
+    'jsonl': (JSONLStorage, '.jsonl'),
+    'sqlite': (SQLiteStorage, '.db'),
+}
+
+
+def open_storage(output_file, config=None):
+    """Open the storage backend configured in the [Storage] section for output_file.
+
+    The log lives next to the JSON output (e.g. ``tweets.json.jsonl``). If the
+    log does not exist yet but a JSON export does, the export is imported once
+    so earlier runs are not lost.
+    """
+    backend = DEFAULT_BACKEND
+    fsync_every = DEFAULT_FSYNC_EVERY
+    if config is not None:
+        backend = config.get('Storage', 'backend', fallback=DEFAULT_BACKEND).strip().lower()
+        fsync_every = config.getint('Storage', 'fsync_every', fallback=DEFAULT_FSYNC_EVERY)
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+
+    storage_class, suffix = BACKENDS[backend]
+    path = output_file + suffix
+    is_new = not os.path.exists(path)
+    storage = storage_class(path, fsync_every=fsync_every)
+
+    if is_new and os.path.exists(output_file):
+        try:
+            with open(output_file, 'r', encoding='utf-8') as f:
+                existing_data = json.load(f)
+            storage.append(existing_data)
+            storage.flush()
+            logger.info(f"Imported {len(existing_data)} existing records from {output_file} into {path}")
+        except Exception as e:
+            logger.error(f"Error importing existing data from {output_file}: {e}")
+
+    return storage
+
+
+def export_json(storage, output_file, indent=2, unique_by=None):
+    """Compact the storage log into a single JSON array file.
+
+    Records are streamed one at a time, producing the same bytes as
+    ``json.dump(records, f, indent=indent, ensure_ascii=False)`` without
+    holding the dataset in memory. If unique_by is given, only the first
+    record for each non-empty key is kept. Returns the number of records written.
+    """
+    tmp_file = output_file + '.tmp'
+    count = 0
+    pad = ' ' * indent
+    seen_keys = set()
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for record in storage:
+            if unique_by is not None:
+                key = record.get(unique_by)
+                if not key or key in seen_keys:
+                    continue
+                seen_keys.add(key)
+            body = json.dumps(record, indent=indent, ensure_ascii=False)
+            f.write('[\n' if count == 0 else ',\n')
+            f.write(pad + body.replace('\n', '\n' + pad))
+            count += 1
+        f.write('\n]' if count else '[]')
+        f.flush()
+        os.fsync(f.fileno())
+        METRICS.inc('bytes_written_total', f.tell(), target='export')
+    os.replace(tmp_file, output_file)
+    return count
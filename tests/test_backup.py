@@ -0,0 +1,41 @@
+import pytest
+
+from backup import BackupManager
+from storage import JSONLStorage
+
+
+def records(start, stop):
+    return [{'username': f'user{i}', 'text': f'tweet {i} ✓', 'likes': i} for i in range(start, stop)]
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd', 'none'])
+def test_backup_restore_round_trip(tmp_path, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    storage = JSONLStorage(str(tmp_path / 'out.json.jsonl'))
+    manager = BackupManager(str(tmp_path / 'out.json'), directory=str(tmp_path / 'backups'),
+                            compression=compression, max_segments=2)
+
+    # The third backup compacts the chain into one multi-frame segment
+    for start in (0, 4, 8):
+        storage.append(records(start, start + 4))
+        assert manager.backup(storage) == 4
+    assert len(manager.segments()) == 1
+
+    assert list(manager.restore()) == records(0, 12)
+    storage.close()
+
+
+def test_backup_writes_only_new_records(tmp_path):
+    storage = JSONLStorage(str(tmp_path / 'out.json.jsonl'))
+    manager = BackupManager(str(tmp_path / 'out.json'), directory=str(tmp_path / 'backups'))
+
+    storage.append(records(0, 3))
+    assert manager.backup(storage) == 3
+    assert manager.backup(storage) == 0
+    storage.append(records(3, 5))
+    assert manager.backup(storage) == 2
+
+    assert [segment.first for segment in manager.segments()] == [1, 2]
+    assert list(manager.restore()) == records(0, 5)
+    storage.close()
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from dedup import SeenIndex
+
+
+def tweets(*ids):
+    return [SimpleNamespace(id=tweet_id) for tweet_id in ids]
+
+
+def test_seen_index_filters_across_runs(tmp_path):
+    path = str(tmp_path / 'progress.db')
+    seen = SeenIndex('out.json', path)
+    assert [tweet.id for tweet in seen.filter_new(tweets('1', '2', '2'))] == ['1', '2']
+    seen.close()
+
+    seen = SeenIndex('out.json', path)
+    assert '1' in seen and 2 in seen
+    assert [tweet.id for tweet in seen.filter_new(tweets('2', '3'))] == ['3']
+    seen.close()
+
+
+def test_seen_index_keeps_uncommitted_ids_out_of_other_runs(tmp_path):
+    path = str(tmp_path / 'progress.db')
+    seen = SeenIndex('out.json', path)
+    seen.add('1')
+    # A crash before commit() must not hide the tweet from the next run
+    other = SeenIndex('out.json', path)
+    assert '1' not in other
+    seen.commit()
+    assert '1' in other
+    seen.close()
+    other.close()
+
+
+def test_seen_index_namespaces_are_independent(tmp_path):
+    path = str(tmp_path / 'progress.db')
+    first = SeenIndex('a.json', path)
+    second = SeenIndex('b.json', path)
+    first.add('1')
+    first.commit()
+    assert '1' not in second
+    assert second.add('1')
+    first.close()
+    second.close()
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from http_transport import CachingTransport, CACHE_HEADER, bypass_cache
+
+
+class CountingTransport(httpx.BaseTransport):
+    def __init__(self):
+        self.calls = 0
+
+    def handle_request(self, request):
+        self.calls += 1
+        return httpx.Response(200, json={'call': self.calls}, headers={'x-rate-limit-remaining': '49'})
+
+
+def search_request(query='python', cursor=None, features='{}'):
+    variables = {'rawQuery': query, 'product': 'Latest', 'count': 20}
+    if cursor:
+        variables['cursor'] = cursor
+    return httpx.Request('GET', 'https://x.com/i/api/graphql/abc/SearchTimeline',
+                         params={'variables': json.dumps(variables), 'features': features})
+
+
+@pytest.fixture
+def transport(tmp_path):
+    inner = CountingTransport()
+    return CachingTransport(str(tmp_path), transport=inner), inner
+
+
+def test_repeated_request_is_a_cache_hit(transport):
+    cache, inner = transport
+    first = cache.handle_request(search_request())
+    second = cache.handle_request(search_request(features='{"flag": true}'))
+    assert inner.calls == 1
+    assert CACHE_HEADER not in first.headers
+    assert second.headers[CACHE_HEADER] == 'hit'
+    assert 'x-rate-limit-remaining' not in second.headers
+    assert second.json() == first.json()
+
+
+def test_first_and_continuation_pages_are_cached(transport):
+    cache, inner = transport
+    for _ in range(2):
+        cache.handle_request(search_request())
+        cache.handle_request(search_request(cursor='page-2'))
+    assert inner.calls == 2
+
+
+def test_bypass_cache_goes_to_the_network(transport):
+    cache, inner = transport
+    cache.handle_request(search_request())
+    with bypass_cache():
+        response = cache.handle_request(search_request())
+    assert inner.calls == 2
+    assert CACHE_HEADER not in response.headers
+    # Outside the block the cache is used again
+    cache.handle_request(search_request())
+    assert inner.calls == 2
+
+
+def test_expired_entries_are_refetched(tmp_path):
+    inner = CountingTransport()
+    cache = CachingTransport(str(tmp_path), ttl=0, transport=inner)
+    cache.handle_request(search_request())
+    cache.handle_request(search_request())
+    assert inner.calls == 2
+
+
+def test_other_endpoints_are_not_cached(transport):
+    cache, inner = transport
+    request = httpx.Request('GET', 'https://x.com/i/api/graphql/abc/UserByScreenName')
+    cache.handle_request(request)
+    cache.handle_request(request)
+    assert inner.calls == 2
+
+
+def test_bypass_cache_covers_only_its_own_task(tmp_path):
+    class AsyncCountingTransport(httpx.AsyncBaseTransport):
+        calls = 0
+
+        async def handle_async_request(self, request):
+            self.calls += 1
+            return httpx.Response(200, json={'call': self.calls})
+
+    inner = AsyncCountingTransport()
+    cache = CachingTransport(str(tmp_path), transport=inner)
+
+    async def probe():
+        with bypass_cache():
+            await asyncio.sleep(0)
+            await cache.handle_async_request(search_request())
+
+    async def crawl():
+        await asyncio.sleep(0)
+        await cache.handle_async_request(search_request())
+
+    async def run():
+        await cache.handle_async_request(search_request())
+        await asyncio.gather(probe(), crawl())
+
+    asyncio.run(run())
+    # The probe reached the network; the concurrent crawl got the cached page
+    assert inner.calls == 2
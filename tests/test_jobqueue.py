@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+# jobqueue.py runs its jobs with TwitterScraper, which needs twikit
+pytest.importorskip('twikit')
+
+from jobqueue import JobQueue  # noqa: E402
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    yield queue
+    queue.close()
+
+
+def status(queue, job_id):
+    return next(job for job in queue.jobs() if job['id'] == job_id)
+
+
+def test_add_ignores_duplicate_jobs(queue):
+    assert queue.add('ai', target=10, output='ai.json') is not None
+    assert queue.add('ai', target=10, output='ai.json') is None
+    assert queue.counts() == {'pending': 1}
+
+
+def test_a_leased_job_is_not_leased_again(queue):
+    first = queue.add('ai', output='ai.json')
+    second = queue.add('crypto', output='crypto.json')
+    job = queue.lease('worker-1')
+    assert job['id'] == first and job['attempts'] == 1 and job['lease_owner'] == 'worker-1'
+    assert queue.lease('worker-2')['id'] == second
+    assert queue.lease('worker-3') is None
+
+
+def test_heartbeat_saves_progress_for_the_lease_holder_only(queue):
+    job_id = queue.add('ai', output='ai.json')
+    queue.lease('worker-1')
+    progress = {'cursor': 'cursor-2', 'tweet_count': 40, 'last_tweet_id': '202'}
+    assert queue.heartbeat(job_id, 'worker-1', progress=progress)
+    assert not queue.heartbeat(job_id, 'worker-2', progress={'cursor': 'other'})
+    job = status(queue, job_id)
+    assert (job['cursor'], job['tweet_count'], job['last_tweet_id']) == ('cursor-2', 40, '202')
+
+
+def test_expired_lease_is_taken_over_with_its_cursor(queue):
+    job_id = queue.add('ai', output='ai.json')
+    queue.lease('worker-1', lease_seconds=0.01)
+    queue.heartbeat(job_id, 'worker-1', lease_seconds=0.01, progress={'cursor': 'cursor-3'})
+    time.sleep(0.05)
+
+    job = queue.lease('worker-2')
+    assert job['id'] == job_id and job['attempts'] == 2 and job['cursor'] == 'cursor-3'
+    # The dead worker can no longer touch the job
+    assert not queue.heartbeat(job_id, 'worker-1')
+    assert not queue.complete(job_id, 'worker-1')
+    assert queue.complete(job_id, 'worker-2')
+    assert queue.counts() == {'done': 1}
+
+
+def test_expired_lease_without_attempts_left_fails(queue):
+    job_id = queue.add('ai', output='ai.json', max_attempts=1)
+    queue.lease('worker-1', lease_seconds=0.01)
+    time.sleep(0.05)
+    assert queue.lease('worker-2') is None
+    job = status(queue, job_id)
+    assert job['status'] == 'failed' and job['last_error'] == 'lease expired'
+
+
+def test_fail_retries_until_max_attempts(queue):
+    job_id = queue.add('ai', output='ai.json', max_attempts=2)
+    queue.lease('worker-1')
+    assert queue.fail(job_id, 'worker-1', 'timeout')
+    assert status(queue, job_id)['status'] == 'pending'
+
+    queue.lease('worker-1')
+    queue.fail(job_id, 'worker-1', 'timeout again')
+    job = status(queue, job_id)
+    assert job['status'] == 'failed' and job['last_error'] == 'timeout again'
+
+    assert queue.retry_failed() == 1
+    job = status(queue, job_id)
+    assert job['status'] == 'pending' and job['attempts'] == 0
+
+
+def test_fail_without_retry_fails_right_away(queue):
+    job_id = queue.add('ai', output='ai.json')
+    queue.lease('worker-1')
+    assert not queue.fail(job_id, 'worker-2', 'not mine')
+    queue.fail(job_id, 'worker-1', 'search ran out', retry=False)
+    assert status(queue, job_id)['status'] == 'failed'
@@ -0,0 +1,28 @@
+from progress import CrawlCheckpoint, WatchState
+
+
+def test_checkpoint_resumes_from_last_page(tmp_path):
+    path = str(tmp_path / 'progress.db')
+    checkpoint = CrawlCheckpoint('ai', 'Top', path)
+    assert checkpoint.load() is None
+    checkpoint.save('cursor-1', 20, 101)
+    checkpoint.save('cursor-2', 40, 202)
+    checkpoint.close()
+
+    checkpoint = CrawlCheckpoint('ai', 'Top', path)
+    saved = checkpoint.load()
+    assert (saved['cursor'], saved['tweet_count'], saved['last_tweet_id']) == ('cursor-2', 40, '202')
+    assert CrawlCheckpoint('ai', 'Latest', path).load() is None
+    checkpoint.clear()
+    assert checkpoint.load() is None
+    checkpoint.close()
+
+
+def test_watch_state_round_trip(tmp_path):
+    path = str(tmp_path / 'progress.db')
+    state = WatchState('ai', path)
+    assert state.load() is None
+    state.save(1816911456789012345, 12)
+    state.close()
+    saved = WatchState('ai', path).load()
+    assert (saved['since_id'], saved['tweet_count']) == ('1816911456789012345', 12)
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from search_index import SearchIndex
+from sinks import CSVSink
+from storage import JSONLStorage
+
+COLUMNS = [('Username', 'str'), ('Text', 'str'), ('Likes', 'int')]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search_index.db'))
+    yield index
+    index.close()
+
+
+def texts(results):
+    return sorted(result['text'] for result in results)
+
+
+def test_storage_log_is_indexed_incrementally(tmp_path, index):
+    output = str(tmp_path / 'tweets.json')
+    storage = JSONLStorage(output + '.jsonl')
+    storage.append([{'username': 'a', 'text': 'bitcoin to the moon', 'likes': 5},
+                    {'username': 'b', 'text': 'gold supercycle is real', 'likes': 50}])
+    storage.flush()
+    assert index.update([output]) == 2
+
+    storage.append([{'username': 'c', 'text': 'bitcoin halving soon', 'likes': 500}])
+    storage.close()
+    # Only the record appended since the last update is read
+    assert index.update([output]) == 1
+    assert index.update([output]) == 0
+    assert texts(index.search(keywords='bitcoin')) == ['bitcoin halving soon', 'bitcoin to the moon']
+    assert texts(index.search(min_likes=100)) == ['bitcoin halving soon']
+
+
+def test_csv_is_indexed_incrementally(tmp_path, index):
+    path = str(tmp_path / 'tweets.csv')
+    sink = CSVSink(path, COLUMNS)
+    sink.write({'Username': 'a', 'Text': 'stock market rally', 'Likes': 10})
+    sink.flush()
+    assert index.update([path]) == 1
+
+    sink.write({'Username': 'b', 'Text': 'stock market crash', 'Likes': 20})
+    sink.close()
+    assert index.update([path]) == 1
+    assert texts(index.search(phrase='stock market')) == ['stock market crash', 'stock market rally']
+    assert index.stats()[0][2] == 2
+
+
+def test_csv_rewritten_with_new_columns_is_indexed_again(tmp_path, index):
+    path = str(tmp_path / 'tweets.csv')
+    sink = CSVSink(path, COLUMNS)
+    sink.write({'Username': 'a', 'Text': 'stock market rally', 'Likes': 10})
+    sink.close()
+    index.update([path])
+
+    # Extending the header rewrites the file, so byte offsets no longer apply
+    sink = CSVSink(path, COLUMNS + [('Sentiment Score', 'float')])
+    sink.write({'Username': 'b', 'Text': 'rate cut today', 'Likes': 20, 'Sentiment Score': 0.1})
+    sink.close()
+    index.update([path])
+    assert texts(index.search()) == ['rate cut today', 'stock market rally']
+
+
+def test_json_file_is_indexed_again_only_when_it_changes(tmp_path, index):
+    path = tmp_path / 'fortyIQ.json'
+    conversation = {'parent_tweet': {'text': 'ai agents are here', 'metrics': {'like_count': 3}},
+                    'reply': {'text': 'agents need memory', 'metrics': {'like_count': 7}}}
+    path.write_text(json.dumps([conversation]), encoding='utf-8')
+    assert index.update([str(path)]) == 2
+    assert index.update([str(path)]) == 0
+
+    path.write_text(json.dumps([conversation, {'username': 'd', 'text': 'new tweet', 'likes': 1}]),
+                    encoding='utf-8')
+    assert index.update([str(path)]) == 3
+    assert texts(index.search(keywords='agents')) == ['agents need memory', 'ai agents are here']
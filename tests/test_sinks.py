@@ -0,0 +1,57 @@
+import csv
+
+from sinks import CSVSink
+
+COLUMNS = [('Tweet_count', 'int'), ('Username', 'str'), ('Text', 'str')]
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_rows_are_buffered_until_flush(tmp_path):
+    path = str(tmp_path / 'tweets.csv')
+    sink = CSVSink(path, COLUMNS, batch_size=2)
+    sink.write({'Tweet_count': 1, 'Username': 'a', 'Text': 'x'})
+    assert not sink.should_flush()
+    assert ['1', 'a', 'x'] not in read_rows(path)
+    sink.write({'Tweet_count': 2, 'Username': 'b', 'Text': 'y'})
+    assert sink.should_flush()
+    sink.flush()
+    assert len(read_rows(path)) == 3
+    sink.close()
+
+
+def test_reopened_file_appends_under_its_header(tmp_path):
+    path = str(tmp_path / 'tweets.csv')
+    sink = CSVSink(path, COLUMNS)
+    sink.write({'Tweet_count': 1, 'Username': 'a', 'Text': 'x'})
+    sink.close()
+
+    # Columns are matched by name, whatever order the script lists them in
+    sink = CSVSink(path, list(reversed(COLUMNS)))
+    assert sink.existing_rows == 1
+    sink.write({'Tweet_count': 2, 'Username': 'b', 'Text': 'y'})
+    sink.close()
+    assert read_rows(path) == [['Tweet_count', 'Username', 'Text'], ['1', 'a', 'x'], ['2', 'b', 'y']]
+
+
+def test_header_is_extended_with_new_columns(tmp_path):
+    path = str(tmp_path / 'tweets.csv')
+    sink = CSVSink(path, COLUMNS)
+    sink.write_many([{'Tweet_count': 1, 'Username': 'a', 'Text': 'x'},
+                     {'Tweet_count': 2, 'Username': 'b', 'Text': 'y'}])
+    sink.close()
+
+    sink = CSVSink(path, COLUMNS + [('Likes', 'int'), ('Sentiment Score', 'float')])
+    assert sink.existing_rows == 2
+    sink.write({'Tweet_count': 3, 'Username': 'c', 'Text': 'z', 'Likes': 5, 'Sentiment Score': 0.5})
+    sink.close()
+    assert read_rows(path) == [
+        ['Tweet_count', 'Username', 'Text', 'Likes', 'Sentiment Score'],
+        ['1', 'a', 'x', '', ''],
+        ['2', 'b', 'y', '', ''],
+        ['3', 'c', 'z', '5', '0.5'],
+    ]
+    assert not (tmp_path / 'tweets.csv.tmp').exists()
@@ -1,22 +1,43 @@
 import re
 from twikit import Client, TooManyRequests
-import time
 from datetime import datetime
-import json
 from configparser import ConfigParser
 from random import randint
+import argparse
+
+from dedup import SeenIndex
+from progress import CrawlCheckpoint
+from storage import open_storage, export_json
+from pacing import Pacer
+from http_transport import client_kwargs
+from metrics import METRICS, MetricsExporter
+from neardup import NearDuplicateIndex
+from watch import Watcher
+from search_index import update_index
 
 minimum_tweets =300
 query = 'stock market -filter:replies'
-def get_tweets(tweets):
+product = 'Top'
+output_file = 'ahmedalbalaghicomplete.json'
+
+parser = argparse.ArgumentParser(description='Scrape tweets into ' + output_file)
+parser.add_argument('--resume', action='store_true', help='continue from the cursor saved in tweet_progress.db')
+parser.add_argument('--watch', action='store_true', help='keep polling for new tweets until Ctrl+C (see [Watch] in config.ini)')
+args = parser.parse_args()
+
+@METRICS.timed('get_tweets_batch_seconds')
+def get_tweets(tweets, cursor=None):
+    # Wait as long as the remaining quota requires
+    pacer.wait_sync()
     if tweets is None:
         print(f'{datetime.now()} - Getting tweets...')
-        tweets = client.search_tweet(query, product='Top')
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            tweets = client.search_tweet(query, product=product, cursor=cursor)
     else:
-        wait_time = randint(10, 20)
-        print(f'{datetime.now()} - Getting next tweets after {wait_time} seconds...')
-        time.sleep(wait_time)
-        tweets = tweets.next()
+        print(f'{datetime.now()} - Getting next tweets...')
+        with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+            tweets = tweets.next()
+    METRICS.inc('requests_total', endpoint='SearchTimeline')
     return tweets
 
 # Login credentials
@@ -26,32 +47,47 @@ username = config['X']['username']
 email = config['X']['email']
 password = config['X']['password']
 
+# Writes [Metrics] export_file every interval seconds while the script runs
+exporter = MetricsExporter.from_config(config).start()
+
 # Authenticate to X.com
-client = Client(language='en-US')
+client = Client(language='en-US', **client_kwargs(config))
 client.load_cookies('cookies.json')
 
+# Paces requests from the rate-limit headers of each response
+pacer = Pacer.from_config(config)
+pacer.attach(client)
+
 tweet_count = 0
 tweets = None
+cursor = None
+last_tweet_id = None
 
-# Initialize list to store tweet data
-tweet_data_list = []
+# Pages are appended to a log next to output_file as they arrive, so an
+# interrupted run keeps what it collected and can --resume from its cursor
+storage = open_storage(output_file, config)
 
-while tweet_count < minimum_tweets:
-    try:
-        tweets = get_tweets(tweets)
-    except TooManyRequests as e:
-        rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
-        print(f'{datetime.now()} - Rate limit reached. Waiting until {rate_limit_reset}')
-        wait_time = rate_limit_reset - datetime.now()
-        time.sleep(wait_time.total_seconds())
-        continue
+# Tweet IDs already written to output_file by earlier runs
+seen = SeenIndex(output_file)
+# Drops (or flags) tweets repeating an earlier text with other links/mentions
+near_dups = NearDuplicateIndex.from_config(output_file, config)
 
-    if not tweets:
-        print(f'{datetime.now()} - No more tweets found on topic')
-        break
+checkpoint = CrawlCheckpoint(query, product)
+saved = checkpoint.load() if args.resume else None
+if saved and saved['cursor']:
+    cursor = saved['cursor']
+    tweet_count = saved['tweet_count']
+    last_tweet_id = saved['last_tweet_id']
+    print(f'{datetime.now()} - Resuming from checkpoint saved at {saved["updated_at"]} ({tweet_count} tweets)')
+
+def extract_page(page):
+    # Initialize list to store this page's tweet data
+    global tweet_count, last_tweet_id
+    tweet_data_list = []
 
-    for tweet in tweets:
+    for tweet in near_dups.filter_new(seen.filter_new(page)):
         tweet_count += 1
+        last_tweet_id = tweet.id
 
         # Extract likes (favorite count)
         likes = getattr(tweet, 'favorite_count', 0)
@@ -66,18 +102,64 @@ while tweet_count < minimum_tweets:
         # Append the tweet data to the list
         tweet_data_list.append(tweet_data)
 
+    METRICS.inc('tweets_total', len(tweet_data_list))
+    return tweet_data_list
+
+
+def emit(new_tweets):
+    # Watch mode: append every poll to the storage log right away
+    with METRICS.timer('save_seconds'):
+        storage.append(extract_page(new_tweets))
+        storage.flush()
+        seen.commit()
+        near_dups.commit()
+    print(f'{datetime.now()} - Got {tweet_count} tweets')
+
+
+if args.watch:
+    # Poll for tweets newer than the last one stored until Ctrl+C; the JSON
+    # file is rebuilt when the watch stops
+    print(f'{datetime.now()} - Watching: {query}')
+    Watcher.from_config(client, query, pacer, config).run(emit)
+
+while not args.watch and tweet_count < minimum_tweets:
+    try:
+        tweets = get_tweets(tweets, cursor)
+    except TooManyRequests as e:
+        rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
+        print(f'{datetime.now()} - Rate limit reached. Waiting until {rate_limit_reset}')
+        METRICS.inc('rate_limited_total', endpoint='SearchTimeline')
+        # The pacer holds the retry until the reset (never a negative wait)
+        pacer.rate_limited(e.rate_limit_reset + randint(5, 10))  # Add a small buffer
+        continue
+
+    if not tweets:
+        print(f'{datetime.now()} - No more tweets found on topic')
+        checkpoint.clear()
+        break
+
+    tweet_data_list = extract_page(tweets)
+
+    # Store the page, then remember its IDs and cursor
+    with METRICS.timer('save_seconds'):
+        storage.append(tweet_data_list)
+        seen.commit()
+        near_dups.commit()
+        checkpoint.save(tweets.next_cursor, tweet_count, last_tweet_id)
+
     print(f'{datetime.now()} - Got {tweet_count} tweets')
 
-# Load existing data from the JSON file if it exists
-try:
-    with open('ahmedalbalaghicomplete.json', 'r', encoding='utf-8') as json_file:
-        existing_data = json.load(json_file)
-        tweet_data_list = existing_data + tweet_data_list
-except FileNotFoundError:
-    pass  # No existing data, start fresh
+# Write all collected tweet data (including earlier runs) to the JSON file
+with METRICS.timer('save_seconds'):
+    storage.flush()
+    total = export_json(storage, output_file, indent=4)
 
-# Write the collected tweet data to a JSON file
-with open('ahmedalbalaghicomplete.json', 'w', encoding='utf-8') as json_file:
-    json.dump(tweet_data_list, json_file, indent=4, ensure_ascii=False)
+storage.close()
+seen.close()
+near_dups.close()
+checkpoint.close()
+# Index the new tweets when [Index] auto_update is on
+update_index(config, [output_file])
 
-print(f'{datetime.now()} - Done! Got {tweet_count} tweets.')
+print(f'{datetime.now()} - Done! Got {tweet_count} tweets ({total} in {output_file}).')
+print(f'{datetime.now()} - {exporter.stop()}')
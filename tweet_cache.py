@@ -0,0 +1,126 @@
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+TWEET_CACHE_DB = 'tweet_cache.db'
+DEFAULT_CAPACITY = 10000
+
+# Tweet attributes kept in the cache (named as on twikit's Tweet)
+TWEET_FIELDS = ('id', 'text', 'created_at', 'lang', 'favorite_count', 'retweet_count',
+                'reply_count', 'quote_count', 'in_reply_to')
+
+
+class CachedTweet:
+    """Stand-in for a twikit Tweet rebuilt from the cache.
+
+    Exposes the same attribute names for the cached fields, plus
+    ``user.id`` / ``user.name``, so scraper code can use it unchanged.
+    """
+
+    def __init__(self, data):
+        for field in TWEET_FIELDS:
+            setattr(self, field, data.get(field))
+        self.user = SimpleNamespace(id=data.get('user_id'), name=data.get('user_name'))
+
+    def __repr__(self):
+        return f'<CachedTweet id="{self.id}">'
+
+
+def tweet_to_dict(tweet):
+    """Serialize the cached fields of a twikit Tweet (or CachedTweet)"""
+    data = {field: getattr(tweet, field, None) for field in TWEET_FIELDS}
+    data['id'] = str(data['id'])
+    user = getattr(tweet, 'user', None)
+    data['user_id'] = str(getattr(user, 'id', '')) if user is not None else None
+    data['user_name'] = getattr(user, 'name', None) if user is not None else None
+    return data
+
+
+class TweetCache:
+    """LRU of tweets in memory, backed by a SQLite table on disk.
+
+    Lookups hit the in-memory LRU first and fall back to tweet_cache.db, so
+    a tweet fetched once is never requested again, in this run or later ones.
+    """
+
+    def __init__(self, path=TWEET_CACHE_DB, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS tweets ('
+            'tweet_id TEXT PRIMARY KEY, '
+            'data TEXT NOT NULL)'
+        )
+        self.conn.commit()
+
+    def _remember(self, tweet_id, tweet):
+        self.memory[tweet_id] = tweet
+        self.memory.move_to_end(tweet_id)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def get_many(self, tweet_ids):
+        """Return {tweet_id: tweet} for the ids found in memory or on disk"""
+        found = {}
+        missing = []
+        for tweet_id in map(str, tweet_ids):
+            if tweet_id in self.memory:
+                self.memory.move_to_end(tweet_id)
+                found[tweet_id] = self.memory[tweet_id]
+            else:
+                missing.append(tweet_id)
+
+        # SQLite limits the number of bound parameters per statement
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'SELECT tweet_id, data FROM tweets WHERE tweet_id IN ({placeholders})', chunk
+            )
+            for tweet_id, data in rows:
+                tweet = CachedTweet(json.loads(data))
+                self._remember(tweet_id, tweet)
+                found[tweet_id] = tweet
+        return found
+
+    def get(self, tweet_id):
+        return self.get_many([tweet_id]).get(str(tweet_id))
+
+    def put_many(self, tweets):
+        """Store tweets in memory and on disk"""
+        rows = []
+        for tweet in tweets:
+            data = tweet_to_dict(tweet)
+            self._remember(data['id'], tweet)
+            rows.append((data['id'], json.dumps(data, ensure_ascii=False, default=str)))
+        self.conn.executemany('INSERT OR REPLACE INTO tweets (tweet_id, data) VALUES (?, ?)', rows)
+        self.conn.commit()
+
+    def put(self, tweet):
+        self.put_many([tweet])
+
+    def resolve(self, tweet_ids, fetch_many):
+        """Return {tweet_id: tweet} for tweet_ids, fetching only cache misses.
+
+        fetch_many(ids) is called once with every missing id and must return
+        the tweets it could find; those are added to the cache.
+        """
+        tweet_ids = list(dict.fromkeys(map(str, tweet_ids)))
+        found = self.get_many(tweet_ids)
+        missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in found]
+        if missing:
+            fetched = [tweet for tweet in fetch_many(missing) if tweet is not None]
+            self.put_many(fetched)
+            found.update((str(tweet.id), tweet) for tweet in fetched)
+            logger.info(f"Resolved {len(tweet_ids)} tweets: {len(tweet_ids) - len(missing)} cached, "
+                        f"{len(fetched)} fetched")
+        return found
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -1,13 +1,28 @@
 import asyncio
-import json
 import time
 from datetime import datetime, timedelta
-from random import randint, uniform
+from random import randint
 from configparser import ConfigParser
 import os
 import logging
+import argparse
 from pathlib import Path
 
+from storage import open_storage, export_json
+from dedup import SeenIndex
+from progress import CrawlCheckpoint
+from client_pool import ClientPool, account_sections
+from pacing import Pacer
+from http_transport import client_kwargs, bypass_cache
+from records import TweetRecord, RecordBuffer, as_dicts, DEFAULT_MAX_IN_MEMORY
+from metrics import METRICS, MetricsExporter
+from backup import BackupManager
+from neardup import NearDuplicateIndex
+from filters import FilterSpec
+from search_index import SearchIndex
+from auth_cache import AuthCache
+from entities import extract_entities, extract_page
+
 try:
     from twikit import Client, TooManyRequests, BadRequest, Unauthorized
 except ImportError:
@@ -17,10 +32,15 @@ except ImportError:
 # Configuration
 MINIMUM_TWEETS = 50
 QUERY = '(ai) min_faves:100 since:2025-5-10 -filter:links -filter:replies'
+PRODUCT = 'Top'
 COOKIES_FILE = 'cookies.json'
 CONFIG_FILE = 'config.ini'
 OUTPUT_FILE = 'buildinpublicbest.json'
 LOG_FILE = 'scraper.log'
+# Failed pages in a row before a crawl gives up
+MAX_CONSECUTIVE_ERRORS = 5
+# Pages iter_tweets fetches ahead of its consumer
+DEFAULT_PREFETCH = 1
 
 # Setup logging
 logging.basicConfig(
@@ -34,11 +54,37 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class TwitterScraper:
-    def __init__(self):
-        self.client = None
+    def __init__(self, query=QUERY, minimum_tweets=MINIMUM_TWEETS, output_file=OUTPUT_FILE,
+                 client=None, budget=None, pool=None, product=PRODUCT, filters=None):
+        self.query = query
+        self.product = product
+        self.minimum_tweets = minimum_tweets
+        self.output_file = output_file
+        self.client = client  # An already authenticated client can be shared between scrapers
+        self.budget = budget  # Optional RequestBudget shared between scrapers
+        self.pool = pool  # Optional ClientPool, used instead of client for searches
+        self.pacer = None  # Spaces searches on self.client by its rate-limit headers
         self.config = None
-        self.tweet_data_list = []
+        self.saved_count = 0  # How many entries of tweet_data_list are already in storage
         self.load_config()
+        # Push the filter spec (default: [Filter] in config.ini) into the query;
+        # whatever search cannot express is checked on each page
+        self.filters = filters or FilterSpec.from_config(self.config)
+        self.search = self.filters.compile(query)
+        self.query = self.search.query
+        # Compact records; past [Storage] max_in_memory they are spilled to a temp file
+        self.tweet_data_list = RecordBuffer(TweetRecord, self.config.getint(
+            'Storage', 'max_in_memory', fallback=DEFAULT_MAX_IN_MEMORY))
+        self.storage = open_storage(self.output_file, self.config)
+        self.seen = SeenIndex(self.output_file)
+        # Drops (or flags) tweets repeating an earlier text with other links/mentions
+        self.near_dups = NearDuplicateIndex.from_config(self.output_file, self.config)
+        self.backup = BackupManager.from_config(self.output_file, self.config)
+        # Full-text index kept up to date page by page when [Index] auto_update is on
+        self.index = SearchIndex.from_config(self.config)
+        # Cookies that passed the authentication test recently are trusted without it
+        self.auth_cache = AuthCache.from_config(self.config)
+        self.auth_test_skipped = False
         
     def load_config(self):
         """Load configuration from config.ini file"""
@@ -70,11 +116,23 @@ class TwitterScraper:
         
         logger.info(f"Created {CONFIG_FILE} template. Please fill in your credentials.")
 
-    async def initialize_client(self):
-        """Initialize and authenticate the Twitter client"""
+    def make_client(self):
+        """Create an unauthenticated Twitter client"""
         # Use a more common user agent to avoid detection
         user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        self.client = Client(language='en-US', user_agent=user_agent)
+        return Client(language='en-US', user_agent=user_agent, **client_kwargs(self.config))
+
+    async def initialize_client(self):
+        """Initialize and authenticate the Twitter client"""
+        # With several accounts in config.ini, spread searches over all of them
+        if len(account_sections(self.config)) > 1:
+            self.pool = await ClientPool.from_config(self.config, self.make_client, self.login)
+            self.client = self.pool.accounts[0].client
+            return
+
+        self.client = self.make_client()
+        self.pacer = Pacer.from_config(self.config)
+        self.pacer.attach(self.client)
         
         # Try to load existing cookies first
         if os.path.exists(COOKIES_FILE):
@@ -82,44 +140,62 @@ class TwitterScraper:
                 self.client.load_cookies(COOKIES_FILE)
                 logger.info("Loaded existing cookies")
                 
+                if self.auth_cache.is_valid(COOKIES_FILE):
+                    logger.info("Cookies passed the authentication test recently, skipping it")
+                    self.auth_test_skipped = True
+                    return
+                
                 # Test if cookies are still valid
                 await self.test_authentication()
+                self.auth_test_skipped = False
+                self.auth_cache.mark_valid(COOKIES_FILE)
                 return
                 
             except Exception as e:
                 logger.warning(f"Failed to load cookies or cookies expired: {e}")
                 # Remove invalid cookies file
+                self.auth_cache.invalidate(COOKIES_FILE)
                 os.remove(COOKIES_FILE)
         
         # If no valid cookies, perform fresh login
         await self.login()
+        self.auth_test_skipped = False
+        self.auth_cache.mark_valid(COOKIES_FILE)
     
     async def test_authentication(self):
         """Test if current authentication is valid"""
         try:
-            # Try a simple operation to test auth
-            await self.client.search_tweet(QUERY, 'Latest', count=1)
+            # A cached page would pass with expired cookies
+            with bypass_cache():
+                if self.query.strip():
+                    # Try a simple operation to test auth
+                    await self.client.search_tweet(self.query, 'Latest', count=1)
+                else:
+                    # Nothing to search for (e.g. conversation.py with seed IDs only);
+                    # the account settings lookup needs valid cookies as well
+                    await self.client.user_id()
             logger.info("Authentication test successful")
         except (Unauthorized, BadRequest) as e:
             logger.error(f"Authentication test failed: {e}")
             raise
     
-    async def login(self):
+    async def login(self, client=None, section='X', cookies_file=COOKIES_FILE):
         """Perform login with retry logic"""
-        username = self.config['X']['username']
-        email = self.config['X']['email']
-        password = self.config['X']['password']
+        client = client or self.client
+        username = self.config[section]['username']
+        email = self.config[section]['email']
+        password = self.config[section]['password']
         
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 logger.info(f"Attempting login (attempt {attempt + 1}/{max_retries})")
                 
-                await self.client.login(
+                await client.login(
                     auth_info_1=username,
                     auth_info_2=email,
                     password=password,
-                    cookies_file=COOKIES_FILE
+                    cookies_file=cookies_file
                 )
                 
                 logger.info("Login successful! Cookies saved.")
@@ -143,6 +219,7 @@ class TwitterScraper:
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 30  # Exponential backoff
                     logger.info(f"Waiting {wait_time} seconds before retry...")
+                    METRICS.sleep(wait_time, 'login')
                     await asyncio.sleep(wait_time)
                 else:
                     raise
@@ -151,39 +228,87 @@ class TwitterScraper:
                 logger.error(f"Unexpected login error: {e}")
                 if attempt == max_retries - 1:
                     raise
+                METRICS.sleep(30, 'login')
                 await asyncio.sleep(30)
 
-    async def get_tweets_batch(self, tweets=None):
-        """Get a batch of tweets with proper error handling"""
+    @METRICS.timed('get_tweets_batch_seconds')
+    async def get_tweets_batch(self, tweets=None, cursor=None, query=None, product=None):
+        """Get a batch of tweets with proper error handling.
+
+        When tweets is None the search starts from cursor (a saved checkpoint)
+        or from the first page if cursor is None. query and product default
+        to the scraper's own.
+        """
+        query = query or self.query
+        product = product or self.product
+        account = None
         try:
-            if tweets is None:
-                logger.info("Searching for initial tweets...")
-                tweets = await self.client.search_tweet(QUERY, 'Top', count=20)
-            else:
-                # Random delay between requests
-                wait_time = uniform(5, 15)
-                logger.info(f"Getting next batch after {wait_time:.1f} seconds...")
-                await asyncio.sleep(wait_time)
-                tweets = await tweets.next()
+            if self.budget is not None:
+                await self.budget.acquire()
+
+            if self.pool is not None:
+                # Any account can continue the search from the page cursor
+                if tweets is not None:
+                    cursor = tweets.next_cursor
+                account = await self.pool.acquire()
+                await account.pacer.wait()
+                METRICS.inc('requests_total', endpoint='SearchTimeline')
+                with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+                    return await account.client.search_tweet(query, product, count=20, cursor=cursor)
+
+            if self.pacer is None:
+                # Client was passed in rather than created by initialize_client
+                self.pacer = Pacer.from_config(self.config)
+                self.pacer.attach(self.client)
+
+            # Wait for the next slot the remaining quota allows
+            await self.pacer.wait()
+
+            METRICS.inc('requests_total', endpoint='SearchTimeline')
+            with METRICS.timer('request_seconds', endpoint='SearchTimeline'):
+                if tweets is None:
+                    if cursor:
+                        logger.info("Resuming search from saved cursor...")
+                    else:
+                        logger.info("Searching for initial tweets...")
+                    tweets = await self.client.search_tweet(query, product, count=20, cursor=cursor)
+                else:
+                    logger.info("Getting next batch...")
+                    tweets = await tweets.next()
             
             return tweets
             
         except TooManyRequests as e:
+            METRICS.inc('rate_limited_total', endpoint='SearchTimeline')
+            if account is not None:
+                # Move on to the next account with quota instead of sleeping
+                self.pool.mark_rate_limited(account, e.rate_limit_reset)
+                return await self.get_tweets_batch(None, cursor, query, product)
+
             rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
-            current_time = datetime.now()
-            wait_time = (rate_limit_reset - current_time).total_seconds()
-            
-            logger.warning(f"Rate limit reached. Waiting until {rate_limit_reset} ({wait_time:.0f} seconds)")
-            await asyncio.sleep(max(wait_time + 10, 60))  # Add buffer time
+            logger.warning(f"Rate limit reached. Pausing until {rate_limit_reset}")
+            # The pacer holds the retry until the reset (plus a buffer)
+            self.pacer.rate_limited(e.rate_limit_reset + 10)
             
             # Retry the request
-            return await self.get_tweets_batch(tweets)
+            return await self.get_tweets_batch(tweets, cursor, query, product)
+            
+        except Unauthorized as e:
+            if account is not None or not self.auth_test_skipped:
+                raise
+            # The cached validation was wrong (e.g. cookies revoked elsewhere):
+            # test the cookies properly, logging in again if they fail
+            logger.error(f"Unauthorized with cookies trusted from the auth cache: {e}")
+            self.auth_cache.invalidate(COOKIES_FILE)
+            await self.initialize_client()
+            return await self.get_tweets_batch(None, tweets.next_cursor if tweets is not None else cursor,
+                                               query, product)
             
         except BadRequest as e:
             if "authorization" in str(e).lower():
                 logger.error("Authorization error. Re-authenticating...")
                 await self.initialize_client()
-                return await self.get_tweets_batch(tweets)
+                return await self.get_tweets_batch(tweets, cursor, query, product)
             else:
                 logger.error(f"Bad request error: {e}")
                 raise
@@ -192,147 +317,257 @@ class TwitterScraper:
             logger.error(f"Unexpected error getting tweets: {e}")
             raise
 
-    def extract_tweet_data(self, tweet):
-        """Extract minimal data from a tweet object for LLM tone analysis"""
+    @METRICS.timed('extract_seconds')
+    def extract_tweet_data(self, tweet, entities=None):
+        """Extract minimal data from a tweet object for LLM tone analysis.
+
+        entities are the tweet's TweetEntities when the caller extracted
+        them for the whole page.
+        """
         try:
             # Only extract what's needed for tone analysis
-            tweet_data = {
-                'username': getattr(tweet.user, 'name', '') if hasattr(tweet, 'user') else '',
-                'text': getattr(tweet, 'text', ''),
-                'likes': getattr(tweet, 'favorite_count', 0)
-            }
+            username = getattr(tweet.user, 'name', '') if getattr(tweet, 'user', None) is not None else ''
+            text = getattr(tweet, 'text', '')
             
             # Skip tweets without text or username
-            if not tweet_data['text'] or not tweet_data['username']:
+            if not text or not username:
                 return None
             
-            return tweet_data
+            entities = entities or extract_entities(tweet)
+            return TweetRecord(username, text, getattr(tweet, 'favorite_count', 0), entities.hashtags,
+                               entities.mentions, entities.urls, entities.has_media)
             
         except Exception as e:
             logger.error(f"Error extracting tweet data: {e}")
             return None
 
-    # Remove helper methods that are no longer needed
-    # (hashtags, mentions, urls extraction methods removed since we only need username, text, likes)
+    @METRICS.timed('save_seconds')
+    def save_data(self, final=False):
+        """Append unsaved tweets to storage; on the final save also export the output file"""
+        pending = as_dicts(self.tweet_data_list.iter_from(self.saved_count))
+        if pending:
+            self.storage.append(pending)
+            self.saved_count = len(self.tweet_data_list)
+            logger.info(f"Appended {len(pending)} tweets to {self.storage.path}")
 
-    def save_data(self):
-        """Save collected data to JSON file"""
-        # Load existing data if file exists
-        existing_data = []
-        if os.path.exists(OUTPUT_FILE):
-            try:
-                with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                logger.info(f"Loaded {len(existing_data)} existing tweets")
-            except Exception as e:
-                logger.error(f"Error loading existing data: {e}")
-        
-        # Combine with new data
-        all_data = existing_data + self.tweet_data_list
-        
-        # Remove duplicates based on text content (since we don't have tweet ID anymore)
-        seen_texts = set()
-        unique_data = []
-        for tweet in all_data:
-            text = tweet.get('text', '')
-            if text and text not in seen_texts:
-                seen_texts.add(text)
-                unique_data.append(tweet)
-        
-        # Save to file
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(unique_data, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"Saved {len(unique_data)} unique tweets to {OUTPUT_FILE}")
-        
-        # Also create a backup
-        backup_file = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{OUTPUT_FILE}"
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(unique_data, f, indent=2, ensure_ascii=False)
+        # Only persist seen IDs once their tweets have been handed to storage
+        self.seen.commit()
+        self.near_dups.commit()
+        if self.index is not None:
+            self.index.update_storage(self.output_file, self.storage)
+
+        if not final:
+            # Long runs get an incremental backup every [Backup] interval seconds
+            self.backup.maybe_backup(self.storage)
+            return
+
+        self.storage.flush()
+
+        # Compact the append log into the JSON file. Duplicates never reach
+        # the log because tweets are filtered by ID through the seen index.
+        count = export_json(self.storage, self.output_file)
+        logger.info(f"Saved {count} unique tweets to {self.output_file}")
+
+        # Back up only what was appended since the last backup
+        self.backup.backup(self.storage)
+
+    async def scrape_tweets(self, resume=False):
+        """Main scraping function.
 
-    async def scrape_tweets(self):
-        """Main scraping function"""
+        Returns the number of tweets collected (counting those of the resumed
+        checkpoint), which is below minimum_tweets if the search ran out.
+        Raises the last error after MAX_CONSECUTIVE_ERRORS failed pages.
+        """
+        checkpoint = CrawlCheckpoint(self.query, self.product)
         try:
-            await self.initialize_client()
+            if self.client is None and self.pool is None:
+                await self.initialize_client()
             
             tweet_count = 0
             tweets = None
+            cursor = None
+            last_tweet_id = None
             consecutive_errors = 0
-            max_consecutive_errors = 5
             
-            logger.info(f"Starting to scrape tweets with query: '{QUERY}'")
-            logger.info(f"Target: {MINIMUM_TWEETS} tweets")
+            if resume:
+                saved = checkpoint.load()
+                if saved and saved['cursor']:
+                    cursor = saved['cursor']
+                    tweet_count = saved['tweet_count']
+                    last_tweet_id = saved['last_tweet_id']
+                    logger.info(f"Resuming from checkpoint saved at {saved['updated_at']} ({tweet_count} tweets)")
+                else:
+                    logger.info("No checkpoint found, starting from the first page")
+            
+            logger.info(f"Starting to scrape tweets with query: '{self.query}'")
+            logger.info(f"Target: {self.minimum_tweets} tweets")
             
-            while tweet_count < MINIMUM_TWEETS:
+            while tweet_count < self.minimum_tweets:
                 try:
-                    tweets = await self.get_tweets_batch(tweets)
+                    tweets = await self.get_tweets_batch(tweets, cursor)
                     
                     if not tweets:
                         logger.warning("No more tweets found")
+                        checkpoint.clear()
                         break
                     
                     batch_count = 0
-                    for tweet in tweets:
-                        tweet_data = self.extract_tweet_data(tweet)
+                    # Skip tweets already collected by this or an earlier run and
+                    # tweets failing the filter's local predicates, then
+                    # near-duplicates of collected ones
+                    new_tweets = self.near_dups.filter_new(self.search.filter(self.seen.filter_new(tweets)))
+                    for tweet, entities in zip(new_tweets, extract_page(new_tweets)):
+                        last_tweet_id = tweet.id
+                        tweet_data = self.extract_tweet_data(tweet, entities)
                         if tweet_data:
                             self.tweet_data_list.append(tweet_data)
                             tweet_count += 1
                             batch_count += 1
                     
-                    logger.info(f"Collected {batch_count} tweets (Total: {tweet_count}/{MINIMUM_TWEETS})")
+                    METRICS.inc('tweets_total', batch_count)
+                    logger.info(f"Collected {batch_count} tweets (Total: {tweet_count}/{self.minimum_tweets})")
                     
                     # Reset consecutive errors on success
                     consecutive_errors = 0
                     
-                    # Save data periodically
-                    if tweet_count % 50 == 0:
-                        self.save_data()
-                        logger.info(f"Intermediate save completed at {tweet_count} tweets")
+                    # Appending is cheap, so save every page before checkpointing
+                    # its cursor; a resumed crawl then never skips unsaved tweets
+                    self.save_data()
+                    checkpoint.save(tweets.next_cursor, tweet_count, last_tweet_id)
                     
                 except Exception as e:
                     consecutive_errors += 1
                     logger.error(f"Error in batch processing (attempt {consecutive_errors}): {e}")
                     
-                    if consecutive_errors >= max_consecutive_errors:
+                    if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
                         logger.error("Too many consecutive errors. Stopping.")
-                        break
+                        raise
                     
                     # Wait before retrying
                     wait_time = min(60 * consecutive_errors, 300)  # Max 5 minutes
                     logger.info(f"Waiting {wait_time} seconds before retry...")
+                    METRICS.sleep(wait_time, 'backoff')
                     await asyncio.sleep(wait_time)
             
             # Final save
-            self.save_data()
+            self.save_data(final=True)
             
             logger.info(f"Scraping completed! Collected {tweet_count} tweets.")
-            logger.info(f"Data saved to {OUTPUT_FILE}")
+            logger.info(f"Data saved to {self.output_file}")
+            return tweet_count
             
         except Exception as e:
             logger.error(f"Fatal error in scraping: {e}")
             # Save whatever data we have
             if self.tweet_data_list:
-                self.save_data()
+                self.save_data(final=True)
                 logger.info("Saved partial data before exit")
             raise
+        finally:
+            checkpoint.close()
+
+    async def iter_tweets(self, query=None, limit=None, filters=None, product=None, prefetch=DEFAULT_PREFETCH):
+        """Yield TweetRecords of a search as its pages arrive.
 
-async def main():
+        query and filters default to the scraper's own; product too. A
+        background task fetches pages through get_tweets_batch (pacing,
+        rate limits, re-authentication) and retries failed ones like
+        scrape_tweets. It stays at most prefetch pages ahead, so a slow
+        consumer pauses pagination. Nothing is written to storage or the
+        seen index.
+        """
+        if query is None and filters is None:
+            search = self.search
+        else:
+            search = (filters or self.filters).compile(query or self.query)
+        if self.client is None and self.pool is None:
+            await self.initialize_client()
+
+        pages = asyncio.Queue(maxsize=max(1, prefetch))
+
+        async def fetch_pages():
+            tweets = None
+            consecutive_errors = 0
+            try:
+                while True:
+                    try:
+                        tweets = await self.get_tweets_batch(tweets, query=search.query, product=product)
+                    except Exception as e:
+                        consecutive_errors += 1
+                        if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                            raise
+                        wait_time = min(60 * consecutive_errors, 300)
+                        logger.error(f"Error fetching page (attempt {consecutive_errors}), "
+                                     f"retrying in {wait_time} seconds: {e}")
+                        METRICS.sleep(wait_time, 'backoff')
+                        await asyncio.sleep(wait_time)
+                        continue
+                    consecutive_errors = 0
+                    await pages.put(tweets)
+                    if not tweets:
+                        return
+            except Exception as e:
+                await pages.put(e)
+
+        fetcher = asyncio.create_task(fetch_pages())
+        yielded = 0
+        seen_ids = set()  # Consecutive pages can overlap
+        try:
+            while limit is None or yielded < limit:
+                tweets = await pages.get()
+                if isinstance(tweets, Exception):
+                    raise tweets
+                if not tweets:
+                    break
+                new_tweets = [tweet for tweet in tweets if tweet.id not in seen_ids]
+                seen_ids.update(tweet.id for tweet in new_tweets)
+                new_tweets = search.filter(new_tweets)
+                records = [record for record in map(self.extract_tweet_data, new_tweets, extract_page(new_tweets))
+                           if record is not None]
+                METRICS.inc('tweets_total', len(records))
+                for record in records[:None if limit is None else limit - yielded]:
+                    yield record
+                    yielded += 1
+        finally:
+            fetcher.cancel()
+            await asyncio.gather(fetcher, return_exceptions=True)
+
+    def close(self):
+        """Close the storage log, the dedup indexes and the record buffer"""
+        self.storage.close()
+        self.seen.close()
+        self.near_dups.close()
+        self.tweet_data_list.close()
+        if self.index is not None:
+            self.index.close()
+
+async def main(resume=False):
     """Main function"""
     scraper = TwitterScraper()
+    # Writes [Metrics] export_file every interval seconds while the crawl runs
+    exporter = MetricsExporter.from_config(scraper.config).start()
     
     try:
-        await scraper.scrape_tweets()
+        await scraper.scrape_tweets(resume=resume)
     except KeyboardInterrupt:
         logger.info("Scraping interrupted by user")
         if scraper.tweet_data_list:
-            scraper.save_data()
+            scraper.save_data(final=True)
             logger.info("Saved data before exit")
     except Exception as e:
         logger.error(f"Scraping failed: {e}")
         return 1
+    finally:
+        scraper.close()
+        logger.info(exporter.stop())
     
     return 0
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape tweets matching QUERY")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue from the cursor saved in tweet_progress.db")
+    args = parser.parse_args()
+
     # Run the async main function
-    exit_code = asyncio.run(main())
\ No newline at end of file
+    exit_code = asyncio.run(main(resume=args.resume))
\ No newline at end of file
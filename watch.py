@@ -0,0 +1,179 @@
+"""Continuous watch mode: poll a search for tweets newer than the last one seen.
+
+Each poll searches the Latest tab with a since_id: operator and pages only
+until it reaches tweets it already has. The wait between polls adapts to how
+many new tweets the previous poll found: busy queries are polled more
+often, quiet ones back off towards max_interval.
+
+Used by ``python main.py --watch`` and ``python trendingscrap.py --watch``.
+"""
+import logging
+import time
+from datetime import datetime
+
+from twikit import TooManyRequests
+
+from progress import WatchState
+from http_transport import bypass_cache
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when config.ini has no [Watch] section
+DEFAULT_MIN_INTERVAL = 30
+DEFAULT_MAX_INTERVAL = 900
+DEFAULT_TARGET_PER_POLL = 20
+DEFAULT_MAX_PAGES = 5
+# How far one poll can move the interval either way
+MAX_STEP = 2.0
+
+
+class AdaptiveInterval:
+    """Seconds to wait before the next poll, from how many tweets the last one found.
+
+    The interval is scaled so that a poll returns about target_per_poll
+    tweets (one page), within [min_interval, max_interval].
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 target_per_poll=DEFAULT_TARGET_PER_POLL):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.target_per_poll = target_per_poll
+        self.current = min_interval
+
+    def next(self, new_count, truncated=False):
+        if truncated:
+            # The poll hit its page limit, so tweets are arriving faster than we read them
+            self.current = self.min_interval
+        elif new_count == 0:
+            self.current *= MAX_STEP
+        else:
+            self.current *= min(max(self.target_per_poll / new_count, 1 / MAX_STEP), MAX_STEP)
+        self.current = min(max(self.current, self.min_interval), self.max_interval)
+        return self.current
+
+
+class SincePoller:
+    """Fetches the tweets of a query newer than the last poll, newest first"""
+
+    def __init__(self, client, query, pacer, max_pages=DEFAULT_MAX_PAGES):
+        self.client = client
+        self.query = query
+        self.pacer = pacer
+        self.max_pages = max_pages
+        self.state = WatchState(query)
+        saved = self.state.load()
+        self.since_id = int(saved['since_id']) if saved and saved['since_id'] else None
+        self.tweet_count = saved['tweet_count'] if saved else 0
+        self.pending_since_id = self.since_id
+        self.truncated = False
+
+    def search_query(self):
+        if self.since_id is None:
+            return self.query
+        return f'{self.query} since_id:{self.since_id}'
+
+    def poll(self):
+        """Tweets newer than since_id. The first poll of a new watch returns one page"""
+        query = self.search_query()
+        new_tweets = []
+        tweets = None
+        self.truncated = False
+        for page in range(self.max_pages):
+            self.pacer.wait_sync()
+            METRICS.inc('requests_total', endpoint='SearchTimeline')
+            # Polls must see tweets posted since the last one, never a cached page
+            with METRICS.timer('request_seconds', endpoint='SearchTimeline'), bypass_cache():
+                if tweets is None:
+                    tweets = self.client.search_tweet(query, product='Latest')
+                else:
+                    tweets = tweets.next()
+            if not tweets:
+                break
+            fresh = [tweet for tweet in tweets if self.since_id is None or int(tweet.id) > self.since_id]
+            new_tweets.extend(fresh)
+            # Stop at the first page reaching tweets we have (or after the
+            # first page when there is nothing to catch up with)
+            if self.since_id is None or len(fresh) < len(tweets):
+                break
+        else:
+            self.truncated = True
+            logger.warning(f"Poll for '{self.query}' stopped after {self.max_pages} pages; "
+                           f"older new tweets were skipped")
+
+        if new_tweets:
+            self.pending_since_id = max(int(tweet.id) for tweet in new_tweets)
+        return new_tweets
+
+    def commit(self, new_count):
+        """Remember the newest polled tweet once the poll's tweets have been emitted"""
+        self.since_id = self.pending_since_id
+        self.tweet_count += new_count
+        self.state.save(self.since_id, self.tweet_count)
+
+    def close(self):
+        self.state.close()
+
+
+class Watcher:
+    """Runs a poll -> emit -> wait loop until interrupted"""
+
+    def __init__(self, poller, interval):
+        self.poller = poller
+        self.interval = interval
+
+    @classmethod
+    def from_config(cls, client, query, pacer, config):
+        """Watcher for query, configured by the [Watch] section of config.ini"""
+        poller = SincePoller(client, query, pacer,
+                             max_pages=config.getint('Watch', 'max_pages', fallback=DEFAULT_MAX_PAGES))
+        interval = AdaptiveInterval(
+            min_interval=config.getfloat('Watch', 'min_interval', fallback=DEFAULT_MIN_INTERVAL),
+            max_interval=config.getfloat('Watch', 'max_interval', fallback=DEFAULT_MAX_INTERVAL),
+            target_per_poll=config.getint('Watch', 'target_per_poll', fallback=DEFAULT_TARGET_PER_POLL),
+        )
+        return cls(poller, interval)
+
+    def run(self, emit, max_polls=None):
+        """Poll forever (or max_polls times), passing each poll's new tweets to emit.
+
+        emit(tweets) must write the tweets to the output before returning;
+        only then is the poll's newest ID saved. A failed poll is logged and
+        retried after a longer wait; only Ctrl+C stops the loop. Returns the
+        number of polls made.
+        """
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                try:
+                    tweets = self.poller.poll()
+                except TooManyRequests as e:
+                    METRICS.inc('rate_limited_total', endpoint='SearchTimeline')
+                    logger.warning(f"Rate limit reached. Waiting until {datetime.fromtimestamp(e.rate_limit_reset)}")
+                    # The next poll's pacer wait holds it until the reset
+                    self.poller.pacer.rate_limited(e.rate_limit_reset)
+                    continue
+                except Exception as e:
+                    # A network error or a bad page must not end an unattended
+                    # watch: back off as after an empty poll and try again
+                    polls += 1
+                    wait_time = self.interval.next(0)
+                    logger.error(f"Poll for '{self.poller.query}' failed, retrying in {wait_time:.0f}s: {e}")
+                else:
+                    polls += 1
+
+                    if tweets:
+                        emit(tweets)
+                    self.poller.commit(len(tweets))
+
+                    wait_time = self.interval.next(len(tweets), self.poller.truncated)
+                    logger.info(f"{len(tweets)} new tweets for '{self.poller.query}', next poll in {wait_time:.0f}s")
+                if max_polls is None or polls < max_polls:
+                    METRICS.sleep(wait_time, 'watch')
+                    time.sleep(wait_time)
+        except KeyboardInterrupt:
+            logger.info("Watch stopped")
+        finally:
+            self.poller.close()
+        return polls